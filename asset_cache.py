@@ -0,0 +1,92 @@
+import json
+import os
+import tempfile
+
+import numpy as np
+import pygame
+
+
+CACHE_VERSION = 1 # Bump when the cached format (or the way assets are normalised) changes, so old entries are ignored
+METADATA_KEYS = ('Area', 'Radial profile', 'Radial extent', 'Core radius') # Normalised attributes stored alongside the pixels
+
+
+def cache_key(digest: str, normalisation: tuple) -> str:
+    """
+    Returns the name of a cache entry.
+
+    Parameters:
+        digest (str): Content hash of the source image (see assets.file_hash)
+        normalisation (tuple(2)): (card_radius, symbols_per_card) the image was normalised to
+
+    Returns:
+        key (str): Name of the entry's files, without extension
+    """
+    card_radius, symbols_per_card = normalisation
+    return f"{digest}-r{card_radius}-s{symbols_per_card}-v{CACHE_VERSION}"
+
+def load_normalised(folder: str, key: str):
+    """
+    Loads a normalised surface from the cache. The pixels are memory-mapped, and the Surface is built directly on top
+    of them, so nothing is decoded or copied.
+
+    Parameters:
+        folder (str): Cache folder
+        key (str): Name of the entry, see cache_key
+
+    Returns:
+        (surf, pixels, metadata) (tuple(Surface, ndarray, dict)): The surface, the memory-mapped RGBA pixels it is built on
+            (keep a reference for as long as the surface is used) and the attributes in METADATA_KEYS. None if not cached
+    """
+    path = os.path.join(folder, key)
+    if not (os.path.exists(f"{path}.npy") and os.path.exists(f"{path}.json")):
+        return None
+
+    with open(f"{path}.json", 'r') as f:
+        metadata = json.load(f)
+    pixels = np.load(f"{path}.npy", mmap_mode='r') # Shape (height, width, 4)
+    surf = pygame.image.frombuffer(pixels, (pixels.shape[1], pixels.shape[0]), 'RGBA')
+    return surf, pixels, metadata
+
+def save_normalised(folder: str, key: str, surf: pygame.Surface, metadata: dict) -> None:
+    """
+    Stores a normalised surface (as raw RGBA pixels, so it can be memory-mapped) and its attributes in the cache.
+    Written via temporary files, so a crash never leaves a half written entry. Each call has its own temporary files, so worker
+    processes can store the same entry at once. A file being replaced is never truncated, so a worker still loading it is unaffected.
+    Nothing is written if the entry is already stored, as entries never change.
+
+    Parameters:
+        folder (str): Cache folder
+        key (str): Name of the entry, see cache_key
+        surf (Surface): Normalised surface. A colorkey is stored as alpha
+        metadata (dict): Asset attributes, the ones in METADATA_KEYS are stored
+    """
+    path = os.path.join(folder, key)
+    if os.path.exists(f"{path}.npy") and os.path.exists(f"{path}.json"):
+        return # Already stored, e.g. by another worker
+    os.makedirs(folder, exist_ok=True) # Another worker may make it first
+
+    width, height = surf.get_size()
+    pixels = np.frombuffer(pygame.image.tostring(surf, 'RGBA'), dtype=np.uint8).reshape(height, width, 4)
+
+    write_replacing(f"{path}.npy", 'wb', lambda f: np.save(f, pixels))
+    write_replacing(f"{path}.json", 'w', lambda f: json.dump({k: metadata[k] for k in METADATA_KEYS}, f)) # Written last, an entry only counts once both files exist
+
+def write_replacing(path: str, mode: str, write) -> None:
+    """
+    Writes a file to a temporary file of its own in the same folder, then moves it into place. The temporary file is
+    removed if writing fails.
+
+    Parameters:
+        path (str): Path of the file to write
+        mode (str): Mode to open the temporary file in, 'w' or 'wb'
+        write (function): Writes the contents to the open file it is passed
+    """
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=f"{os.path.basename(path)}.", suffix='.tmp')
+    try:
+        with os.fdopen(fd, mode) as f:
+            write(f)
+        os.replace(temp_path, path)
+    except Exception:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
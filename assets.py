@@ -1,9 +1,17 @@
+import hashlib
 import math
 import os
 
+import numpy as np
 import pygame
 from pygame.transform import scale
 
+from asset_cache import cache_key, load_normalised, save_normalised
+
+
+RADIAL_BINS = 64 # Number of directions in a radial profile
+RADIAL_BIN_ANGLES = [-math.pi + (i + 0.5) * 2*math.pi/RADIAL_BINS for i in range(RADIAL_BINS)] # Centre angle of each direction (radians, screen coordinates)
+
 
 ####################
 # Helper functions #
@@ -68,6 +76,105 @@ def scale_img(surf, size):
     return surf_scaled
 
 
+def file_hash(file_path):
+    """
+    Returns a hash of the contents of a file
+
+    Parameters:
+        file_path (str): Path to the file
+
+    Returns:
+        digest (str): SHA-1 hex digest of the file contents
+    """
+    with open(file_path, 'rb') as f:
+        digest = hashlib.sha1(f.read()).hexdigest()
+    return digest
+
+def asset_hash(asset):
+    """
+    Returns the content hash of the file an asset was loaded from. Only hashed once per asset
+
+    Parameters:
+        asset (dict): A single asset (image) from an Assets instance
+
+    Returns:
+        digest (str): SHA-1 hex digest of the asset's file
+    """
+    if 'Hash' not in asset:
+        asset['Hash'] = file_hash(asset['File path'])
+    return asset['Hash']
+
+def opaque_pixels(surf):
+    """
+    Returns which pixels of a Surface are opaque, the same way pygame.mask.from_surface decides it
+    (colorkey if the Surface has one, otherwise an alpha value above 127)
+
+    Parameters:
+        surf (Surface): Surface to measure
+
+    Returns:
+        opaque (ndarray): Boolean array indexed [x, y], True where the pixel is opaque
+    """
+    if surf.get_colorkey() is not None:
+        opaque = pygame.surfarray.array_colorkey(surf) > 127
+    else:
+        opaque = pygame.surfarray.array_alpha(surf) > 127
+    return opaque
+
+def opaque_area(surf):
+    """
+    Returns the number of opaque pixels of a Surface (same as the pixel count of its mask)
+
+    Parameters:
+        surf (Surface): Surface to measure
+
+    Returns:
+        area (int): Number of opaque pixels
+    """
+    area = int(np.count_nonzero(opaque_pixels(surf)))
+    return area
+
+def radial_profile(surf):
+    """
+    Returns the distance from the centre of a Surface to its farthest opaque pixel, in each of RADIAL_BINS directions.
+    Rotating the Surface about its centre just shifts the directions, and scaling it scales the distances.
+
+    Parameters:
+        surf (Surface): Surface to measure
+
+    Returns:
+        profile (ndarray): Farthest opaque distance (pixels) for each direction in RADIAL_BIN_ANGLES. 0 if no opaque pixels
+    """
+    width, height = surf.get_size()
+    xs, ys = np.nonzero(opaque_pixels(surf)) # Opaque pixels (array is indexed [x, y])
+    dx = xs + 0.5 - width/2 # Pixel centres, relative to the centre of the surface
+    dy = ys + 0.5 - height/2
+    r = np.hypot(dx, dy) + math.sqrt(0.5) # Distance to the far corner of each pixel
+    bins = np.floor((np.arctan2(dy, dx) + math.pi) / (2*math.pi) * RADIAL_BINS).astype(int) % RADIAL_BINS
+
+    profile = np.zeros(RADIAL_BINS)
+    np.maximum.at(profile, bins, r)
+    return profile
+
+def core_radius(surf):
+    """
+    Returns the radius of the largest circle around the centre of a Surface that is completely opaque.
+
+    Parameters:
+        surf (Surface): Surface to measure
+
+    Returns:
+        radius (float): Radius of the opaque core in pixels (0 if the centre is not opaque)
+    """
+    width, height = surf.get_size()
+    xs, ys = np.nonzero(~opaque_pixels(surf)) # Transparent pixels (array is indexed [x, y])
+    radius = min(width, height) / 2 # Can't be opaque past the edge of the surface
+    if len(xs) > 0:
+        r = np.hypot(xs + 0.5 - width/2, ys + 0.5 - height/2) - math.sqrt(0.5) # Distance to the near corner of each pixel
+        radius = min(radius, float(r.min()))
+    return max(radius, 0.0)
+
+
 ###########
 # Classes #
 ###########
@@ -76,40 +183,54 @@ class Assets():
     """
     A class to represent assets of the pygame app.
 
+    Only the file names are read up front (to index the assets by name). Each image is decoded, and normalised if
+    normalise_images has been called, the first time it is used, so a run only pays for the symbols it needs.
+    With a cache folder, normalised images are stored on disk and memory-mapped on later runs instead (see asset_cache).
+
     Attributes:
         directory (str): Directory of source images
-        images (list(dict)): Stores all image surfaces, along with other attributes
+        cache_folder (str): Folder of the on-disk cache of normalised images. None if not cached
+        names (list(str)): Names of all assets in the directory, in the order they were listed
+        images (list(dict)): All image surfaces, along with other attributes (e.g. 'Area', 'Radial profile', 'Radial extent' and 'Core radius' once normalised).
+            Loads every asset that has not been loaded yet
     
     Methods:
         normalise_images -> None: Normalises the size of all image surfaces depending on the card size and number of symbols per card
+        prefetch -> None: Loads (and normalises) the named assets now, rather than on first use
         get_asset_from_name
+        get_file_path_from_name
     """
 
-    def __init__(self, directory_rel: str) -> None:
+    def __init__(self, directory_rel: str, cache_folder=None) -> None:
         """
-        Constructor for Assets class.
+        Constructor for Assets class. Indexes the assets by name, without loading any images.
 
         Parameters:
             directory_rel (str): Relative path to folder containing images. Default = "Images"
+            cache_folder (str): Folder to keep normalised images in between runs. If None, they are normalised every run
         """
         self.directory = abs_path(directory_rel) # Absolute path to folder
-
-        # Gather file titles, paths and generate surfaces
-        filenames = os.listdir(self.directory)
-        self.images = []
-        for fn in filenames:
-            file_path = os.path.join(self.directory, fn)
-            file = {
-                'Name': fn.split('.')[0], 
-                'File path': file_path,
-                'Surface': pygame.image.load(file_path),
-                'Is Normalised?': False
-            }
-            self.images.append(file)
+        self.cache_folder = cache_folder
+        self.normalisation = None # (card_radius, symbols_per_card) that loaded images are normalised to, once set by normalise_images
+
+        # Index file paths by name. If two files have the same name (e.g. different extensions), the first one listed is used
+        self._file_paths = {}
+        for fn in os.listdir(self.directory):
+            self._file_paths.setdefault(fn.split('.')[0], os.path.join(self.directory, fn))
+        self.names = list(self._file_paths)
+        self._assets = {} # Loaded assets. Key = name, Value = asset dict
+
+    @property
+    def images(self) -> list:
+        """
+        Returns every asset, in the same order as self.names. Loads any that haven't been loaded yet
+        """
+        return self.get_assets_from_name(self.names)
 
     def normalise_images(self, card_radius: int, symbols_per_card: int) -> None:
         """
         Normalises the area of each image Surface, so they all originally have an equal share of the window. Maintains ratio.
+        Assets already loaded are normalised now, the rest as they are loaded.
 
         Notes:
         ------
@@ -123,32 +244,86 @@ class Assets():
             radius (int): Radius of a single card in pixels.
             symbols_per_card (int): Number of symbols per card
         """
+        self.normalisation = (card_radius, symbols_per_card)
+        for asset in self._assets.values():
+            self._normalise(asset)
 
+    def _normalise(self, asset: dict) -> None:
+        """
+        Normalises a single asset to self.normalisation, see normalise_images
+        """
+        card_radius, symbols_per_card = self.normalisation
         new_area = (2 * card_radius)**2 * (1/symbols_per_card) # Target new area for each image
-        
-        for idx, i in enumerate(self.images):
-            # "Old" image attributes
-            old_surf = i['Surface']
-            old_width = old_surf.get_width()
-            old_height = old_surf.get_height()
-            old_area = old_width * old_height
 
-            scale_factor = math.sqrt(new_area / old_area) # Scale factor for current image
+        # "Old" image attributes
+        old_surf = asset['Surface']
+        old_width = old_surf.get_width()
+        old_height = old_surf.get_height()
+        old_area = old_width * old_height
+
+        scale_factor = math.sqrt(new_area / old_area) # Scale factor for current image
 
-            # New attributes
-            new_width = math.floor(old_width * scale_factor)
-            new_height = math.floor(old_height * scale_factor)
+        # New attributes
+        new_width = math.floor(old_width * scale_factor)
+        new_height = math.floor(old_height * scale_factor)
 
-            new_surf = scale_img(old_surf, (int(new_width), int(new_height)))
-            
-            # Replace surface and set "is normalised" to True for current image
-            self.images[idx]['Surface'] = new_surf
-            self.images[idx]['Is Normalised?'] = True
+        new_surf = scale_img(old_surf, (int(new_width), int(new_height)))
+        
+        # Replace surface and set "is normalised" to True for current image
+        asset['Surface'] = new_surf
+        asset['Area'] = opaque_area(new_surf) # Symbols scale this, rather than counting their own pixels
+        profile = radial_profile(new_surf) # Used to check if a symbol is outside the card without its mask
+        asset['Radial profile'] = profile.tolist()
+        asset['Radial extent'] = float(profile.max()) # Distance to the farthest opaque pixel in any direction
+        asset['Core radius'] = core_radius(new_surf) # Radius of the completely opaque circle at the centre
+        asset['Is Normalised?'] = True
+
+    def _load(self, name: str) -> dict:
+        """
+        Decodes a single asset's image (and normalises it, if normalise_images has been called).
+        A normalised image is taken from the cache if it is there, and stored in it if not
+        """
+        file_path = self._file_paths[name]
+        asset = {
+            'Name': name,
+            'File path': file_path,
+            'Is Normalised?': False
+        }
+
+        key = None
+        if self.cache_folder is not None and self.normalisation is not None:
+            key = cache_key(asset_hash(asset), self.normalisation)
+            cached = load_normalised(self.cache_folder, key)
+            if cached is not None:
+                surf, pixels, metadata = cached
+                asset.update(metadata)
+                asset['Surface'] = surf
+                asset['Pixels'] = pixels # The surface is built on these memory-mapped pixels, so keep them alive
+                asset['Is Normalised?'] = True
+                self._assets[name] = asset
+                return asset
 
+        asset['Surface'] = pygame.image.load(file_path)
+        if self.normalisation is not None:
+            self._normalise(asset)
+            if key is not None:
+                save_normalised(self.cache_folder, key, asset['Surface'], asset)
+        self._assets[name] = asset
+        return asset
+
+    def prefetch(self, names: list[str]) -> None:
+        """
+        Loads (and normalises) the named assets now, e.g. all symbols of the cards about to be generated.
+        Names that are already loaded are skipped.
+
+        Parameters:
+            names (List(str)): Values of the asset dict 'name' attribute
+        """
+        self.get_assets_from_name(names)
 
     def get_asset_from_name(self, name: str) -> dict:
         """
-        Return the specific asset dict based on name of it
+        Return the specific asset dict based on name of it. Loads it first, if it hasn't been loaded yet
 
         Parameters:
             name (str): Value of the asset dict 'name' attribute
@@ -157,15 +332,31 @@ class Assets():
             asset (dict): Target asset dict 
             Raise Exception if does not exist 
         """
+        asset = self._assets.get(name)
+        if asset is not None:
+            return asset
 
-        asset = None
-        for a in self.images:
-            if a['Name'] == name:
-                asset = a
-                return asset
+        if name in self._file_paths:
+            return self._load(name)
         
         raise Exception(f"{name} does not exist in this Assets instance.")
 
+    def get_file_path_from_name(self, name: str) -> str:
+        """
+        Return the file path of an asset based on name of it, without loading it
+
+        Parameters:
+            name (str): Value of the asset dict 'name' attribute
+
+        Returns:
+            file_path (str): Path to the asset's image file
+            Raise Exception if does not exist 
+        """
+        if name in self._file_paths:
+            return self._file_paths[name]
+
+        raise Exception(f"{name} does not exist in this Assets instance.")
+
     def get_assets_from_name(self, names: list[str]) -> list[dict]:
         """
         Return a list of the specific asset dicts based on names supplied
@@ -180,4 +371,4 @@ class Assets():
         assets = []
         for n in names:
             assets.append(self.get_asset_from_name(n))
-        return assets
\ No newline at end of file
+        return assets
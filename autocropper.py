@@ -1,27 +1,36 @@
+import json
+import multiprocessing
 import os
 from PIL import Image
 
-from assets import abs_path
+from assets import abs_path, file_hash
+
+MANIFEST_FOLDER_NAME = 'cache' # Manifests are kept out of the target directory, as everything in there is loaded as a symbol
+MANIFEST_VERSION = 1 # Bump when the manifest format changes, so old manifests are ignored
+MIN_FILES_FOR_POOL = 4 # Fewer files than this are cropped in this process, as starting workers would take longer
 
 class AutoCropper:
     """
     Autocrop all images in supplied directory to content (i.e. no blank space around any image)
 
+    Keeps a manifest of the content hash and bounding box of every source file, so only new or changed files are
+    cropped (in parallel), and crops whose source file has gone are removed.
+
     Attributes:
         source_directory (str): Directory of source files
         target_directory (str): Directory of cropped files
         filenames (List(str)): Filenames of source files
         source_filepaths(List(str)): Filepaths of source files
-    
+
     Methods:
-        crop -> None: Crops all source files and outputs to target directory.
+        crop -> dict: Crops new and changed source files and outputs to target directory.
 
     """
 
     def __init__(self, source_directory_rel: str) -> None:
         """
         Constructor for AutoCropper class.
-        
+
         Parameters:
             directory_rel (str): Relative path to source directory
         """
@@ -30,24 +39,120 @@ class AutoCropper:
         self.filenames = os.listdir(self.source_directory) # List of filenames
         self.source_filepaths = [os.path.join(self.source_directory, fn) for fn in self.filenames] # List of filepaths
 
-    def crop(self, target_diretory_rel: str) -> None:
+    def crop(self, target_diretory_rel: str, manifest_path=None, workers=None) -> dict:
         """
-        Crop all images and outputs to chosen target directory
+        Crop new and changed images and outputs to chosen target directory. Crops whose source file no longer exists are deleted.
+
+        A source file is unchanged if its size and modification time match the manifest, or failing that its content hash does.
 
         Parameters:
             target_directory_rel (str): Relative target directory folder name.
+            manifest_path (str): Path to the manifest of source hashes and bounding boxes.
+                If None, cache/crop_manifest_<target folder name>.json
+            workers (int): Number of worker processes to crop with. If None, one per CPU
+
+        Returns:
+            counts (dict): Number of files 'Cropped', 'Unchanged' and 'Removed'
         """
         self.target_directory = abs_path(target_diretory_rel)
+        if manifest_path is None:
+            manifest_name = f"crop_manifest_{os.path.basename(os.path.normpath(self.target_directory))}.json"
+            manifest_path = abs_path(os.path.join(MANIFEST_FOLDER_NAME, manifest_name))
 
         # Create directory if does not exist
         if not os.path.exists(self.target_directory):
             os.makedirs(self.target_directory)
 
-        # Iterate over all files
+        manifest = load_manifest(manifest_path)
+
+        # Work out which files are new or have changed
+        jobs = [] # (source path, target path)
+        new_manifest = {}
         for fn, fp in zip(self.filenames, self.source_filepaths):
             target_path = os.path.join(self.target_directory, fn)
-            if not os.path.exists(target_path):
-                image = Image.open(fp) # Load source image
-                imageBox = image.getbbox() # Get box around content
-                cropped = image.crop(imageBox) # Crop to content
-                cropped.save(target_path) # Output cropped image to target directory
\ No newline at end of file
+            stat = os.stat(fp)
+            entry = manifest.get(fn)
+            if entry is not None and os.path.exists(target_path):
+                if entry['Size'] == stat.st_size and entry['Modified'] == stat.st_mtime_ns:
+                    new_manifest[fn] = entry
+                    continue
+                digest = file_hash(fp)
+                if entry['Hash'] == digest:
+                    new_manifest[fn] = {**entry, 'Size': stat.st_size, 'Modified': stat.st_mtime_ns} # Touched, but not changed
+                    continue
+            jobs.append((fp, target_path))
+            new_manifest[fn] = {'Hash': None, 'Box': None, 'Size': stat.st_size, 'Modified': stat.st_mtime_ns}
+
+        # Crop them, over a pool of workers if there are enough of them
+        if workers is None:
+            workers = os.cpu_count() or 1
+        if workers > 1 and len(jobs) >= MIN_FILES_FOR_POOL:
+            with multiprocessing.get_context('spawn').Pool(min(workers, len(jobs))) as pool:
+                results = pool.map(crop_file, jobs)
+                pool.close()
+                pool.join()
+        else:
+            results = [crop_file(job) for job in jobs]
+
+        for (fp, _), (digest, box) in zip(jobs, results):
+            fn = os.path.basename(fp)
+            new_manifest[fn]['Hash'] = digest
+            new_manifest[fn]['Box'] = box
+
+        # Remove crops whose source file has gone
+        removed = 0
+        source_filenames = set(self.filenames)
+        for fn in os.listdir(self.target_directory):
+            if fn not in source_filenames:
+                os.remove(os.path.join(self.target_directory, fn))
+                removed += 1
+
+        save_manifest(manifest_path, new_manifest)
+
+        return {'Cropped': len(jobs), 'Unchanged': len(self.filenames) - len(jobs), 'Removed': removed}
+
+
+def crop_file(job: tuple) -> tuple:
+    """
+    Crops a single image to its content. Runs in worker processes, so only takes and returns plain values.
+
+    Parameters:
+        job (tuple(2)): (source path, target path)
+
+    Returns:
+        (digest, box) (tuple(str, list)): Content hash of the source file, and the box it was cropped to (left, upper, right, lower).
+            Box is None if the image has no content
+    """
+    source_path, target_path = job
+    digest = file_hash(source_path)
+    image = Image.open(source_path) # Load source image
+    imageBox = image.getbbox() # Get box around content
+    cropped = image.crop(imageBox) # Crop to content
+    cropped.save(target_path) # Output cropped image to target directory
+    return digest, None if imageBox is None else list(imageBox)
+
+def load_manifest(manifest_path: str) -> dict:
+    """
+    Returns the files of a crop manifest. Key = source filename, Value = 'Hash', 'Box', 'Size' and 'Modified' (ns).
+    Empty if there is no manifest (or it is from an older version)
+    """
+    if not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path, 'r') as f:
+        manifest = json.load(f)
+    if manifest.get('Version') != MANIFEST_VERSION:
+        return {}
+    return manifest['Files']
+
+def save_manifest(manifest_path: str, files: dict) -> None:
+    """
+    Writes a crop manifest (via a temporary file, so a crash never leaves a half written manifest)
+    """
+    directory = os.path.dirname(manifest_path)
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+
+    temp_path = f"{manifest_path}.tmp"
+    with open(temp_path, 'w') as f:
+        json.dump({'Version': MANIFEST_VERSION, 'Files': files}, f, separators=(',', ':'))
+    os.replace(temp_path, manifest_path)
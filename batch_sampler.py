@@ -0,0 +1,128 @@
+import math
+
+import numpy as np
+
+from assets import RADIAL_BIN_ANGLES, RADIAL_BINS
+from symbol import BOUNDARY_MARGIN
+import transform_cache
+from transform_cache import SCALE_STEP
+
+
+BATCH_SIZE = 2000 # Number of layouts sampled at once
+
+# Same as Card.regenerate_card_v2
+SIZE_SCALE_BOUNDS = np.array([
+    (0.65, 0.7), # Big
+    (0.55, 0.65), # Medium
+    (0.40, 0.55), # Small
+])
+R_BOUNDARY = 0.5 # Boundary between "inner" and "outer" rim, as fraction of total radius of card
+
+
+def sample_layouts(rng: np.random.Generator, no_layouts: int, symbols_per_card: int, radius: int) -> dict:
+    """
+    Samples many v2 style layouts at once (see Card.regenerate_card_v2), as arrays.
+
+    - At least 1 big, medium and small symbol per layout
+    - 1 or 2 symbols on the inner rim, the rest on the outer rim, spread around their rim with noise on the polar angle
+    - Random scale (within the size's bounds) and rotation for each symbol
+
+    Parameters:
+        rng (Generator): NumPy random generator
+        no_layouts (int): Number of layouts to sample
+        symbols_per_card (int): Number of symbols per card
+        radius (int): Radius of the card in pixels
+
+    Returns:
+        layouts (dict): 'Pos x', 'Pos y' (int), 'Angle' (int, degrees) and 'Scale' arrays, each of shape (no_layouts, symbols_per_card).
+            Angles and scales are already quantised like Symbol does
+    """
+    n, k = no_layouts, symbols_per_card
+
+    # Sizes: 0 = big, 1 = medium, 2 = small. At least 1 of each, the rest random, then shuffled
+    sizes = np.concatenate([np.tile([0, 1, 2], (n, 1)), rng.integers(0, 3, size=(n, k - 3))], axis=1)
+    sizes = np.take_along_axis(sizes, rng.permuted(np.tile(np.arange(k), (n, 1)), axis=1), axis=1)
+
+    # Rims: 1 or 2 symbols on the inside rim, shuffled
+    no_inside = rng.integers(1, 3, size=n)
+    order = rng.permuted(np.tile(np.arange(k), (n, 1)), axis=1) # Random order of symbols around the rims
+    is_inside = order < no_inside[:, None]
+    no_in_rim = np.where(is_inside, no_inside[:, None], k - no_inside[:, None])
+    counter = np.where(is_inside, order + 1, order - no_inside[:, None] + 1) # Position of each symbol within its rim
+
+    # Radii within each rim's bounds
+    r_low = np.where(is_inside, 0.0, radius*R_BOUNDARY)
+    r_high = np.where(is_inside, radius*R_BOUNDARY, 0.9*radius)
+    r = np.floor(r_low + rng.random((n, k)) * (r_high - r_low + 1))
+
+    # Home polar angles, plus noise of up to a quarter of the gap between symbols in a rim
+    theta = 360 * counter / no_in_rim
+    noise_boundary = np.floor(90 / no_in_rim)
+    theta = theta + np.floor(-noise_boundary + rng.random((n, k)) * (2*noise_boundary + 1))
+
+    pos_x = np.round(radius + r*np.cos(np.radians(theta))).astype(int)
+    pos_y = np.round(radius + r*np.sin(np.radians(theta))).astype(int)
+
+    # Scales within each size's bounds, and angles. Quantised the same way as Symbol
+    bounds = SIZE_SCALE_BOUNDS[sizes]
+    scale = bounds[..., 0] + rng.random((n, k)) * (bounds[..., 1] - bounds[..., 0])
+    scale = np.maximum(1, np.round(scale / SCALE_STEP)) * SCALE_STEP
+    angle_step = transform_cache.ANGLE_STEP # Looked up when called, so it can be changed at run time
+    angle = (np.round(rng.integers(0, 361, size=(n, k)) / angle_step) * angle_step).astype(int) % 360
+
+    return {'Pos x': pos_x, 'Pos y': pos_y, 'Angle': angle, 'Scale': scale}
+
+
+def screen_layouts(layouts: dict, assets_for_card: list, centre: tuple, boundary_radius: float,
+                   card_radius: int, cover_threshold: float) -> np.ndarray:
+    """
+    Rejects the layouts that can't be valid, using only geometry, so only the rest need checking with masks.
+    Never rejects a layout that would pass the mask checks.
+
+    - Not enough cover (exact, as symbol areas are worked out analytically)
+    - A symbol obviously outside the card (radial profile, see Symbol.boundary_status)
+    - Two symbols whose completely opaque cores overlap
+
+    Parameters:
+        layouts (dict): Layouts from sample_layouts
+        assets_for_card (list(dict)): Asset of each symbol, in the same order as the layouts' columns
+        centre (tuple(2)): Centre of the card circle (of card_outer)
+        boundary_radius (float): Radius of the card circle
+        card_radius (int): Radius of the card, for the cover ratio
+        cover_threshold (float): Minimum fraction of the card that must be covered by symbols
+
+    Returns:
+        survivors (ndarray): Boolean array of shape (no_layouts,), True where a layout might be valid
+    """
+    scale = layouts['Scale']
+    area = np.array([a['Area'] for a in assets_for_card])
+    profile = np.array([a['Radial profile'] for a in assets_for_card]) # Shape (symbols_per_card, RADIAL_BINS)
+    core = np.array([a['Core radius'] for a in assets_for_card])
+
+    # Cover
+    cover = (area * scale**2).sum(axis=1) / (math.pi * card_radius**2)
+    survivors = cover >= cover_threshold
+
+    # Obviously outside the card
+    dx = layouts['Pos x'] - centre[0]
+    dy = layouts['Pos y'] - centre[1]
+    d = np.hypot(dx, dy)
+    psi = np.arctan2(dy, dx)
+    angle = np.radians(layouts['Angle'])
+    bin_width = 2*math.pi / RADIAL_BINS
+    idx = np.floor((psi + angle + math.pi) / bin_width).astype(int) % RADIAL_BINS
+    rho = np.maximum(scale * profile[np.arange(scale.shape[1]), idx] - BOUNDARY_MARGIN, 0) # Farthest pixel in the direction pointing away from the centre
+    phi = np.array(RADIAL_BIN_ANGLES)[idx] - angle
+    delta = np.abs((phi - psi + math.pi) % (2*math.pi) - math.pi) + bin_width/2
+    dist_sq = d*d + rho*rho + 2*d*rho*np.cos(np.minimum(delta, math.pi))
+    is_outside = (rho > 0) & (dist_sq > (boundary_radius + BOUNDARY_MARGIN)**2)
+    survivors &= ~is_outside.any(axis=1)
+
+    # Overlapping opaque cores
+    core_r = np.maximum(scale*core - BOUNDARY_MARGIN, 0)
+    i, j = np.triu_indices(scale.shape[1], k=1)
+    pair_d = np.hypot(layouts['Pos x'][:, i] - layouts['Pos x'][:, j], layouts['Pos y'][:, i] - layouts['Pos y'][:, j])
+    cores_overlap = (core_r[:, i] > 0) & (core_r[:, j] > 0) & (pair_d < core_r[:, i] + core_r[:, j])
+    survivors &= ~cores_overlap.any(axis=1)
+
+    return survivors
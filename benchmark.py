@@ -0,0 +1,473 @@
+"""
+Benchmark suite for the generation pipeline. Times each stage separately with fixed seeds, on the bundled images
+and template, and on a synthetic library of many symbols. Results are written to JSON, so runs on different commits
+can be compared.
+
+Run with:
+    python benchmark.py
+    python benchmark.py --output results.json --compare cache/benchmarks/<older commit>.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pygame
+
+from assets import Assets, abs_path, make_path
+from autocropper import AutoCropper
+from card import Card
+from engine import STRATEGIES, generate_card
+from gobble import CARD_RADIUS, CACHE_FOLDER_NAME, INPUT_FOLDER_NAME, OUTPUT_FOLDER, SYMBOLS_PER_CARD, load_assets, load_template, read_template
+from gobble_to_pdf import gobble_to_pdf
+from projective_plane import projective_plane
+import symbol
+from symbol import Symbol, TRANSFORM_CACHE
+
+
+SEED = 0
+REPEATS = 5 # Times each stage is repeated (a full crop and the pdf are only run once). The min, median, mean and max are reported
+NO_LAYOUTS = 200 # Random layouts for the Symbol construction, calc_collisions and card_ratio_cover stages
+NO_WARM_LAYOUTS = 50 # Layouts rebuilt with a warm cache. Few enough that all their symbols fit in the transform cache at once
+NO_TEMPLATE_CARDS = 6 # Template cards to time end-to-end with each strategy
+NO_SYNTHETIC_SYMBOLS = 300 # Symbols in the synthetic library
+NO_SYNTHETIC_CARDS = 3 # Random cards of synthetic symbols to time end-to-end
+SYNTHETIC_STRATEGIES = ('partial',) # Strategies to time end-to-end on the synthetic library. v2 takes about a minute per card
+NO_LOOKUPS = 1000 # Cards worth of symbols to look up by name
+NO_STARTUP_CARDS = 2 # Cards to load the assets for, when timing the startup of a small regeneration
+PLANE_ORDERS = (7, 31) # Orders of the projective planes to time generating templates for (7 = the bundled deck size)
+RESULTS_FOLDER = make_path(CACHE_FOLDER_NAME, 'benchmarks')
+SLOWER_THRESHOLD = 1.2 # A stage is flagged in a comparison if its median is this many times slower than the baseline
+
+
+##################
+# Timing helpers #
+##################
+
+def measure(func, repeats: int = REPEATS, setup=None) -> dict:
+    """
+    Times a function several times.
+
+    Parameters:
+        func (function): Function to time. Called with the result of setup, if there is a setup
+        repeats (int): Number of times to call func
+        setup (function): Called (untimed) before every call of func
+
+    Returns:
+        stats (dict): 'Repeats', and the 'Min', 'Median', 'Mean' and 'Max' seconds
+    """
+    seconds = []
+    for _ in range(repeats):
+        args = () if setup is None else (setup(),)
+        start = time.perf_counter()
+        func(*args)
+        seconds.append(time.perf_counter() - start)
+    return summarise(seconds)
+
+def summarise(seconds: list) -> dict:
+    """
+    Returns the number, min, median, mean and max of a list of timings
+    """
+    return {
+        'Repeats': len(seconds),
+        'Min': min(seconds),
+        'Median': statistics.median(seconds),
+        'Mean': statistics.mean(seconds),
+        'Max': max(seconds),
+    }
+
+def run_stage(stages: dict, name: str, func) -> None:
+    """
+    Runs a single benchmark stage and stores its result. A stage that fails is recorded with its error, rather than
+    stopping the rest of the suite.
+
+    Parameters:
+        stages (dict): Results so far. Key = stage name, Value = result dict
+        name (str): Name of the stage
+        func (function): Runs the stage and returns its result dict (see measure)
+    """
+    print(f"{name}...", end=' ', flush=True)
+    try:
+        stages[name] = func()
+        print(f"median {stages[name]['Median']:.4f} s")
+    except Exception as e:
+        stages[name] = {'Error': f"{type(e).__name__}: {e}"}
+        print(f"failed ({stages[name]['Error']})")
+
+
+##########
+# Stages #
+##########
+
+def bench_autocrop(source_folder: str, is_unchanged: bool) -> dict:
+    """
+    Crops every image of a folder into a new, empty folder (so nothing is skipped), or re-runs the cropper on a folder
+    that is already up to date (so everything is skipped)
+    """
+    temp_folders = []
+
+    def setup():
+        temp_folders.append(tempfile.mkdtemp())
+        target, manifest = os.path.join(temp_folders[-1], 'cropped'), os.path.join(temp_folders[-1], 'manifest.json')
+        if is_unchanged:
+            AutoCropper(source_folder).crop(target, manifest)
+        return target, manifest
+
+    try:
+        stats = measure(lambda args: AutoCropper(source_folder).crop(*args), repeats=REPEATS if is_unchanged else 1, setup=setup)
+    finally:
+        for folder in temp_folders:
+            shutil.rmtree(folder, ignore_errors=True)
+    stats['Items'] = len(os.listdir(abs_path(source_folder)))
+    return stats
+
+def bench_assets_load(folder: str) -> dict:
+    """
+    Indexes a folder into an Assets instance, and loads every image
+    """
+    stats = measure(lambda: Assets(folder).images)
+    stats['Items'] = len(os.listdir(abs_path(folder)))
+    return stats
+
+def bench_normalise(folder: str) -> dict:
+    """
+    Normalises every image of a freshly loaded Assets instance
+    """
+    def setup():
+        assets = Assets(folder)
+        assets.prefetch(assets.names)
+        return assets
+
+    stats = measure(lambda assets: assets.normalise_images(CARD_RADIUS, SYMBOLS_PER_CARD), setup=setup)
+    stats['Items'] = len(os.listdir(abs_path(folder)))
+    return stats
+
+def bench_startup(folder: str, cards: list, is_cache_warm: bool) -> dict:
+    """
+    Loads the assets needed for a few cards only (see gobble.load_assets), with an empty or a full on-disk asset cache
+    """
+    names = list(dict.fromkeys(name for card in cards for name in card))
+    cache_folder = tempfile.mkdtemp()
+
+    def setup():
+        shutil.rmtree(cache_folder, ignore_errors=True)
+        if is_cache_warm:
+            load_assets(folder, prefetch=names, cache_folder=cache_folder)
+
+    try:
+        stats = measure(lambda _: load_assets(folder, prefetch=names, cache_folder=cache_folder), setup=setup)
+    finally:
+        shutil.rmtree(cache_folder, ignore_errors=True)
+    stats['Items'] = len(names)
+    return stats
+
+def bench_cold_start(card_nos: list) -> dict:
+    """
+    Starts a fresh interpreter that imports gobble, then loads the template and assets for a few cards, as a small
+    regeneration does before its first card is searched. The on-disk template and asset caches are warm
+    """
+    script = f"import gobble; template = gobble.load_template({card_nos!r}); gobble.load_assets(prefetch=[n for ns in template.values() for n in ns])"
+    stats = measure(lambda: subprocess.run([sys.executable, '-c', script], cwd=abs_path(''), capture_output=True, check=True))
+    stats['Items'] = len(card_nos)
+    return stats
+
+def bench_read_template(is_cached: bool) -> dict:
+    """
+    Reads the bundled template, parsing the xlsx every time, or from a warm template cache (see template_cache)
+    """
+    if not is_cached:
+        return measure(lambda: read_template(cache_path=None))
+
+    cache_folder = tempfile.mkdtemp()
+    try:
+        cache_path = os.path.join(cache_folder, 'template.pickle')
+        read_template(cache_path=cache_path)
+        return measure(lambda: read_template(cache_path=cache_path))
+    finally:
+        shutil.rmtree(cache_folder, ignore_errors=True)
+
+def bench_lookups(assets: Assets) -> dict:
+    """
+    Looks up a card's worth of symbols by name, NO_LOOKUPS times
+    """
+    rng = random.Random(SEED)
+    names = assets.names
+    cards = [rng.sample(names, SYMBOLS_PER_CARD) for _ in range(NO_LOOKUPS)]
+    stats = measure(lambda: [assets.get_assets_from_name(c) for c in cards])
+    stats['Items'] = NO_LOOKUPS * SYMBOLS_PER_CARD
+    return stats
+
+def bench_plane(order: int) -> dict:
+    """
+    Generates the projective plane of a given order, as used for a generated template (see gobble.generate_template)
+    """
+    stats = measure(lambda: projective_plane(order))
+    stats['Items'] = order**2 + order + 1
+    return stats
+
+def make_layouts(assets: Assets, no_layouts: int) -> list:
+    """
+    Returns random cards of assets, each with a random v2 layout
+    """
+    random.seed(SEED)
+    names = assets.names
+    cards = []
+    for _ in range(no_layouts):
+        sprites = [Symbol(a) for a in assets.get_assets_from_name(random.sample(names, SYMBOLS_PER_CARD))]
+        card = Card(sprites, radius=CARD_RADIUS, symbols_per_card=SYMBOLS_PER_CARD)
+        card.regenerate_card_v2()
+        cards.append(card)
+    return cards
+
+def bench_symbol_construction(cards: list, is_cache_cold: bool) -> dict:
+    """
+    Rebuilds every symbol of the cards at its position, angle and scale, and transforms it at full resolution.
+    A cold cache has to transform every symbol, a warm one already holds every transformed symbol
+    """
+    params = [(s.asset, s.rect.centerx, s.rect.centery, s.angle, s.scale) for card in cards for s in card]
+
+    def setup():
+        TRANSFORM_CACHE.clear()
+        if not is_cache_cold:
+            for p in params:
+                Symbol(*p).mask
+
+    stats = measure(lambda _: [Symbol(*p).mask for p in params], setup=setup)
+    stats['Items'] = len(params)
+    return stats
+
+def bench_coarse_masks(cards: list) -> dict:
+    """
+    Rebuilds every symbol of the cards with a cold cache, and only makes its coarse mask (see Symbol.might_overlap)
+    """
+    params = [(s.asset, s.rect.centerx, s.rect.centery, s.angle, s.scale) for card in cards for s in card]
+    stats = measure(lambda _: [Symbol(*p).coarse_mask for p in params], setup=TRANSFORM_CACHE.clear)
+    stats['Items'] = len(params)
+    return stats
+
+def bench_collisions(cards: list, mode: str) -> dict:
+    """
+    Calculates collisions of every card
+    """
+    stats = measure(lambda: [card.calc_collisions(mode=mode) for card in cards])
+    stats['Items'] = len(cards)
+    stats['Cards with collisions'] = sum(card.has_collisions() for card in cards)
+    return stats
+
+def bench_cover(cards: list) -> dict:
+    """
+    Calculates the cover of every card
+    """
+    stats = measure(lambda: [card.card_ratio_cover() for card in cards])
+    stats['Items'] = len(cards)
+    return stats
+
+def bench_time_to_valid(assets: Assets, card_outer: Symbol, cards: list, strategy: str, mask_pyramid=True) -> dict:
+    """
+    Searches for a valid layout of every card, each seeded from SEED and its position in the list, from a cold
+    transform cache. With the mask pyramid off, every symbol is transformed at full resolution (see symbol.MASK_PYRAMID)
+    """
+    seconds = []
+    attempts = []
+    TRANSFORM_CACHE.clear()
+    symbol.MASK_PYRAMID = mask_pyramid
+    try:
+        for idx, symbol_names in enumerate(cards):
+            random.seed(f"{SEED}-{idx}")
+            start = time.perf_counter()
+            _, no_attempts = generate_card(assets, card_outer, symbol_names, CARD_RADIUS, SYMBOLS_PER_CARD, strategy=strategy)
+            seconds.append(time.perf_counter() - start)
+            attempts.append(no_attempts)
+    finally:
+        symbol.MASK_PYRAMID = True
+
+    stats = summarise(seconds)
+    stats['Items'] = len(cards)
+    stats['Attempts'] = attempts
+    return stats
+
+def bench_pdf(card_folder: str, is_cache_warm: bool, stream=False) -> dict:
+    """
+    Builds the printable pdf from a folder of card images, with none or all of the images already prepared for printing.
+    With stream, each page is written as it is made (see gobble_to_pdf)
+    """
+    output_folder = tempfile.mkdtemp()
+    cache_folder = tempfile.mkdtemp()
+
+    def setup():
+        shutil.rmtree(cache_folder, ignore_errors=True)
+        if is_cache_warm:
+            gobble_to_pdf(card_folder, output_folder, cache_folder=cache_folder)
+
+    try:
+        stats = measure(lambda _: gobble_to_pdf(card_folder, output_folder, cache_folder=cache_folder, stream=stream), repeats=1, setup=setup)
+        stats['Bytes'] = sum(os.path.getsize(os.path.join(output_folder, fn)) for fn in os.listdir(output_folder))
+    finally:
+        shutil.rmtree(output_folder, ignore_errors=True)
+        shutil.rmtree(cache_folder, ignore_errors=True)
+    stats['Items'] = len(os.listdir(abs_path(card_folder)))
+    return stats
+
+
+####################
+# Synthetic images #
+####################
+
+def make_synthetic_library(folder: str, no_symbols: int) -> None:
+    """
+    Draws random symbols (filled polygons and ellipses on a transparent background, with blank space around them)
+    and saves them as pngs.
+
+    Parameters:
+        folder (str): Folder to save the images to
+        no_symbols (int): Number of images to make
+    """
+    rng = np.random.default_rng(SEED)
+    for i in range(no_symbols):
+        width, height = rng.integers(200, 700, size=2)
+        surf = pygame.Surface((int(width), int(height)), pygame.SRCALPHA)
+        for _ in range(rng.integers(1, 4)):
+            colour = [int(c) for c in rng.integers(0, 256, size=3)] + [255]
+            if rng.random() < 0.5:
+                points = [(rng.uniform(0.1, 0.9)*width, rng.uniform(0.1, 0.9)*height) for _ in range(rng.integers(3, 8))]
+                pygame.draw.polygon(surf, colour, points)
+            else:
+                x, y = rng.uniform(0.1, 0.5)*width, rng.uniform(0.1, 0.5)*height
+                pygame.draw.ellipse(surf, colour, (x, y, rng.uniform(0.2, 0.4)*width, rng.uniform(0.2, 0.4)*height))
+        pygame.image.save(surf, os.path.join(folder, f"SYNTHETIC_{i:05d}.png"))
+
+
+#########
+# Suite #
+#########
+
+def bench_library(stages: dict, source_folder: str, cropped_folder: str, cards: list, strategies: tuple) -> None:
+    """
+    Runs every stage on a library of symbols.
+
+    Parameters:
+        stages (dict): Results are added to this
+        source_folder (str): Folder of uncropped images
+        cropped_folder (str): Folder of cropped images
+        cards (list(list(str))): Symbol names of the cards to time end-to-end. If None, random cards are used
+        strategies (tuple(str)): Strategies to time end-to-end
+    """
+    run_stage(stages, 'AutoCropper.crop', lambda: bench_autocrop(source_folder, is_unchanged=False))
+    run_stage(stages, 'AutoCropper.crop (unchanged)', lambda: bench_autocrop(source_folder, is_unchanged=True))
+    run_stage(stages, 'Assets', lambda: bench_assets_load(cropped_folder))
+    run_stage(stages, 'Assets.normalise_images', lambda: bench_normalise(cropped_folder))
+
+    assets, card_outer = load_assets(cropped_folder, cache_folder=None)
+    if cards is None:
+        rng = random.Random(SEED)
+        cards = [rng.sample(assets.names, SYMBOLS_PER_CARD) for _ in range(NO_SYNTHETIC_CARDS)]
+    run_stage(stages, f'load_assets ({NO_STARTUP_CARDS} cards, cold cache)', lambda: bench_startup(cropped_folder, cards[:NO_STARTUP_CARDS], is_cache_warm=False))
+    run_stage(stages, f'load_assets ({NO_STARTUP_CARDS} cards, warm cache)', lambda: bench_startup(cropped_folder, cards[:NO_STARTUP_CARDS], is_cache_warm=True))
+    run_stage(stages, 'Assets.get_assets_from_name', lambda: bench_lookups(assets))
+
+    layouts = make_layouts(assets, NO_LAYOUTS)
+    run_stage(stages, 'Symbol (cold cache)', lambda: bench_symbol_construction(layouts, is_cache_cold=True))
+    run_stage(stages, 'Symbol (warm cache)', lambda: bench_symbol_construction(layouts[:NO_WARM_LAYOUTS], is_cache_cold=False))
+    run_stage(stages, 'Symbol.coarse_mask (cold cache)', lambda: bench_coarse_masks(layouts))
+    run_stage(stages, 'Card.calc_collisions (full)', lambda: bench_collisions(layouts, 'full'))
+    run_stage(stages, 'Card.calc_collisions (any)', lambda: bench_collisions(layouts, 'any'))
+    run_stage(stages, 'Card.card_ratio_cover', lambda: bench_cover(layouts))
+
+    for strategy in strategies:
+        run_stage(stages, f'Time to valid card ({strategy})', lambda: bench_time_to_valid(assets, card_outer, cards, strategy))
+        run_stage(stages, f'Time to valid card ({strategy}, no mask pyramid)', lambda: bench_time_to_valid(assets, card_outer, cards, strategy, mask_pyramid=False))
+
+def git_commit() -> tuple:
+    """
+    Returns the current commit hash, and whether there are uncommitted changes. (None, None) outside of a git repo
+    """
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=abs_path(''), capture_output=True, text=True, check=True).stdout.strip()
+        status = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=abs_path(''), capture_output=True, text=True, check=True).stdout
+        return commit, len(status.strip()) > 0
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+
+def compare(results: dict, baseline: dict) -> None:
+    """
+    Prints how the median of every stage has changed since a baseline run
+    """
+    print(f"\nCompared with {baseline.get('Commit')} ({baseline.get('Created')}):")
+    for library, stages in results['Libraries'].items():
+        for name, stats in stages.items():
+            old = baseline.get('Libraries', {}).get(library, {}).get(name)
+            if old is None or 'Median' not in old or 'Median' not in stats:
+                continue
+            ratio = stats['Median'] / old['Median']
+            flag = '  <-- slower' if ratio > SLOWER_THRESHOLD else ''
+            print(f"{library:>9} {name:<35} {old['Median']:9.4f} s -> {stats['Median']:9.4f} s ({ratio:.2f}x){flag}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark each stage of the gobble generation pipeline.")
+    parser.add_argument('--output', help="JSON file to write the results to. Default = cache/benchmarks/<commit>.json")
+    parser.add_argument('--compare', help="JSON file of an earlier run to compare the results with")
+    parser.add_argument('--synthetic-symbols', type=int, default=NO_SYNTHETIC_SYMBOLS, help="Number of symbols in the synthetic library")
+    args = parser.parse_args()
+
+    commit, is_dirty = git_commit()
+    results = {
+        'Commit': commit,
+        'Dirty': is_dirty,
+        'Created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'Python': platform.python_version(),
+        'Platform': platform.platform(),
+        'Seed': SEED,
+        'Libraries': {'Template': {}, 'Synthetic': {}},
+    }
+
+    # Bundled images and template
+    print("Bundled images and template")
+    template = load_template()
+    cards = list(template.values())[:NO_TEMPLATE_CARDS]
+    stages = results['Libraries']['Template']
+    run_stage(stages, 'read_template (xlsx)', lambda: bench_read_template(is_cached=False))
+    run_stage(stages, 'read_template (cached)', lambda: bench_read_template(is_cached=True))
+    run_stage(stages, f'Cold start ({NO_STARTUP_CARDS} cards)', lambda: bench_cold_start(list(template)[:NO_STARTUP_CARDS]))
+    for order in PLANE_ORDERS:
+        run_stage(stages, f'projective_plane (order {order})', lambda: bench_plane(order))
+    bench_library(stages, INPUT_FOLDER_NAME, f'{INPUT_FOLDER_NAME}_cropped', cards, STRATEGIES)
+    run_stage(stages, 'gobble_to_pdf (cold cache)', lambda: bench_pdf(OUTPUT_FOLDER, is_cache_warm=False))
+    run_stage(stages, 'gobble_to_pdf (warm cache)', lambda: bench_pdf(OUTPUT_FOLDER, is_cache_warm=True))
+    run_stage(stages, 'gobble_to_pdf (warm cache, stream)', lambda: bench_pdf(OUTPUT_FOLDER, is_cache_warm=True, stream=True))
+
+    # Synthetic library, to see how each stage scales with the number of symbols
+    print(f"\nSynthetic library of {args.synthetic_symbols} symbols")
+    synthetic_folder = tempfile.mkdtemp()
+    try:
+        source_folder = os.path.join(synthetic_folder, 'images')
+        cropped_folder = os.path.join(synthetic_folder, 'images_cropped')
+        os.makedirs(source_folder)
+        make_synthetic_library(source_folder, args.synthetic_symbols)
+        AutoCropper(source_folder).crop(cropped_folder, os.path.join(synthetic_folder, 'crop_manifest.json'))
+        bench_library(results['Libraries']['Synthetic'], source_folder, cropped_folder, None, SYNTHETIC_STRATEGIES)
+    finally:
+        shutil.rmtree(synthetic_folder, ignore_errors=True)
+
+    # Save results
+    output = args.output or os.path.join(RESULTS_FOLDER, f"{commit or 'unknown'}.json")
+    if os.path.dirname(output) and not os.path.exists(os.path.dirname(output)):
+        os.makedirs(os.path.dirname(output))
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults written to {output}")
+
+    if args.compare is not None:
+        with open(args.compare, 'r') as f:
+            compare(results, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""
+Benchmarks Card.calc_collisions against the original implementation, on random layouts of the images_cropped symbols.
+
+Run with:
+    python benchmark_collisions.py
+"""
+import random
+import time
+
+import pygame
+from pygame.sprite import spritecollide, collide_mask
+
+from assets import Assets
+from symbol import Symbol
+from card import Card
+
+
+CARD_RADIUS = 500 # Same as gobble.py
+SYMBOLS_PER_CARD = 8 # Same as gobble.py
+NO_LAYOUTS = 2000 # Number of random layouts to time
+SEED = 0
+
+
+def legacy_calc_collisions(card: Card) -> dict:
+    """
+    The original Card.calc_collisions: rebuilds the group for every symbol and checks every ordered pair with collide_mask
+    """
+    card_copy = card.copy()
+    collisions = {}
+    for sprite in card:
+        card_copy.remove(sprite)
+        collisions[sprite] = spritecollide(sprite, card_copy, False, collide_mask)
+        card_copy = card.copy()
+    return collisions
+
+
+def make_layouts(assets: Assets, no_layouts: int) -> list:
+    """
+    Returns a list of cards with random symbols, each with a random v2 layout
+    """
+    names = assets.names
+    cards = []
+    for _ in range(no_layouts):
+        sprites = [Symbol(a) for a in assets.get_assets_from_name(random.sample(names, SYMBOLS_PER_CARD))]
+        card = Card(sprites, radius=CARD_RADIUS, symbols_per_card=SYMBOLS_PER_CARD)
+        card.regenerate_card_v2()
+        cards.append(card)
+    return cards
+
+
+def time_it(func, cards: list) -> tuple:
+    """
+    Returns the seconds taken to run func on every card, and the results
+    """
+    start = time.perf_counter()
+    results = [func(card) for card in cards]
+    return time.perf_counter() - start, results
+
+
+def main():
+    pygame.init()
+    random.seed(SEED)
+
+    assets = Assets('images_cropped')
+    assets.normalise_images(CARD_RADIUS, SYMBOLS_PER_CARD)
+    cards = make_layouts(assets, NO_LAYOUTS)
+
+    t_legacy, legacy = time_it(legacy_calc_collisions, cards)
+    t_full, full = time_it(lambda c: dict(c.calc_collisions(mode='full')), cards)
+    t_any, any_ = time_it(lambda c: c.calc_collisions(mode='any') and c.has_collisions(), cards)
+
+    # Make sure the new implementation agrees with the old one
+    for old, new, has_collisions in zip(legacy, full, any_):
+        for sprite, colliding in old.items():
+            if set(colliding) != set(new[sprite]):
+                raise Exception("Full collision report does not match the original implementation.")
+        if has_collisions != any(len(v) > 0 for v in old.values()):
+            raise Exception("'any' collision mode does not match the original implementation.")
+
+    no_colliding = sum(any_)
+    print(f"{NO_LAYOUTS} layouts, {no_colliding} with collisions")
+    print(f"Original:      {t_legacy:.3f} s ({1000*t_legacy/NO_LAYOUTS:.3f} ms per card)")
+    print(f"Full report:   {t_full:.3f} s ({1000*t_full/NO_LAYOUTS:.3f} ms per card, {t_legacy/t_full:.1f}x faster)")
+    print(f"Any collision: {t_any:.3f} s ({1000*t_any/NO_LAYOUTS:.3f} ms per card, {t_legacy/t_any:.1f}x faster)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,46 @@
+"""
+Benchmarks time-to-valid-card of each placement strategy (see engine.STRATEGIES), on the same random cards
+of images_cropped symbols with the same seeds.
+
+Run with:
+    python benchmark_strategies.py
+"""
+import random
+import statistics
+import time
+
+import pygame
+
+from engine import STRATEGIES, generate_card
+from gobble import CARD_RADIUS, SYMBOLS_PER_CARD, load_assets
+
+
+NO_CARDS = 12 # Number of random cards to generate with each strategy
+SEED = 0
+
+
+def main():
+    pygame.init()
+    random.seed(SEED)
+
+    assets, card_outer = load_assets()
+    names = assets.names
+    cards = [random.sample(names, SYMBOLS_PER_CARD) for _ in range(NO_CARDS)]
+
+    print(f"{NO_CARDS} cards per strategy")
+    for strategy in STRATEGIES:
+        seconds = []
+        attempts = []
+        for idx, symbol_names in enumerate(cards):
+            random.seed(f"{SEED}-{idx}")
+            start = time.perf_counter()
+            _, no_attempts = generate_card(assets, card_outer, symbol_names, CARD_RADIUS, SYMBOLS_PER_CARD, strategy=strategy)
+            seconds.append(time.perf_counter() - start)
+            attempts.append(no_attempts)
+
+        print(f"{strategy:>8}: time to valid card mean {statistics.mean(seconds):.3f} s, median {statistics.median(seconds):.3f} s, max {max(seconds):.3f} s. "
+              f"Attempts mean {statistics.mean(attempts):.0f}, median {statistics.median(attempts):.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+import json
+import os
+
+from assets import Assets, file_hash
+
+
+MANIFEST_VERSION = 1 # Bump when the manifest format changes, so old manifests are ignored (every card is then rebuilt)
+
+
+class BuildManifest():
+    """
+    An on-disk record of what each exported card was built from, so only the cards affected by an edit are rebuilt.
+
+    Each entry is keyed by card number, and records the card's row of the template (before replacements), the replacements
+    that applied to it, and the content hash of each of its symbol images. A card is up to date if its entry is unchanged
+    and its exported image still exists.
+
+    Attributes:
+        path (str): Path to the JSON file holding the manifest
+        cards (dict): Key = card number (str), Value = entry dict (see card_entry)
+
+    Methods:
+        is_up_to_date -> bool: Checks a card's entry against the one it was last built from
+        put -> None: Records the entry a card was built from
+        remove -> None: Drops a card's entry, so it is rebuilt next time
+        retain -> None: Drops the entries of cards that are no longer in the template
+        save -> None: Writes the manifest to disk
+    """
+
+    def __init__(self, path: str) -> None:
+        """
+        Constructor for BuildManifest class. Loads the manifest from disk if it exists.
+
+        Parameters:
+            path (str): Path to the JSON file holding the manifest
+        """
+        self.path = path
+        self.cards = {}
+        if os.path.exists(self.path):
+            with open(self.path, 'r') as f:
+                manifest = json.load(f)
+            if manifest.get('Version') == MANIFEST_VERSION:
+                self.cards = manifest['Cards']
+
+    def is_up_to_date(self, card_no: int, entry: dict, export_path: str) -> bool:
+        """
+        Checks if a card was last built from the same entry, and its exported image still exists.
+
+        Parameters:
+            card_no (int): Card number
+            entry (dict): What the card would be built from now (see card_entry)
+            export_path (str): Path to the card's exported image
+
+        Returns:
+            is_up_to_date (bool): True if the card does not need to be rebuilt
+        """
+        return self.cards.get(str(card_no)) == entry and os.path.exists(export_path)
+
+    def put(self, card_no: int, entry: dict) -> None:
+        """
+        Records the entry a card was built from, replacing any existing one.
+
+        Parameters:
+            card_no (int): Card number
+            entry (dict): What the card was built from (see card_entry)
+        """
+        self.cards[str(card_no)] = entry
+
+    def remove(self, card_no: int) -> None:
+        """
+        Drops a card's entry (if it has one), e.g. because its exported image could not be written.
+
+        Parameters:
+            card_no (int): Card number
+        """
+        self.cards.pop(str(card_no), None)
+
+    def retain(self, card_nos: list) -> None:
+        """
+        Drops the entries of all cards not in card_nos, e.g. rows that have been removed from the template.
+
+        Parameters:
+            card_nos (list(int)): Card numbers to keep
+        """
+        keep = {str(card_no) for card_no in card_nos}
+        self.cards = {k: v for k, v in self.cards.items() if k in keep}
+
+    def save(self) -> None:
+        """
+        Writes the manifest to disk (via a temporary file, so a crash never leaves a half written manifest)
+        """
+        directory = os.path.dirname(self.path)
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, 'w') as f:
+            json.dump({'Version': MANIFEST_VERSION, 'Cards': self.cards}, f, separators=(',', ':'))
+        os.replace(temp_path, self.path)
+
+
+def card_entry(template_row: list, replacement_dict: dict, assets: Assets, hashes=None) -> dict:
+    """
+    Returns what a card is built from, to compare against its manifest entry.
+
+    Parameters:
+        template_row (list(str)): The card's symbol names in the template, before replacements
+        replacement_dict (dict): Key = template symbol name, Value = our symbol name (from the 'Replacements' sheet)
+        assets (Assets): Symbol assets, only used to find each image's file (nothing is loaded)
+        hashes (dict): Key = file path, Value = content hash. Hashes already worked out, and any new ones are added to it.
+            Pass the same dict for every card of a run so each image is only hashed once. If None, nothing is shared
+
+    Returns:
+        entry (dict): 'Template row', 'Replacements' (only the ones used by this card, as [template name, our name] pairs)
+            and 'Hashes' (content hash of each symbol's image, in the same order as the template row, None if there is no image)
+    """
+    if hashes is None:
+        hashes = {}
+
+    symbol_names = [replacement_dict.get(name, name) for name in template_row]
+    symbol_hashes = []
+    for name in symbol_names:
+        try:
+            file_path = assets.get_file_path_from_name(name)
+        except Exception:
+            symbol_hashes.append(None) # No image, so the card fails to build and is always retried
+            continue
+        if file_path not in hashes:
+            hashes[file_path] = file_hash(file_path)
+        symbol_hashes.append(hashes[file_path])
+
+    return {
+        'Template row': list(template_row),
+        'Replacements': [[name, replacement_dict[name]] for name in template_row if name in replacement_dict],
+        'Hashes': symbol_hashes,
+    }
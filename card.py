@@ -1,5 +1,6 @@
 import math
 import multiprocessing
+from contextlib import nullcontext
 import numpy as np
 import random
 from typing import Dict, overload
@@ -10,6 +11,13 @@ from pygame.sprite import Group, spritecollide, collide_mask
 
 from symbol import Symbol
 
+
+# Annealing (regenerate_card_v3) step sizes
+ANNEAL_MOVE_SIGMA = 0.04 # Standard deviation of a move, as a fraction of the card radius
+ANNEAL_ROTATE_SIGMA = 15 # Standard deviation of a rotation, in degrees
+ANNEAL_SCALE_SIGMA = 0.03 # Standard deviation of a change in scale
+
+
 class Card(Group):
     """
     A class to represent a single card of a collection of symbols.
@@ -38,6 +46,11 @@ class Card(Group):
         self.collisions = {} # A dictionary that will hold information on collisions between symbols
         self.radius = radius # Radius of the card
         self.symbols_per_card = symbols_per_card
+        self.slots = {} # Slot (rim, home theta and size) each symbol was placed in. Key = symbol, Value = slot dict
+        self.occupancy = None # Union of placed symbols and the area outside the card, for incremental placement
+        self.placed = set() # Symbols drawn into the occupancy mask
+        self.cost_breakdown = {} # Parts of the current layout cost, see layout_cost
+        self.telemetry = None # CardTelemetry to add stage timings to, if any (see telemetry.py)
 
         # Arrangements dictionary
         self.arrangements_templates = [
@@ -59,6 +72,14 @@ class Card(Group):
             self.sprites(), radius=self.radius, symbols_per_card=self.symbols_per_card  # Needed because copy() won't work on AbstractGroup
         )
 
+    def add_internal(self, sprite, layer=None) -> None:
+        """
+        Adds a symbol to the card (pygame calls this for every symbol added, however it is added). Its transforms are then
+        timed with the card's telemetry, as Symbol construction, whichever stage they happen in
+        """
+        super().add_internal(sprite, layer)
+        sprite.timer = self._timer
+
     def replace_symbol(self, old_symbol: Symbol, new_symbol: Symbol) -> None:
         """
         Replace the specified old Symbol instance with the new one
@@ -194,54 +215,225 @@ class Card(Group):
                 outside_counter += 1
                 temp_counter = outside_counter
             
-            # Randomise radius within boundaries
-            r = random.randint(*r_bounds) # Distance from centre of circle, limited by r_bounds
-
-            # Set home theta, add random noise within a range
+            # Set home theta and the range of random noise to add to it
             theta = 360 if no_in_rim == 0 else 360 * (temp_counter/no_in_rim) 
             noise_boundary = int((1/4) * (360 if no_in_rim == 0 else 360 / no_in_rim))
-            noise = random.randint(-noise_boundary, noise_boundary)
-            theta += noise
 
-            # Set position
-            pos_x = self.radius + r*math.cos(math.radians(theta)) # x = r × cos( θ )
-            pos_y = self.radius + r*math.sin(math.radians(theta)) # y = r × sin( θ )
+            # Remember the slot each symbol was given, so it can be re-placed on its own later
+            slot = {
+                'r_bounds': r_bounds,
+                'theta': theta,
+                'noise_boundary': noise_boundary,
+                'scale_bounds': size_scale_bounds.get(size), # Get bounds for the current "size"
+            }
+            new_symbol = self._place_symbol(old_symbol.asset, slot)
 
-            # Random scale
-            scale_bounds = size_scale_bounds.get(size) # Get bounds for the current "size"
-            offset = scale_bounds[0] # Offset of scale range will be the lower bound
-            spread = scale_bounds[1] - scale_bounds[0] # Range will be the spread between both bounds
-            scale = random.random()*spread + offset
+            self.replace_symbol(old_symbol, new_symbol)
+            self.slots.pop(old_symbol, None)
+            self.slots[new_symbol] = slot
 
-            # Random angle in degrees
-            angle = random.randint(0, 360)
+    def regenerate_symbols(self, symbols: list) -> None:
+        """
+        Regenerate only the specified symbols, keeping the rest of the card as it is.
+        Each symbol is re-placed within the slot (rim, home theta and size) it was given by regenerate_card_v2.
 
-            new_symbol = Symbol(
-                old_symbol.asset, pos_x, pos_y, angle, scale,
-            )
+        Parameters:
+            symbols (list(Symbol)): Symbols in this card to regenerate
+        """
+        for old_symbol in symbols:
+            slot = self.slots.pop(old_symbol, None)
+            if slot is None:
+                slot = self._random_slot() # Symbol was never placed by regenerate_card_v2
+            new_symbol = self._place_symbol(old_symbol.asset, slot)
 
             self.replace_symbol(old_symbol, new_symbol)
+            self.slots[new_symbol] = slot
 
+    def _random_slot(self) -> dict:
+        """
+        Returns a slot anywhere on the card, for symbols that have not been given one by regenerate_card_v2
+        """
+        return {
+            'r_bounds': (0.0, 0.9*self.radius),
+            'theta': random.randint(0, 360),
+            'noise_boundary': 0,
+            'scale_bounds': (0.40, 0.7),
+        }
 
-    def card_ratio_cover(self):
+    def _place_symbol(self, asset: dict, slot: dict) -> Symbol:
+        """
+        Returns a new Symbol at a random position, scale and rotation within a slot.
+
+        Parameters:
+            asset (dict): Asset of the symbol
+            slot (dict): 'r_bounds' (radial bounds), 'theta' (home polar angle, degrees),
+                'noise_boundary' (max noise added to theta, degrees) and 'scale_bounds'
+        """
+        # Randomise radius within boundaries
+        r = random.randint(*slot['r_bounds']) # Distance from centre of circle, limited by r_bounds
+
+        # Add random noise to the home theta
+        noise = random.randint(-slot['noise_boundary'], slot['noise_boundary'])
+        theta = slot['theta'] + noise
+
+        # Set position
+        pos_x = self.radius + r*math.cos(math.radians(theta)) # x = r × cos( θ )
+        pos_y = self.radius + r*math.sin(math.radians(theta)) # y = r × sin( θ )
+
+        # Random scale
+        scale_bounds = slot['scale_bounds']
+        offset = scale_bounds[0] # Offset of scale range will be the lower bound
+        spread = scale_bounds[1] - scale_bounds[0] # Range will be the spread between both bounds
+        scale = random.random()*spread + offset
+
+        # Random angle in degrees
+        angle = random.randint(0, 360)
+
+        with self._timer('Symbol construction'):
+            return Symbol(asset, pos_x, pos_y, angle, scale)
+
+    def reset_occupancy(self, card_outer: Symbol) -> None:
+        """
+        Starts a new occupancy mask for incremental placement (see place_symbol_occupancy).
+        The occupancy mask covers the whole window, with everything outside the card circle already occupied.
+
+        Parameters:
+            card_outer (Symbol): Symbol of the area outside the card circle, centred in the window
+        """
+        window_size = (2*card_outer.rect.centerx, 2*card_outer.rect.centery)
+        self.occupancy = pygame.mask.Mask(window_size, fill=True)
+        card_circle = card_outer.mask.copy()
+        card_circle.invert() # Only the inside of the card circle
+        self.occupancy.erase(card_circle, card_outer.rect.topleft)
+        self.placed = set() # Symbols drawn into the occupancy mask
+
+    def place_symbol_occupancy(self, old_symbol: Symbol) -> tuple:
+        """
+        Re-places a single symbol within its slot, and tests it against the occupancy mask with one overlap.
+        If it fits, it is drawn into the occupancy mask, so the cost of each test doesn't grow with the number of symbols.
+
+        Parameters:
+            old_symbol (Symbol): Symbol in this card to (re-)place
+
+        Returns:
+            (new_symbol, is_placed) (tuple(Symbol, bool)): The new symbol, and True if it fits (and was committed)
+        """
+        # Take the symbol out of the occupancy mask, if it was in it
+        if old_symbol in self.placed:
+            self.occupancy.erase(old_symbol.mask, old_symbol.rect.topleft)
+            self.placed.remove(old_symbol)
+
+        slot = self.slots.pop(old_symbol, None)
+        if slot is None:
+            slot = self._random_slot() # Symbol was never placed by regenerate_card_v2
+        new_symbol = self._place_symbol(old_symbol.asset, slot)
+        self.replace_symbol(old_symbol, new_symbol)
+        self.slots[new_symbol] = slot
+
+        with self._timer('Collision'):
+            is_placed = self.occupancy.overlap(new_symbol.mask, new_symbol.rect.topleft) is None
+        if is_placed:
+            self.occupancy.draw(new_symbol.mask, new_symbol.rect.topleft) # Commit
+            self.placed.add(new_symbol)
+
+        return new_symbol, is_placed
+
+    def layout_cost(self, card_outer: Symbol, boundary_radius: float, cover_threshold: float) -> float:
+        """
+        Returns how far the card is from being valid. 0 means the card is valid.
+
+        cost = overlapping pixels between symbols + symbol pixels outside the card + pixels of cover missing
+
+        Each part is kept in self.cost_breakdown ('Collision', 'Outside' and 'Cover').
+
+        Parameters:
+            card_outer (Symbol): Symbol of the area outside the card circle
+            boundary_radius (float): Radius of the hole in card_outer, in pixels
+            cover_threshold (float): Minimum fraction of the card that must be covered by symbols
+
+        Returns:
+            cost (float): Cost of the current layout, in pixels
         """
-        Calculates the sum of the areas of all symbols and calculations the fraction of the total card area
+        # Overlap between symbols
+        overlap = 0
+        with self._timer('Collision'):
+            for sprite_a, sprite_b in self._broad_phase_pairs(self.sprites()):
+                if not sprite_a.might_overlap(sprite_b):
+                    continue
+                offset = (sprite_b.rect.x - sprite_a.rect.x, sprite_b.rect.y - sprite_a.rect.y)
+                overlap += sprite_a.mask.overlap_area(sprite_b.mask, offset)
+
+        # Boundary violation (skip masks of symbols that are obviously inside)
+        outside = 0
+        with self._timer('Outside'):
+            for sprite in self:
+                if sprite.boundary_status(card_outer.rect.center, boundary_radius) is not False and card_outer.might_overlap(sprite):
+                    offset = (sprite.rect.x - card_outer.rect.x, sprite.rect.y - card_outer.rect.y)
+                    outside += card_outer.mask.overlap_area(sprite.mask, offset)
+
+        # Lack of cover
+        missing_cover = max(0, cover_threshold - self.card_ratio_cover()) * math.pi * self.radius**2
+
+        self.cost_breakdown = {'Collision': overlap, 'Outside': outside, 'Cover': missing_cover}
+        return overlap + outside + missing_cover
+
+    def regenerate_card_v3(self, card_outer: Symbol, boundary_radius: float, cover_threshold: float,
+                           temperature: float, cost: float) -> float:
         """
+        One step of simulated annealing. Moves, rotates and rescales one random symbol, and keeps the change if it
+        lowers the layout cost (or, with a probability that falls with the temperature, even if it doesn't).
 
-        ratio = 0 # Start with symbols covering none of the card by default
+        Start from an arrangement (e.g. regenerate_card_v2) and repeat until the cost is 0.
 
-        area_card = math.pi * self.radius**2 # Area of card
+        Parameters:
+            card_outer (Symbol): Symbol of the area outside the card circle
+            boundary_radius (float): Radius of the hole in card_outer, in pixels
+            cover_threshold (float): Minimum fraction of the card that must be covered by symbols
+            temperature (float): Current temperature, in pixels of cost
+            cost (float): Cost of the current layout (see layout_cost)
+
+        Returns:
+            cost (float): Cost of the layout after the step
+        """
+        old_symbol = random.choice(self.sprites())
+
+        # Perturb the symbol, keeping the scale within the "small" to "big" bounds
+        pos_x = old_symbol.rect.centerx + random.gauss(0, ANNEAL_MOVE_SIGMA*self.radius)
+        pos_y = old_symbol.rect.centery + random.gauss(0, ANNEAL_MOVE_SIGMA*self.radius)
+        angle = old_symbol.angle + random.gauss(0, ANNEAL_ROTATE_SIGMA)
+        scale = min(max(old_symbol.scale + random.gauss(0, ANNEAL_SCALE_SIGMA), 0.40), 0.7)
+        with self._timer('Symbol construction'):
+            new_symbol = Symbol(old_symbol.asset, pos_x, pos_y, angle, scale)
+
+        self.replace_symbol(old_symbol, new_symbol)
+        cost_breakdown = self.cost_breakdown
+        new_cost = self.layout_cost(card_outer, boundary_radius, cover_threshold)
 
-        # Area of symbols
-        area_symbols = 0 # Keep track of running total of areas
-        for s in self:
-            pixel_array = pygame.surfarray.array_alpha(s.image).flatten() # Turn surface into 1d array
-            filled_array = [0 if pixel == 0 else 1 for pixel in pixel_array] # Make sure only 1s and 0s in array
-            area = sum(filled_array) # Sum
-            area_symbols += area # Add to running total
- 
-        ratio = area_symbols/area_card # Calculate ratio
-        # print(ratio)
+        # Metropolis criterion
+        if new_cost <= cost or random.random() < math.exp((cost - new_cost) / temperature):
+            slot = self.slots.pop(old_symbol, None)
+            if slot is not None:
+                self.slots[new_symbol] = slot
+            return new_cost
+
+        self.replace_symbol(new_symbol, old_symbol) # Undo
+        self.cost_breakdown = cost_breakdown
+        return cost
+
+
+    def card_ratio_cover(self):
+        """
+        Calculates the sum of the areas of all symbols and calculations the fraction of the total card area.
+        Each symbol's area is worked out once when the Symbol is created, so this only sums the cached areas.
+        """
+
+        with self._timer('Cover'):
+            ratio = 0 # Start with symbols covering none of the card by default
+
+            area_card = math.pi * self.radius**2 # Area of card
+            area_symbols = sum(s.area for s in self) # Area of symbols (opaque pixels)
+     
+            ratio = area_symbols/area_card # Calculate ratio
 
         return ratio
  ########################
@@ -250,22 +442,109 @@ class Card(Group):
 
 
 
-    def calc_collisions(self) -> Dict:
+    def calc_collisions(self, mode: str = 'full') -> Dict:
         """
         Returns a dictionary of each symbol and a list of symbols in the same card that it collides with.
 
+        Each pair of symbols is only checked once. Pairs whose bounding circles or rects don't overlap are skipped
+        (broad phase), then pairs whose coarse masks don't overlap (see Symbol.might_overlap), and only the rest are
+        checked with their full resolution masks.
+
+        Parameters:
+            mode (str): 'full' = find every collision (useful for diagnostics).
+                'any' = stop at the first collision found (enough to know if the card needs regenerating)
+
         Returns:  
             collisions (Dict): A dictionary of collisions. Key = a symbol in the card, Value = List of all symbols in same card that collides with it
         """
-        card_copy = self.copy() # Create a copy of the card
-        self.collisions = {}
-        for sprite in self:
-            card_copy.remove(sprite) # Remove sprite from the copy, so not checking on collisions with itself (which will always be True)
-            self.collisions[sprite] = spritecollide(sprite, card_copy, False, collide_mask) # Check for collision of sprite with any other sprite
-            card_copy = self.copy() # Refresh the copy before the next loop
+        if mode not in ('full', 'any'):
+            raise Exception(f"{mode} is not a valid collision mode. Use 'full' or 'any'.")
+
+        with self._timer('Collision'):
+            sprites = self.sprites()
+            self.collisions = {sprite: [] for sprite in sprites}
+            for sprite_a, sprite_b in self._broad_phase_pairs(sprites):
+                # Narrow phase, check the coarse masks and then the full resolution ones
+                if not sprite_a.might_overlap(sprite_b):
+                    continue
+                offset = (sprite_b.rect.x - sprite_a.rect.x, sprite_b.rect.y - sprite_a.rect.y)
+                if sprite_a.mask.overlap(sprite_b.mask, offset) is not None:
+                    self.collisions[sprite_a].append(sprite_b)
+                    self.collisions[sprite_b].append(sprite_a)
+                    if mode == 'any':
+                        break # Early exit, we already know the card is not valid
 
         return self.collisions
 
+    def calc_outside(self, card_outer: Symbol, boundary_radius: float, mode: str = 'full') -> list:
+        """
+        Returns a list of the symbols that are (at least partly) outside the card circle.
+
+        Symbols that are obviously inside or outside are found from their geometry (see Symbol.boundary_status),
+        only borderline symbols are checked against the card outer mask (coarse, then full resolution).
+
+        Parameters:
+            card_outer (Symbol): Symbol of the area outside the card circle
+            boundary_radius (float): Radius of the hole in card_outer, in pixels
+            mode (str): 'full' = find every symbol outside.
+                'any' = stop at the first one found. Borderline symbols are only checked once none are obviously outside
+
+        Returns:
+            outside (list(Symbol)): Symbols that are outside the card circle
+        """
+        if mode not in ('full', 'any'):
+            raise Exception(f"{mode} is not a valid outside mode. Use 'full' or 'any'.")
+
+        outside = []
+        with self._timer('Outside'):
+            borderline = []
+            for sprite in self:
+                is_outside = sprite.boundary_status(card_outer.rect.center, boundary_radius)
+                if is_outside is None:
+                    borderline.append(sprite)
+                elif is_outside:
+                    outside.append(sprite)
+                    if mode == 'any':
+                        return outside # Early exit, we already know the card is not valid
+
+            for sprite in borderline: # Check the masks
+                if card_outer.might_overlap(sprite) and collide_mask(card_outer, sprite) is not None:
+                    outside.append(sprite)
+                    if mode == 'any':
+                        break
+
+        return outside
+
+    def _timer(self, stage: str):
+        """
+        Returns a context manager that adds the time spent in its block to a stage of self.telemetry (does nothing if there is none)
+        """
+        if self.telemetry is None:
+            return nullcontext()
+        return self.telemetry.timer(stage)
+
+    @staticmethod
+    def _broad_phase_pairs(sprites: list):
+        """
+        Yields each unordered pair of symbols whose bounding circles and rects overlap, so they might collide.
+
+        Parameters:
+            sprites (list(Symbol)): Symbols to pair up
+        """
+        for idx, sprite_a in enumerate(sprites):
+            for sprite_b in sprites[idx+1:]:
+                # Bounding circles (centred on each symbol, so don't change with rotation)
+                dx = sprite_a.rect.centerx - sprite_b.rect.centerx
+                dy = sprite_a.rect.centery - sprite_b.rect.centery
+                if dx*dx + dy*dy > (sprite_a.radius + sprite_b.radius)**2:
+                    continue
+                
+                # Bounding rects
+                if not sprite_a.rect.colliderect(sprite_b.rect):
+                    continue
+
+                yield sprite_a, sprite_b
+
     def has_collisions(self) -> bool:
         """
         Returns True if atleast 2 symbols are colliding. Useful for while loops and if statements.
@@ -0,0 +1,115 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pygame
+
+
+WRITER_THREADS = 2 # Threads encoding and writing pngs. pygame releases the GIL while it encodes, so they run alongside the search
+MAX_PENDING_WRITES = 4 # Cards queued or being written at once. Submitting another blocks until one is done, so memory stays bounded
+
+
+class CardWriter():
+    """
+    Writes rendered cards to png in background threads, so encoding and writing one card overlaps with the search for
+    the next. At most max_pending cards are waiting at once; submit blocks while that many are (backpressure), so a slow
+    disk slows the search down rather than piling up rendered cards in memory.
+
+    Each png is written to a temporary file and moved into place, so a failed write never leaves a half written card.
+    A failed write does not stop the others, it is recorded and returned by close.
+    Each card can be given a callback, called (in the writer thread) only once it has been written, e.g. to record it as exported.
+    Cards already encoded elsewhere (e.g. by worker processes) are written the same way, see submit_encoded.
+
+    Attributes:
+        max_pending (int): Most cards waiting to be written at once
+        no_written (int): Number of cards written so far
+        errors (list(tuple)): (path, error message) of every write that failed
+
+    Methods:
+        submit -> None: Queues a card to be written, waiting if the queue is full
+        submit_encoded -> None: Queues an already encoded card to be written, waiting if the queue is full
+        close -> list: Waits for every queued card to be written, and returns the writes that failed
+    """
+
+    def __init__(self, threads: int = WRITER_THREADS, max_pending: int = MAX_PENDING_WRITES) -> None:
+        """
+        Constructor for CardWriter class. Starts the writer threads.
+
+        Parameters:
+            threads (int): Number of writer threads
+            max_pending (int): Most cards waiting to be written at once, including the ones being written
+        """
+        self.max_pending = max_pending
+        self.no_written = 0
+        self.errors = []
+
+        self._executor = ThreadPoolExecutor(threads, thread_name_prefix='CardWriter')
+        self._slots = threading.BoundedSemaphore(max_pending) # One per card waiting to be written
+        self._lock = threading.Lock() # Guards no_written and errors, which every thread updates
+
+    def submit(self, surface: pygame.Surface, path: str, copy: bool = False, on_written=None) -> None:
+        """
+        Queues a card to be written, waiting first if max_pending cards are already waiting.
+
+        Parameters:
+            surface (Surface): Rendered card. Must not be drawn on again until written, unless copy is True
+            path (str): Path of the png to write
+            copy (bool): Write a copy of the surface, so it can be drawn on straight away (e.g. the preview window)
+            on_written (function): Called with no arguments once the card has been written, in the writer thread.
+                If it raises, the write is recorded as failed. If None, nothing is called
+        """
+        self._slots.acquire()
+        try:
+            if copy:
+                surface = surface.copy()
+            self._executor.submit(self._write, path, lambda f: pygame.image.save(surface, f, os.path.basename(path)), on_written) # The name tells pygame which format to encode to
+        except Exception:
+            self._slots.release()
+            raise
+
+    def submit_encoded(self, data: bytes, path: str, on_written=None) -> None:
+        """
+        Queues an already encoded card to be written, waiting first if max_pending cards are already waiting.
+
+        Parameters:
+            data (bytes): Contents of the png, e.g. encoded by a worker process (see gobble.make_card)
+            path (str): Path of the png to write
+            on_written (function): Called with no arguments once the card has been written, see submit
+        """
+        self._slots.acquire()
+        try:
+            self._executor.submit(self._write, path, lambda f: f.write(data), on_written)
+        except Exception:
+            self._slots.release()
+            raise
+
+    def close(self) -> list:
+        """
+        Waits for every queued card to be written, then stops the writer threads. Nothing more can be submitted
+
+        Returns:
+            errors (list(tuple)): (path, error message) of every write that failed. Empty if all were written
+        """
+        self._executor.shutdown(wait=True)
+        return self.errors
+
+    def _write(self, path: str, save, on_written) -> None:
+        """
+        Writes a single card, in a writer thread. save writes the card's contents to the open temporary file it is passed
+        """
+        temp_path = f"{path}.tmp"
+        try:
+            with open(temp_path, 'wb') as f:
+                save(f)
+            os.replace(temp_path, path)
+            if on_written is not None:
+                on_written()
+            with self._lock:
+                self.no_written += 1
+        except Exception as e:
+            with self._lock:
+                self.errors.append((path, f"{type(e).__name__}: {e}"))
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        finally:
+            self._slots.release()
@@ -0,0 +1,283 @@
+# Standard modules
+import random
+
+# Installed modules
+import pygame
+from pygame.colordict import THECOLORS as Colours
+import numpy as np
+
+# Custom modules
+from assets import Assets, opaque_pixels
+from batch_sampler import BATCH_SIZE, sample_layouts, screen_layouts
+from symbol import Symbol
+from card import Card
+from telemetry import CardTelemetry
+
+
+COVER_THRESHOLD = 0.22 # Minimum fraction of the card that must be covered by symbols for a card to be valid
+STRATEGIES = ('v2', 'partial', 'anneal', 'occupancy', 'batched') # Ways of regenerating a rejected card
+MAX_LOCAL_RETRIES = 10 # Partial regenerations to try before regenerating the whole card
+ANNEAL_START_TEMPERATURE = 300 # Starting temperature of annealing, in pixels of layout cost
+ANNEAL_COOLING = 0.99 # Temperature is multiplied by this every step
+ANNEAL_MIN_TEMPERATURE = 1 # Temperature never cools below this
+ANNEAL_MAX_STEPS = 1000 # Annealing steps from one arrangement before starting again from a new one
+MAX_PLACEMENT_TRIES = 20 # Tries to place a single symbol incrementally before starting again with new slots
+
+
+def iter_card_attempts(assets: Assets, card_outer: Symbol, symbol_names: list,
+                       card_radius: int, symbols_per_card: int,
+                       strategy: str = 'v2', max_local_retries: int = MAX_LOCAL_RETRIES, telemetry: CardTelemetry = None):
+    """
+    Runs the accept/reject search for a single card in mask space. Nothing is drawn and there is no frame limiting,
+    so this can run headless as fast as the collision checks allow.
+
+    Yields the card after every attempt, so a viewer can draw each attempt if it wants to.
+
+    Parameters:
+        assets (Assets): Normalised symbol assets
+        card_outer (Symbol): Symbol of the area outside the card circle (for boundary collisions)
+        symbol_names (list(str)): Names of the symbols on this card
+        card_radius (int): Radius of a single card in pixels
+        symbols_per_card (int): Number of symbols per card
+        strategy (str): How to regenerate a rejected card, one of STRATEGIES.
+            'v2' = regenerate the whole card.
+            'partial' = only re-place the symbols that collide or are outside the card, and regenerate the whole card
+            once that has failed max_local_retries times in a row.
+            'anneal' = start from a v2 arrangement and relax it with simulated annealing (see Card.regenerate_card_v3).
+            'occupancy' = place symbols one at a time (biggest first) against an occupancy mask of what is already placed.
+            'batched' = sample layouts in batches with NumPy, screen out impossible ones with geometry, and only check
+            the survivors with masks (see batch_sampler)
+        max_local_retries (int): Number of partial regenerations to try before regenerating the whole card
+        telemetry (CardTelemetry): Records attempts, rejection reasons, stage timings and the final cover, if given
+
+    Yields:
+        (card, is_card_valid) (tuple(Card, bool)): Card after the attempt, and whether it was accepted
+    """
+    if strategy not in STRATEGIES:
+        raise Exception(f"{strategy} is not a valid strategy. Use one of {STRATEGIES}.")
+
+    if telemetry is None:
+        telemetry = CardTelemetry()
+
+    # Generate Symbol instances with default scale, rotation and position
+    with telemetry.timer('Symbol construction'):
+        sprites = [Symbol(a) for a in assets.get_assets_from_name(list(symbol_names))]
+    card = Card(sprites, radius=card_radius, symbols_per_card=symbols_per_card)
+    card.telemetry = telemetry
+    boundary_radius = calc_boundary_radius(card_outer)
+
+    if strategy == 'anneal':
+        yield from _iter_anneal_attempts(card, card_outer, boundary_radius, telemetry)
+        return
+    if strategy == 'occupancy':
+        yield from _iter_occupancy_attempts(card, card_outer, telemetry)
+        return
+    if strategy == 'batched':
+        yield from _iter_batched_attempts(card, card_outer, boundary_radius, telemetry)
+        return
+
+    is_card_valid = False
+    local_retries = 0 # Partial regenerations since the last full one
+    while not is_card_valid:
+        # Only need to know if there is at least one symbol outside or colliding, unless working out which symbols to re-place
+        check_mode = 'full' if strategy == 'partial' else 'any'
+        outside_card_circle = card.calc_outside(card_outer, boundary_radius, mode=check_mode) # Calculate if any sprite is outside of the card circle
+
+        # A whole card regeneration doesn't need the collisions of a card that is already rejected. Skipping them
+        # means most rejected cards never have their symbols transformed at full resolution (see symbol.MASK_PYRAMID)
+        if strategy != 'partial' and len(outside_card_circle) > 0:
+            card.collisions = {}
+        else:
+            card.calc_collisions(mode=check_mode) # Calculate collisions
+        collisions = card.collisions
+
+        # Regenerate if collisions
+        if card.has_collisions() or len(outside_card_circle) > 0:
+            telemetry.reject('Outside' if len(outside_card_circle) > 0 else 'Collision') # Only the first reason, see telemetry.REJECTION_ORDER
+            if strategy == 'partial' and len(card.slots) > 0 and local_retries < max_local_retries:
+                # Keep card order (not set order), so the random draws are the same on every run
+                offending = set(outside_card_circle)
+                offending.update(s for s, colliding in collisions.items() if len(colliding) > 0)
+                card.regenerate_symbols([s for s in card if s in offending])
+                local_retries += 1
+            else:
+                card.regenerate_card_v2()
+                local_retries = 0
+        else:
+            ratio_cover = card.card_ratio_cover() # Calculate card cover of symbols
+            # Regenerate if not enough cover
+            if ratio_cover < COVER_THRESHOLD:
+                telemetry.reject('Cover')
+                card.regenerate_card_v2()
+                local_retries = 0
+            else:
+                is_card_valid = True
+                telemetry.cover = ratio_cover
+
+        telemetry.attempts += 1
+        yield card, is_card_valid
+
+
+def _iter_anneal_attempts(card: Card, card_outer: Symbol, boundary_radius: float, telemetry: CardTelemetry):
+    """
+    Annealing version of the search. Every step is an attempt. See iter_card_attempts
+    """
+    while True:
+        card.regenerate_card_v2() # Start from a random arrangement
+        cost = card.layout_cost(card_outer, boundary_radius, COVER_THRESHOLD)
+        temperature = ANNEAL_START_TEMPERATURE
+
+        for _ in range(ANNEAL_MAX_STEPS):
+            cost = card.regenerate_card_v3(card_outer, boundary_radius, COVER_THRESHOLD, temperature, cost)
+            temperature = max(temperature * ANNEAL_COOLING, ANNEAL_MIN_TEMPERATURE)
+
+            is_card_valid = cost == 0
+            telemetry.reject_first([reason for reason, part in card.cost_breakdown.items() if part > 0])
+            if is_card_valid:
+                telemetry.cover = card.card_ratio_cover()
+
+            telemetry.attempts += 1
+            yield card, is_card_valid
+            if is_card_valid:
+                return
+
+
+def _iter_occupancy_attempts(card: Card, card_outer: Symbol, telemetry: CardTelemetry):
+    """
+    Incremental version of the search. Every symbol placement tried is an attempt. See iter_card_attempts
+
+    The occupancy mask holds both the placed symbols and the area outside the card, so a placement that doesn't fit
+    is rejected as 'Collision or outside'.
+    """
+    while True:
+        card.regenerate_card_v2() # New slots (rim, home theta and size) for every symbol
+        card.reset_occupancy(card_outer)
+
+        is_every_symbol_placed = True
+        for symbol in sorted(card.sprites(), key=lambda s: s.area, reverse=True): # Biggest first, they are hardest to fit
+            for _ in range(MAX_PLACEMENT_TRIES):
+                symbol, is_placed = card.place_symbol_occupancy(symbol)
+                if not is_placed:
+                    telemetry.reject('Collision or outside')
+                telemetry.attempts += 1
+                yield card, False
+                if is_placed:
+                    break
+            else:
+                is_every_symbol_placed = False
+                break
+
+        # Placed symbols can't collide or be outside the card, so only the cover is left to check
+        if is_every_symbol_placed:
+            ratio_cover = card.card_ratio_cover()
+            if ratio_cover >= COVER_THRESHOLD:
+                telemetry.cover = ratio_cover
+                telemetry.attempts += 1
+                yield card, True
+                return
+            telemetry.reject('Cover')
+
+
+def _iter_batched_attempts(card: Card, card_outer: Symbol, boundary_radius: float, telemetry: CardTelemetry):
+    """
+    Batched version of the search. Every layout that survives screening and is checked with masks is an attempt.
+    See iter_card_attempts
+
+    Layouts thrown out by screening are not attempts, they are counted (and timed) as 'Screened out'.
+    """
+    assets_for_card = [s.asset for s in card]
+    while True:
+        rng = np.random.default_rng(random.getrandbits(64)) # Seeded from the card's random state, so runs repeat
+        with telemetry.timer('Screening'):
+            layouts = sample_layouts(rng, BATCH_SIZE, card.symbols_per_card, card.radius)
+            survivors = screen_layouts(layouts, assets_for_card, card_outer.rect.center, boundary_radius, card.radius, COVER_THRESHOLD)
+        telemetry.reject('Screened out', int(len(survivors) - survivors.sum()))
+
+        for idx in np.flatnonzero(survivors):
+            with telemetry.timer('Symbol construction'):
+                sprites = [
+                    Symbol(asset, layouts['Pos x'][idx, i], layouts['Pos y'][idx, i], layouts['Angle'][idx, i], layouts['Scale'][idx, i])
+                    for i, asset in enumerate(assets_for_card)
+                ]
+            card = Card(sprites, radius=card.radius, symbols_per_card=card.symbols_per_card)
+            card.telemetry = telemetry
+
+            # Screening already made sure there is enough cover
+            outside_card_circle = card.calc_outside(card_outer, boundary_radius)
+            card.calc_collisions(mode='any')
+            if len(outside_card_circle) > 0 or card.has_collisions():
+                telemetry.reject('Outside' if len(outside_card_circle) > 0 else 'Collision') # Only the first reason, see telemetry.REJECTION_ORDER
+            is_card_valid = len(outside_card_circle) == 0 and not card.has_collisions()
+            if is_card_valid:
+                telemetry.cover = card.card_ratio_cover()
+
+            telemetry.attempts += 1
+            yield card, is_card_valid
+            if is_card_valid:
+                return
+
+
+def calc_boundary_radius(card_outer: Symbol) -> float:
+    """
+    Returns the radius of the hole in the middle of card_outer, i.e. the distance from its centre to its nearest opaque pixel.
+
+    Parameters:
+        card_outer (Symbol): Symbol of the area outside the card circle
+
+    Returns:
+        radius (float): Radius of the card circle in pixels
+    """
+    width, height = card_outer.image.get_size()
+    xs, ys = np.nonzero(opaque_pixels(card_outer.image)) # Opaque pixels (array is indexed [x, y])
+    radius = float(np.hypot(xs + 0.5 - width/2, ys + 0.5 - height/2).min())
+    return radius
+
+
+def generate_card(assets: Assets, card_outer: Symbol, symbol_names: list,
+                  card_radius: int, symbols_per_card: int, strategy: str = 'v2', telemetry: CardTelemetry = None) -> tuple:
+    """
+    Runs the search for a single card until a valid layout is found.
+
+    Parameters:
+        See iter_card_attempts
+
+    Returns:
+        (card, attempts) (tuple(Card, int)): The accepted card, and how many attempts it took
+    """
+    attempts = 0
+    for card, is_card_valid in iter_card_attempts(assets, card_outer, symbol_names, card_radius, symbols_per_card,
+                                                  strategy=strategy, telemetry=telemetry):
+        attempts += 1
+
+    return card, attempts
+
+
+def render_card(card: Card, rim_colour: str, window_size: tuple, card_radius: int, ring_radius: float,
+                surface=None, is_card_valid=True) -> pygame.Surface:
+    """
+    Draws a card (rim, card circle and symbols) onto a Surface.
+
+    Parameters:
+        card (Card): Card to draw
+        rim_colour (str): Name of the colour of the card rim
+        window_size (tuple(2)): Size of the Surface in pixels. Format = (width, height)
+        card_radius (int): Radius of the card circle in pixels
+        ring_radius (float): Radius of the card rim in pixels
+        surface (Surface): Surface to draw on. If left as None, an offscreen Surface is created
+        is_card_valid (bool): Show a white background if True, otherwise a black one
+
+    Returns:
+        surface (Surface): Surface with the card drawn on it
+    """
+    if surface is None:
+        surface = pygame.Surface(window_size)
+
+    window_width, window_height = window_size
+    centre = (window_width/2, window_height/2)
+
+    surface.fill(Colours["white"] if is_card_valid else Colours["black"])
+    pygame.draw.circle(surface, Colours[rim_colour], centre, ring_radius) # Card rim
+    pygame.draw.circle(surface, Colours["white"], centre, card_radius) # Card circle
+    card.draw(surface) # Draw card symbols
+
+    return surface
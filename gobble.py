@@ -7,15 +7,18 @@
 
 
 # Standard modules
+from contextlib import nullcontext
+import io
+import multiprocessing
 import os
 import random
+import re
+import threading
 import time
 
-# Installed modules
-import pandas as pd
+# Installed modules (pandas is only imported if the xlsx template has to be parsed, see read_template)
 import pygame
 from pygame.colordict import THECOLORS as Colours
-from pygame.sprite import Sprite, groupcollide, spritecollide, collide_rect, collide_mask
 
 
 # Custom modules
@@ -23,10 +26,17 @@ from assets import make_path, abs_path, Assets
 from autocropper import AutoCropper
 from symbol import Symbol
 from card import Card
+from engine import generate_card, iter_card_attempts, render_card
+from layout_store import LayoutStore, card_from_layout, card_to_layout
+from build_manifest import BuildManifest, card_entry
+from card_writer import CardWriter
+from projective_plane import projective_plane
+from profiling import PROFILE_MODES, make_profile_folder, profiled
+from telemetry import CardTelemetry, append_jsonl
+from template_cache import load_template_cache, save_template_cache
 
 
-# Initialise pygame
-pygame.init()
+# Pygame is not initialised up front. Generating cards headless needs none of its subsystems, and preview initialises the display
 
 
 # Global variables
@@ -36,10 +46,10 @@ RING_RADIUS = CARD_RADIUS*1.05
 WINDOW_WIDTH = 2*RING_RADIUS # Width of window
 WINDOW_HEIGHT = WINDOW_WIDTH # Height of window (square)
 WINDOW_SIZE = (WINDOW_WIDTH, WINDOW_HEIGHT)
-WINDOW = pygame.display.set_mode(WINDOW_SIZE) # Global instance of window Surface
-FPS = 60 # Frames per second
+CARD_CENTRE = (WINDOW_WIDTH/2, WINDOW_HEIGHT/2) # Centre of the card rim and circle (see engine.render_card)
+FPS = 60 # Frames per second (only used when previewing)
 # CARD_RADIUS = WINDOW_WIDTH / 2 # Radius of each card (=1/2 width of window)
-SYMBOLS_PER_CARD = 8 # Number of symbols per card
+SYMBOLS_PER_CARD = 8 # Number of symbols per card (of the xlsx template, generated templates have order + 1)
 INPUT_FOLDER_NAME = 'images'
 INPUT_FOLDER = abs_path(INPUT_FOLDER_NAME)
 OUTPUT_FOLDER_NAME = 'export'
@@ -47,24 +57,279 @@ OUTPUT_FOLDER = abs_path(OUTPUT_FOLDER_NAME)
 GOBBLE_TEMPLATE_FOLDER = 'template'
 GOBBLE_TEMPLATE_FILENAME = 'gobble.xlsx'
 GOBBLE_TEMPLATE = make_path(GOBBLE_TEMPLATE_FOLDER, GOBBLE_TEMPLATE_FILENAME)
+CACHE_FOLDER_NAME = 'cache' # Generated files that speed up later runs
+LAYOUT_STORE = make_path(CACHE_FOLDER_NAME, 'layouts.json') # Layouts of accepted cards
+ASSET_CACHE = abs_path(os.path.join(CACHE_FOLDER_NAME, 'assets')) # Normalised images, so they aren't decoded and resized every run
+TELEMETRY_LOG = make_path(CACHE_FOLDER_NAME, 'telemetry.jsonl') # Metrics of every card generated, one JSON object per line
+TEMPLATE_CACHE = make_path(CACHE_FOLDER_NAME, 'template.pickle') # Parsed xlsx template, so it is only parsed again once it changes
+BUILD_MANIFEST = make_path(CACHE_FOLDER_NAME, 'build_manifest.json') # What each exported card was built from
 
 
-def gobble(card_nos=None):
+def gobble(card_nos=None, preview=False, workers=1, seed=None, strategy='v2', render_only=False, telemetry_path=TELEMETRY_LOG,
+           profile=None, profile_folder=None, only_changed=False, order=None, replacements=None):
     """
     The main function.
 
     Parameters:
         card_nos (list[int]): List of specific card numbers to regenerate. If leave as None, all cards will be regenerated
+        preview (bool): Show every placement attempt in a pygame window. If False, cards are generated headless
+        workers (int): Number of worker processes to spread the cards over. Preview needs a single worker
+        seed (int): Seed for the run. The same seed gives the same cards no matter how many workers are used.
+            If left as None, a random seed is chosen (and printed)
+        strategy (str): How to regenerate rejected cards, see engine.STRATEGIES. 'v2' = whole card, 'partial' = only offending symbols,
+            'anneal' = relax one arrangement with simulated annealing, 'occupancy' = place symbols one at a time,
+            'batched' = screen batches of sampled layouts with NumPy before checking masks
+        render_only (bool): Re-render cards from their stored layouts instead of searching for new ones.
+            Cards without a valid stored layout (e.g. one of their images has changed) are searched for as normal
+        telemetry_path (str): JSONL file to append the metrics of every generated card to (see telemetry.CardTelemetry).
+            If None, no metrics are written
+        profile (str): Capture a CPU profile and memory allocation snapshot (see profiling.profiled).
+            'card' = one of each per card, tagged with the card number and symbols (done inside the workers, if any).
+            'run' = one of each for the whole run (only covers this process, so use 'card' to see inside workers).
+            If None, nothing is profiled
+        profile_folder (str): Folder to write the profiles to. If None, a new timestamped folder in cache/profiles is made
+        only_changed (bool): Only regenerate the cards (of card_nos) whose template row, replacements or symbol images have changed
+            since they were last exported, or whose exported image is missing (see build_manifest.BuildManifest).
+            The rest of the export folder is left untouched
+        order (int): Generate the template as the projective plane of this order (see generate_template), rather than reading
+            the xlsx template. Must be a prime power: order^2 + order + 1 cards of order + 1 symbols each. If None, the xlsx is read
+        replacements (dict): Overrides of the replacements of the template's symbol names with ours. Key = template symbol name
+            (e.g. 'ANCHOR' in the xlsx, or 'Symbol 1' in a generated template), Value = our symbol name
+
+    Returns:
+        results (list(dict)): Card number, symbol names, number of attempts and seconds taken for each card
     """
+    run_start_time = time.time() # Startup (everything before the first card's search) is reported, as it dominates small regenerations
+    if profile is not None:
+        if profile not in PROFILE_MODES:
+            raise Exception(f"{profile} is not a valid profile mode. Use one of {PROFILE_MODES}.")
+        if profile_folder is None:
+            profile_folder = make_profile_folder()
+        print(f"Writing profiles to {profile_folder}")
+
+    if profile == 'run':
+        # Run again unprofiled, inside a single profile of the whole run
+        tags = {'Card #': card_nos, 'Seed': seed, 'Strategy': strategy, 'Workers': workers}
+        with profiled(profile_folder, 'run', tags):
+            return gobble(card_nos, preview, workers, seed, strategy, render_only, telemetry_path, only_changed=only_changed,
+                          order=order, replacements=replacements)
+
     # Check that an export folder exists
     if not os.path.exists(OUTPUT_FOLDER):
         os.makedirs(OUTPUT_FOLDER) 
 
+    #################
+    # Preliminaries #
+    #################
+
+    # Make sure all images are cropped to their content (i.e. no empty space around each image)
+    autocropper = AutoCropper(INPUT_FOLDER_NAME)
+    autocropper.crop(f'{INPUT_FOLDER_NAME}_cropped')
+
     ###########################################################
     # Load in dobble template, do necessary name replacements #
     ###########################################################
+    if order is None:
+        template, replacement_dict = read_template()
+        if replacements is not None:
+            replacement_dict.update(replacements)
+    else:
+        template, replacement_dict = generate_template(order, replacements)
+    symbols_per_card = len(next(iter(template.values())))
+
+    # Work out what each card is built from, and (if only_changed) which cards have changed since they were last exported
+    build_manifest = BuildManifest(BUILD_MANIFEST)
+    symbol_index = Assets(f'{INPUT_FOLDER_NAME}_cropped') # Only used to find each symbol's image file, nothing is loaded
+    hashes = {} # Each image is only hashed once, however many cards it is on
+    entries = {} # Key = card number, Value = what it is built from (see build_manifest.card_entry)
+    for card_no, template_row in template.items():
+        if card_nos is None or card_no in card_nos:
+            entries[card_no] = card_entry(template_row, replacement_dict, symbol_index, hashes)
+    build_manifest.retain(list(template)) # Forget cards that are no longer in the template
+    removed_card_nos = remove_stale_exports(list(template)) # e.g. the cards beyond the end of a smaller deck, so they aren't printed with this one
+    if len(removed_card_nos) > 0:
+        print(f"Removed the exported images of cards {removed_card_nos}, as they are not in the template.")
+
+    card_nos_to_build = list(entries)
+    if only_changed:
+        card_nos_to_build = [card_no for card_no, entry in entries.items() if not build_manifest.is_up_to_date(card_no, entry, export_path(card_no))]
+        print(f"{len(card_nos_to_build)} of {len(entries)} cards have changed: {card_nos_to_build}")
+    customised_template = customise_template(template, replacement_dict, card_nos_to_build)
+
+    # Seed every card from the run seed, so a card comes out the same no matter which worker generates it
+    if seed is None:
+        seed = random.randrange(2**32)
+    print(f"Using seed {seed}")
+    card_profile_folder = profile_folder if profile == 'card' else None # Only profile each card in 'card' mode
+    jobs = [(card_no, symbol_names, seed, strategy, card_profile_folder) for card_no, symbol_names in customised_template.items()] # (card_no, symbol_names, seed, strategy, profile_folder)
+    symbol_names_needed = list(dict.fromkeys(name for job in jobs for name in job[1])) # Only these symbols are loaded
+
+    layout_store = LayoutStore(LAYOUT_STORE) # Accepted layouts, so cards can be re-rendered without searching
+    results = []
+    run_id = time.strftime('%Y-%m-%dT%H:%M:%S') # Tells the runs in the telemetry log apart
+
+    def record(result: dict) -> None:
+        """
+        Keeps the result of a card, stores its layout and logs its metrics. It is added to the build manifest once exported (see exported)
+        """
+        layout_store.put(result['Card #'], result.pop('Layout'))
+        layout_store.save() # Save every card, so nothing is lost if the run is stopped
+        metrics = result.pop('Telemetry')
+        if telemetry_path is not None:
+            append_jsonl(telemetry_path, {'Run': run_id, 'Seed': seed, 'Strategy': strategy, 'Card #': result['Card #'],
+                                          'Symbols': result['Symbols'], 'Total seconds': result['Seconds'], **metrics})
+        results.append(result)
+        print(f"Card {result['Card #']} took {result['Seconds']} seconds to run ({result['Attempts']} attempts).")
+
+    writer = CardWriter() # Exports cards in the background, so the next card's search starts straight away
+    manifest_lock = threading.Lock() # The writer threads add cards to the build manifest as they are exported
+
+    def exported(card_no: int):
+        """
+        Returns a callback for the writer, that adds a card to the build manifest once its image has been written.
+        Only then, so a card whose image was never written (e.g. the run was stopped first) is rebuilt next run
+        """
+        def on_written() -> None:
+            with manifest_lock:
+                build_manifest.put(card_no, entries[card_no])
+                build_manifest.save() # Save every card, so nothing is lost if the run is stopped
+        return on_written
+
+    def finish_writes() -> None:
+        """
+        Waits for every card to be exported, and saves the build manifest. Cards that could not be are dropped from it,
+        so they are rebuilt next run, and raise Exception
+        """
+        errors = writer.close()
+        card_no_from_path = {export_path(card_no): card_no for card_no in entries}
+        for path, _ in errors:
+            build_manifest.remove(card_no_from_path[path])
+        build_manifest.save()
+        if len(errors) == 0:
+            return
+        raise Exception(f"{len(errors)} cards could not be exported: " + '; '.join(f"{path} ({error})" for path, error in errors))
+
+    try:
+        ###############################################
+        # Re-render cards from stored layouts, if can #
+        ###############################################
+        assets = None
+        if render_only:
+            assets, card_outer = load_assets(prefetch=symbol_names_needed, symbols_per_card=symbols_per_card)
+            jobs_to_search = []
+            for job in jobs:
+                card_no = job[0]
+                start_time = time.time()
+                layout = layout_store.get(card_no, job[1], assets, CARD_RADIUS, symbols_per_card)
+                if layout is None:
+                    print(f"Card {card_no} has no valid stored layout (e.g. its symbols have changed), so will search for a new one.")
+                    jobs_to_search.append(job)
+                    continue
+            
+                card = card_from_layout(layout, assets)
+                layout_store.put(card_no, card_to_layout(card, layout['Rim colour'], CARD_CENTRE, RING_RADIUS)) # Adds the fractions of the card radius, if stored before they were
+                surface = render_card(card, layout['Rim colour'], WINDOW_SIZE, CARD_RADIUS, RING_RADIUS)
+                writer.submit(surface, export_path(card_no), on_written=exported(card_no)) # Export to png. Only once the layout is known to be of this entry's symbols (see LayoutStore.get)
+                results.append({'Card #': card_no, 'Symbols': job[1], 'Attempts': 0, 'Seconds': time.time() - start_time})
+                print(f"Card {card_no} re-rendered from its stored layout, took {results[-1]['Seconds']} seconds.")
+            layout_store.save() # Drop any invalidated layouts
+            jobs = jobs_to_search
+
+        ##################
+        # Generate cards #
+        ##################
+        if preview and workers != 1:
+            raise Exception("Preview can only be shown when generating cards with a single worker.")
+        if len(jobs) > 0 and workers == 1 and assets is None:
+            assets, card_outer = load_assets(prefetch=symbol_names_needed, symbols_per_card=symbols_per_card)
+        print(f"Started up in {time.time() - run_start_time:.2f} seconds.") # Workers load their own assets, after this
+
+        if len(jobs) == 0:
+            pass
+        elif preview:
+            pygame.display.init() # The only subsystem needed, for the window and its events
+            window = pygame.display.set_mode(WINDOW_SIZE)
+            pygame.display.set_caption(APP_NAME) # Set title and window size
+            clock = pygame.time.Clock() # Game clock
+
+            for card_no, symbol_names, seed, strategy, card_profile_folder in jobs:
+                start_time = time.time()
+                random.seed(f"{seed}-{card_no}")
+                rim_colour = choose_rim_colour()
+                telemetry = CardTelemetry()
+                with card_profiler(card_profile_folder, card_no, symbol_names, seed, strategy):
+                    card = gobble_loop(clock, window, assets, card_outer, symbol_names, rim_colour, strategy, telemetry)
+                if card is None:
+                    return results # Window was closed, so stop generating cards
+                writer.submit(window, export_path(card_no), copy=True, on_written=exported(card_no)) # Export to png. A copy, as the next card is drawn on the window
+                record({'Card #': card_no, 'Symbols': symbol_names, 'Attempts': telemetry.attempts, 'Seconds': time.time() - start_time,
+                        'Layout': card_to_layout(card, rim_colour, CARD_CENTRE, RING_RADIUS), 'Telemetry': telemetry.to_dict()})
+        elif workers == 1:
+            for job in jobs:
+                record(make_card(assets, card_outer, *job, writer=writer, on_written=exported(job[0])))
+        else:
+            # Each worker loads the assets once, then generates whole cards independently.
+            # Spawn (rather than fork) the workers, as SDL may already be initialised in this process
+            with multiprocessing.get_context('spawn').Pool(workers, initializer=_init_worker, initargs=(symbol_names_needed, symbols_per_card)) as pool:
+                for result in pool.imap(_make_card_in_worker, jobs):
+                    writer.submit_encoded(result.pop('Png'), export_path(result['Card #']), on_written=exported(result['Card #'])) # Encoded by the worker, written here like the rest
+                    record(result)
+                # Let the workers exit on their own. SDL turns SIGTERM into a quit event, so terminate() would hang
+                pool.close()
+                pool.join()
+    finally:
+        finish_writes() # Even if the run is stopped, so every card queued is written (or its error reported)
+    return results
+
+
+def export_path(card_no: int) -> str:
+    """
+    Returns the path a card's image is exported to
+    """
+    return os.path.join(OUTPUT_FOLDER, f"card_{card_no}.png")
+
+def remove_stale_exports(card_nos: list) -> list:
+    """
+    Deletes the exported images of cards that are not in card_nos, e.g. because a smaller deck has been generated since.
+    gobble_to_pdf prints every card image in the export folder, so they would otherwise be mixed in with the current deck.
+
+    Parameters:
+        card_nos (list(int)): Card numbers of the current template
+
+    Returns:
+        removed_card_nos (list(int)): Card numbers whose images were deleted, in order
+    """
+    keep = set(card_nos)
+    removed_card_nos = []
+    for fn in os.listdir(OUTPUT_FOLDER):
+        match = re.fullmatch(r'card_(\d+)\.png', fn)
+        if match and int(match.group(1)) not in keep:
+            os.remove(os.path.join(OUTPUT_FOLDER, fn))
+            removed_card_nos.append(int(match.group(1)))
+    return sorted(removed_card_nos)
+
+
+def read_template(cache_path=TEMPLATE_CACHE) -> tuple:
+    """
+    Reads the gobble template and the replacements of the template's symbol names with ours (the 'Replacements' sheet).
+    The xlsx is only parsed (and pandas only imported) if it has changed since it was last cached (see template_cache).
+
+    Parameters:
+        cache_path (str): Path to the cache of the parsed template. If None, the xlsx is always parsed
+
+    Returns:
+        (template, replacement_dict) (tuple(dict, dict)): Template, Key = card number, Value = list of template symbol names,
+            and Key = template symbol name, Value = our symbol name
+    """
+    if cache_path is not None:
+        cached = load_template_cache(cache_path, GOBBLE_TEMPLATE)
+        if cached is not None:
+            return cached
+
+    import pandas as pd # Slow to import, so only done when needed
+
     raw = pd.read_excel(GOBBLE_TEMPLATE, sheet_name=['Template', 'Replacements'])
-    template = raw['Template'] # Dobble template with dobble symbol names
+    template = {int(row[0]): list(row[1:]) for row in raw['Template'].values} # Dobble template with dobble symbol names
     replacements = raw['Replacements'] # Replacements mapping TODO: take file names and map randomly, if user does not want to set it
     
     replacement_dict = {} # Declare replacement dict
@@ -72,195 +337,242 @@ def gobble(card_nos=None):
     for temp_item, repl_item in zip(replacements.to_dict()['List of Items'].values(), replacements.to_dict()['To Replace With'].values()):
         replacement_dict[temp_item] = repl_item
 
-    customised_template = template.replace(replacement_dict) # Replace template with our values
-    if card_nos is not None:
-        customised_template = customised_template.loc[customised_template['Card #'].isin(card_nos)]
+    if cache_path is not None:
+        save_template_cache(cache_path, GOBBLE_TEMPLATE, template, replacement_dict)
 
-    # print(f"Doing the following cards:")
-    # msg = card_nos if card_nos is not None else "All"
-    # print(msg)
-    # print(customised_template)
-    # return
+    return template, replacement_dict
 
-    #################
-    # Preliminaries #
-    #################
 
-    # Make sure all images are cropped to their content (i.e. no empty space around each image)
-    autocropper = AutoCropper(INPUT_FOLDER_NAME)
-    autocropper.crop(f'{INPUT_FOLDER_NAME}_cropped')
+def generate_template(order: int, replacements=None, folder_name=f'{INPUT_FOLDER_NAME}_cropped') -> tuple:
+    """
+    Generates a template as the projective plane of the given order (see projective_plane.projective_plane), instead of reading
+    the xlsx. Card n is line n - 1 of the plane, and its symbols are named 'Symbol 1', 'Symbol 2' etc. by point number.
 
-    # Load all images
-    assets = Assets(f'{INPUT_FOLDER_NAME}_cropped')
-    assets.normalise_images(CARD_RADIUS, SYMBOLS_PER_CARD)
+    Each symbol is replaced by one of our images automatically: the images in folder_name, in alphabetical order, are handed out
+    to the symbols in order, skipping any images already used by the replacements overrides.
 
-    # Load static images too, create sprites for each (use Symbol class so mask generated automatically)
-    static_images = Assets('static_images')
-    static_images.normalise_images(CARD_RADIUS, 1) # Make sure each of these static images are the same size as the window
-    # card_circle = Symbol(static_images.get_asset_from_name('card_circle'), pos_x=WINDOW_WIDTH/2, pos_y=WINDOW_HEIGHT/2)
+    Parameters:
+        order (int): Order of the plane, must be a prime power. Gives order^2 + order + 1 cards of order + 1 symbols each
+        replacements (dict): Key = template symbol name (e.g. 'Symbol 1'), Value = our symbol name, to use instead of the automatic one
+        folder_name (str): Folder of (cropped) symbol images, relative to this file (or absolute)
 
-    # Set title and window size
-    pygame.display.set_caption(APP_NAME)
-    # WINDOW = pygame.display.set_mode(WINDOW_SIZE)
+    Returns:
+        (template, replacement_dict) (tuple(dict, dict)): Same as read_template
+    """
+    cards = projective_plane(order)
+    no_symbols = order**2 + order + 1
+    template = {card_no: [f"Symbol {point + 1}" for point in row] for card_no, row in enumerate(cards.tolist(), start=1)}
 
-    clock = pygame.time.Clock() # Game clock
+    replacement_dict = dict(replacements or {})
+    used = set(replacement_dict.values())
+    unused_names = (name for name in sorted(Assets(folder_name).names) if name not in used)
+    for point in range(no_symbols):
+        symbol_name = f"Symbol {point + 1}"
+        if symbol_name not in replacement_dict:
+            replacement_dict[symbol_name] = next(unused_names, None)
+    if None in replacement_dict.values():
+        raise Exception(f"A template of order {order} needs {no_symbols} symbols, but there are not enough images in {folder_name}.")
 
-    ###########################################################
-    # Load in dobble template, do necessary name replacements #
-    ###########################################################
-    for i in customised_template.values:
-        card_no = i[0]
-        symbol_names = i[1:]
-        start_time = time.time()
-        rim_colour = None
-        while rim_colour is None or rim_colour == "white":
-            rim_colour = random.choice(list(Colours)) # Randomise colour
-        gobble_loop(clock, assets, static_images, card_no, symbol_names, rim_colour)
-        end_time = time.time()
-        print(f"Card {card_no} took {end_time - start_time} seconds to run.")
+    return template, replacement_dict
 
-    
-    
-def gobble_loop(clock: pygame.time.Clock, assets: Assets, static_images: Assets,
-                card_no: int, symbol_names: list, rim_colour: str):
+
+def load_template(card_nos=None) -> dict:
     """
-    This function is executed when main.py is run
+    Loads the gobble template and replaces the template's symbol names with ours (from the 'Replacements' sheet).
 
-    Flow: TODO: Finish
-        1. Load all assets (images) into memory and normalise sizes
-        2. Create the base pygame app
-        3.  ....
+    Parameters:
+        card_nos (list[int]): Only keep these card numbers. If left as None, all cards are kept
+
+    Returns:
+        customised_template (dict): Key = card number, Value = list of symbol names
+    """
+    template, replacement_dict = read_template()
+    return customise_template(template, replacement_dict, card_nos)
+
+
+def customise_template(template: dict, replacement_dict: dict, card_nos=None) -> dict:
+    """
+    Replaces the template's symbol names with ours, see load_template.
 
     Parameters:
-        TODO:
+        template (dict): Template with template symbol names (see read_template)
+        replacement_dict (dict): Key = template symbol name, Value = our symbol name
+        card_nos (list[int]): Only keep these card numbers. If left as None, all cards are kept
+
+    Returns:
+        customised_template (dict): Key = card number, Value = list of symbol names
     """
+    customised_template = {}
+    for card_no, template_row in template.items():
+        if card_nos is None or card_no in card_nos:
+            customised_template[card_no] = [replacement_dict.get(name, name) for name in template_row] # Replace template with our values
 
-    #################
-    # Preliminaries #
-    #################
-    card_outer = Symbol(static_images.get_asset_from_name('card_outer'), pos_x=WINDOW_WIDTH/2, pos_y=WINDOW_HEIGHT/2) # Outer card surface (for collisions)
+    return customised_template
 
 
-    #################
-    # Main run loop #
-    #################
+def load_assets(folder_name=f'{INPUT_FOLDER_NAME}_cropped', prefetch=None, cache_folder=ASSET_CACHE, symbols_per_card=SYMBOLS_PER_CARD) -> tuple:
+    """
+    Indexes the symbol images (each is loaded and normalised on first use), and creates the card outer symbol used for boundary collisions.
 
-    run = True # Run while this is true
-    is_first_run = True # Do some things once per run, such as create Card instance
-    is_card_valid = False # A flag for when a valid card is found
+    Parameters:
+        folder_name (str): Folder of (cropped) symbol images, relative to this file (or absolute)
+        prefetch (list(str)): Names of the symbols to load and normalise straight away, e.g. all symbols of the cards to generate
+        cache_folder (str): Folder of the on-disk cache of normalised images (see asset_cache). If None, nothing is cached
+        symbols_per_card (int): Number of symbols per card, the images are sized to share a card between this many
 
-    while run:
-        clock.tick(FPS) # Tick clock
+    Returns:
+        (assets, card_outer) (tuple(Assets, Symbol)): Normalised symbol assets and the card outer symbol
+    """
+    # Index all images, only load the ones needed
+    assets = Assets(folder_name, cache_folder=cache_folder)
+    assets.normalise_images(CARD_RADIUS, symbols_per_card)
+    if prefetch is not None:
+        assets.prefetch(prefetch)
 
-        #################
-        # Handle events #
-        #################
+    # Load static images too, create sprites for each (use Symbol class so mask generated automatically)
+    static_images = Assets('static_images', cache_folder=cache_folder)
+    static_images.normalise_images(CARD_RADIUS, 1) # Make sure each of these static images are the same size as the window
+    card_outer = Symbol(static_images.get_asset_from_name('card_outer'), pos_x=WINDOW_WIDTH/2, pos_y=WINDOW_HEIGHT/2) # Outer card surface (for collisions)
 
-        for event in pygame.event.get():
-            # Exit game
-            if event.type == pygame.QUIT:
-                run = False
-                pygame.quit()
+    return assets, card_outer
 
 
-        ###########################
-        # Update/create necessary things # 
-        # (e.g. variables)        #
-        ###########################
-
-        # Create an example card once
-        if is_first_run:
-            # Get chosen images
-            assets_for_card = assets.get_assets_from_name(
-                # ['MANGO', 'CRANE', 'DARTH VADER', 'GORILLA', 'REKHAS CHILLI', 'MR BURNS', 'GINGY', 'GLASSI']
-                list(symbol_names)
-                # ['REKHAS CHILLI', 'MR BURNS', 'GINGY', 'GLASSI']
-            ) 
-
-            # Generate Symbol instances with default scale, rotation and position 
-            sprites = [Symbol(a) for a in assets_for_card] 
-            card = Card(sprites, radius=CARD_RADIUS, symbols_per_card=SYMBOLS_PER_CARD)           
-
-        
-        outside_card_circle = spritecollide(card_outer, card, False, collide_mask) # Calculate if any sprite is outside of the card circle
-        collisions = card.calc_collisions() # Calculate collisions
-
-        # Regenerate if collisions
-        if card.has_collisions() or len(outside_card_circle) > 0:
-            # card.regenerate_card_v1() # FIXME: version 1 = regenerate whole card. May find problematic, then can try regenerating specific symbols.
-            card.regenerate_card_v2()
+def choose_rim_colour() -> str:
+    """
+    Returns the name of a random (non-white) colour for the card rim
+    """
+    rim_colour = None
+    while rim_colour is None or rim_colour == "white":
+        rim_colour = random.choice(list(Colours)) # Randomise colour
+    return rim_colour
+
+
+def make_card(assets: Assets, card_outer: Symbol, card_no: int, symbol_names: list, seed, strategy='v2', profile_folder=None,
+              writer=None, encode=False, on_written=None) -> dict:
+    """
+    Generates, renders and exports a single card headless (or encodes it, for another process to export).
+
+    Parameters:
+        assets (Assets): Normalised symbol assets
+        card_outer (Symbol): Symbol of the area outside the card circle (for collisions)
+        card_no (int): Card number, used for the output filename
+        symbol_names (list(str)): Names of the symbols on this card
+        seed (int): Seed of the run. The card's random state is seeded from this and the card number
+        strategy (str): How to regenerate rejected cards, see engine.STRATEGIES
+        profile_folder (str): Folder to write a CPU profile and memory allocation snapshot of this card to. If None, it is not profiled
+        writer (CardWriter): Exports the card in the background. If None, it is exported before returning
+        encode (bool): Return the card encoded as a png ('Png' in the result) instead of exporting it, e.g. from a worker process,
+            so it is written by the parent's CardWriter like every other card
+        on_written (function): Called once the card has been written by writer, see CardWriter.submit. Only used with a writer
+
+    Returns:
+        result (dict): Card number, symbol names, number of attempts, seconds taken, layout (see layout_store.card_to_layout)
+            and metrics (see telemetry.CardTelemetry) for this card. Also 'Png' (bytes) if encode
+    """
+    start_time = time.time()
+    random.seed(f"{seed}-{card_no}")
+    rim_colour = choose_rim_colour()
+
+    telemetry = CardTelemetry()
+    with card_profiler(profile_folder, card_no, symbol_names, seed, strategy):
+        card, attempts = generate_card(assets, card_outer, symbol_names, CARD_RADIUS, len(symbol_names), strategy=strategy,
+                                       telemetry=telemetry)
+        surface = render_card(card, rim_colour, WINDOW_SIZE, CARD_RADIUS, RING_RADIUS) # Render offscreen, once
+        if encode:
+            png = io.BytesIO()
+            pygame.image.save(surface, png, os.path.basename(export_path(card_no))) # The name tells pygame which format to encode to
+        elif writer is None:
+            pygame.image.save(surface, export_path(card_no)) # Export to png
         else:
-            ratio_cover = card.card_ratio_cover() # Calculate card cover of symbols
-            # Regenerate if not enough cover
-            if ratio_cover < 0.22: 
-                card.regenerate_card_v2()
-            else:
-                is_card_valid = True # A flag for when a card is valid
-        
+            writer.submit(surface, export_path(card_no), on_written=on_written)
+
+    result = {'Card #': card_no, 'Symbols': symbol_names, 'Attempts': attempts, 'Seconds': time.time() - start_time,
+              'Layout': card_to_layout(card, rim_colour, CARD_CENTRE, RING_RADIUS), 'Telemetry': telemetry.to_dict()}
+    if encode:
+        result['Png'] = png.getvalue()
+    return result
 
-        # TODO: Make the code quicker
-        # TODO: Try some smarter methods
-        #       Modify parameters of the noise
-        #       Only change the symbols that are colliding, rather than the whole card - hreshold to 10 tries (or something) before regenerating whole card again
-        #       Tweak cover threshold
 
+def card_profiler(profile_folder: str, card_no: int, symbol_names: list, seed, strategy: str):
+    """
+    Returns a context manager that profiles a single card (see profiling.profiled), or does nothing if profile_folder is None
+    """
+    if profile_folder is None:
+        return nullcontext()
+    tags = {'Card #': card_no, 'Symbols': symbol_names, 'Seed': seed, 'Strategy': strategy}
+    return profiled(profile_folder, f"card_{card_no}", tags)
+
+
+#####################
+# Worker processes  #
+#####################
+_worker_assets = None # (assets, card_outer), loaded once per worker process
 
+def _init_worker(prefetch: list, symbols_per_card: int):
+    """
+    Initialiser for worker processes. Loads the assets once per worker.
+
+    Parameters:
+        prefetch (list(str)): Names of the symbols of the cards in this run, see load_assets
+        symbols_per_card (int): Number of symbols per card in this run, see load_assets
+    """
+    global _worker_assets
+    _worker_assets = load_assets(prefetch=prefetch, symbols_per_card=symbols_per_card)
 
-                
-        
+def _make_card_in_worker(job: tuple) -> dict:
+    """
+    Generates a single card in a worker process, and returns it encoded for the parent process to export. See make_card
 
-            # Print out collisions
-        #     for sprite_a, colliding_sprites in collisions.items():
-        #         if len(colliding_sprites) > 0:
-        #             for sprite_b in colliding_sprites:
-        #                 print(f"{sprite_a.name} colliding with {sprite_b.name}")  
-        # else:
-        #     print("No collisions")
-            # run = False # TODO: Renable once happy code works
+    Parameters:
+        job (tuple): (card_no, symbol_names, seed, strategy, profile_folder)
+    """
+    assets, card_outer = _worker_assets
+    return make_card(assets, card_outer, *job, encode=True)
 
-        # Check distribution is good (i.e. not too much whitespace) 
-        # TODO: Probably use pixel values and set a threshold of some %
 
+def gobble_loop(clock: pygame.time.Clock, window: pygame.Surface, assets: Assets, card_outer: Symbol,
+                symbol_names: list, rim_colour: str, strategy: str = 'v2', telemetry: CardTelemetry = None):
+    """
+    Interactive viewer on top of the generation engine. Draws every placement attempt for a single card to the window.
 
-        is_first_run = False # Don't run certain blocks again (e.g. creating card)
+    Flow:
+        1. Run one attempt of the search (see engine.iter_card_attempts)
+        2. Draw the attempt to the window, black background if rejected and white if accepted
+        3. Repeat until a valid card is found
+
+    Parameters:
+        clock (Clock): Game clock, limits the loop to FPS
+        window (Surface): Window Surface to draw on
+        assets (Assets): Normalised symbol assets
+        card_outer (Symbol): Symbol of the area outside the card circle (for collisions)
+        symbol_names (list(str)): Names of the symbols on this card
+        rim_colour (str): Name of the colour of the card rim
+        strategy (str): How to regenerate rejected cards, see engine.STRATEGIES
+        telemetry (CardTelemetry): Records the metrics of the search, if given
+
+    Returns:
+        card (Card): The valid card, which is left drawn on the window. None if the window was closed
+    """
+    for card, is_card_valid in iter_card_attempts(assets, card_outer, symbol_names, CARD_RADIUS, len(symbol_names),
+                                                  strategy=strategy, telemetry=telemetry):
+        clock.tick(FPS) # Tick clock
 
         #################
-        # Draw graphics #
+        # Handle events #
         #################
+        for event in pygame.event.get():
+            # Exit game
+            if event.type == pygame.QUIT:
+                pygame.quit()
+                return None
 
-        # Show a black background if card is not valid
-        if not is_card_valid:
-            WINDOW.fill(Colours["black"])
-        # Show a white background if card is valid and don't draw the outer_card thing
-        else:
-            WINDOW.fill(Colours["white"])
-        # Clear screen
-        
-
-        # Draw card circle and card outer
-        # pygame.draw.circle(WINDOW, 
-        #     (255, 255, 255), 
-        #     (WINDOW_WIDTH / 2, WINDOW_HEIGHT / 2),
-        #     card.radius
-        # )
-        # WINDOW.blit(card_circle.image, card_circle.rect)
-        # WINDOW.blit(card_outer.image, card_outer.rect) # Outer boundary (for collision detection)
-        pygame.draw.circle(WINDOW, Colours[rim_colour], (WINDOW_WIDTH/2, WINDOW_HEIGHT/2), RING_RADIUS) # Card rim
-        pygame.draw.circle(WINDOW, Colours["white"], (WINDOW_WIDTH/2, WINDOW_HEIGHT/2), CARD_RADIUS) # Card circle
-
-        card.draw(WINDOW) # Draw card symbols
-            
-        # break
-        
-        ##########################
-        # Last things to execute #
-        ##########################
+        #################
+        # Draw graphics #
+        #################
+        render_card(card, rim_colour, WINDOW_SIZE, CARD_RADIUS, RING_RADIUS, surface=window, is_card_valid=is_card_valid)
         pygame.display.update()
-        # pygame.display.flip()
 
-        if is_card_valid:
-            pygame.image.save(WINDOW, os.path.join(OUTPUT_FOLDER, f"card_{card_no}.png")) # Export to png
-            run = False # Stop run
+    return card
 
 
 ###################
@@ -1,7 +1,17 @@
+import argparse
+import hashlib
+import json
+import multiprocessing
 import os
+import re
 import time
 
 from fpdf import FPDF
+from PIL import Image
+
+from assets import Assets, abs_path, file_hash
+from layout_renderer import is_renderable, render_layout
+from streaming_pdf import StreamingPDF
 
 # A4 page size, mm
 PAGE_W = 210
@@ -9,92 +19,393 @@ PAGE_H = 297
 PAGE_SIZE = (PAGE_W, PAGE_H)
 
 CARD_D = 85 # Card diamter on page, mm
-CARDS_PER_ROW = 2 # Number of cards on the same row on the page
-CARDS_PER_COL = 3 # Number of cards on the same column on the page
-CARDS_PER_PAGE = CARDS_PER_ROW*CARDS_PER_COL # Number of cards on a page
-GAP_BETWEEN_CARDS = 5 # Gap between cards on grid, mm
-
-# The max size of the content area
-CONTENT_W = CARDS_PER_ROW*CARD_D + (CARDS_PER_ROW - 1)*GAP_BETWEEN_CARDS
-CONTENT_H = CARDS_PER_COL*CARD_D + (CARDS_PER_COL - 1)*GAP_BETWEEN_CARDS
-
-# Where to start placing images from, so that it all gets centred
-X_STARTING = (PAGE_W-CONTENT_W)/2
-Y_STARTING = (PAGE_H-CONTENT_H)/2
+GAP_BETWEEN_CARDS = 5 # Gap between cards on grid, mm. As many cards as fit on the page are placed (2 x 3 on A4)
+PRINT_DPI = 300 # Resolution images are embedded at, dots per inch. Larger images are downsampled to this
+PRINT_JPEG_QUALITY = 92 # Quality images are encoded at for printing (the cards are mostly photos, so jpeg is much smaller than png)
+MM_PER_INCH = 25.4
 
 CARD_FOLDER_NAME = 'export' # Name of folder containing card images (generated from gobble)
+LAYOUT_STORE_PATH = os.path.join('cache', 'layouts.json') # Layouts of the exported cards (written by gobble, see layout_store)
+SYMBOL_FOLDER_NAME = 'images_cropped' # Source images of the symbols, cropped to their content (see gobble's autocropper), which cards are rendered from
 CARD_BACK_FOLDER_NAME = 'static_images'
-CARD_BACK_FILENAME = 'card_back.png'
+CARD_BACK_FILENAME = 'card_back.PNG'
 
 OUTPUT_FOLDER_NAME = 'printable'
 OUTPUT_FILENAME = 'gobble_cards.pdf'
+OUTPUT_CHANGED_FILENAME = 'gobble_cards_changed.pdf' # Only the sheets holding specific cards, e.g. the ones that have changed
+PRINT_CACHE_FOLDER_NAME = os.path.join('cache', 'print') # Images prepared for printing, keyed by content hash and size
+MIN_IMAGES_FOR_POOL = 4 # Fewer images than this are prepared in this process, as starting workers would take longer
+
+
+class DocumentBuffer():
+    """
+    Stands in for the string FPDF builds the document in. FPDF adds to it a line at a time, which copies the whole document
+    so far each time (so embedding the images took seconds). The lines are kept in a list instead, and only joined once at the end.
+    Supports the operations FPDF uses on it: +=, len() and encode()
+    """
+
+    def __init__(self) -> None:
+        """
+        Constructor for DocumentBuffer class.
+        """
+        self.parts = []
+        self.length = 0 # Number of characters, FPDF uses it for the byte offset of each object
+
+    def __iadd__(self, s: str):
+        self.parts.append(s)
+        self.length += len(s)
+        return self
+
+    def __len__(self) -> int:
+        return self.length
+
+    def encode(self, encoding: str) -> bytes:
+        return ''.join(self.parts).encode(encoding)
+
+
+class PrintPDF(FPDF):
+    """
+    FPDF that builds the document in a DocumentBuffer
+    """
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.buffer = DocumentBuffer()
+
+
+def gobble_to_pdf(card_folder=CARD_FOLDER_NAME, output_folder=OUTPUT_FOLDER_NAME, card_nos=None, print_dpi=PRINT_DPI, workers=None,
+                  cache_folder=PRINT_CACHE_FOLDER_NAME, page_size=PAGE_SIZE, stream=False, pages_per_volume=None,
+                  layout_store=LAYOUT_STORE_PATH, symbol_folder=SYMBOL_FOLDER_NAME):
+    """
+    Lays out all card images (fronts, each followed by a page of card backs) on printable pages of a pdf.
+    Cards are placed in card number order, so each card is always on the same sheet (pair of pages).
+    With stream, pages are written to disk as they are made (see streaming_pdf.StreamingPDF), so no image data is held in
+    memory, rather than the whole pdf being built in memory first. Only a few numbers per page and image are kept.
+
+    Every image is first downsampled to print_dpi at the size it is printed (CARD_D), in parallel (see prepare_images).
+    Card fronts with a stored layout are instead rendered at print_dpi from the symbols' source images (see card_layouts), so
+    they stay sharp beyond the resolution the cards were exported (and their layouts searched) at.
+    Each distinct image is embedded in the pdf once, so the card back is stored a single time and referenced on every back page.
+
+    Parameters:
+        card_folder (str): Folder of card images, relative to this file (or absolute)
+        output_folder (str): Folder to write the pdf to, relative to this file (or absolute)
+        card_nos (list[int]): Only rebuild the sheets holding these card numbers (e.g. the cards gobble regenerated), laid out
+            exactly as in the full pdf, and write them to OUTPUT_CHANGED_FILENAME so just those sheets can be reprinted.
+            If None, the full pdf of all cards is rebuilt
+        print_dpi (int): Resolution to embed the images at, dots per inch. If None, they are embedded at full resolution
+        workers (int): Number of worker processes to prepare the images with. If None, one per CPU
+        cache_folder (str): Folder to keep the prepared images in, relative to this file (or absolute)
+        page_size (tuple(2)): (width, height) of the pages, mm. As many cards as fit are placed on each page
+        stream (bool): Write each page as soon as it is made. Needs print_dpi, as only prepared (jpeg) images can be streamed
+        pages_per_volume (int): Split the pdf into volumes of this many pages (even, so a sheet is never split),
+            named e.g. gobble_cards_001.pdf. If None, a single pdf is written
+        layout_store (str): Path to the layouts of the cards, relative to this file (or absolute).
+            If None, every card front is downsampled from its exported image
+        symbol_folder (str): Folder of the symbols' source images, relative to this file (or absolute)
+
+    Returns:
+        summary (dict): 'Sheets' (numbers of the sheets written, starting at 1), 'Images prepared' (the rest were already prepared),
+            'Cards from layouts' (card fronts rendered from their layouts rather than their exported images),
+            'Paths' of the pdf (or of each volume), total 'Bytes', and 'Seconds' taken
+    """
+    if stream and print_dpi is None:
+        raise Exception("Streaming needs a print_dpi, as only prepared (jpeg) images can be streamed into the pdf.")
+    if pages_per_volume is not None and (pages_per_volume < 2 or pages_per_volume % 2 != 0):
+        raise Exception(f"pages_per_volume must be an even number of at least 2 (each sheet is a page of fronts and a page of backs), not {pages_per_volume}.")
+
+    start_time = time.time()
 
-def gobble_to_pdf():
     # Check that an export folder exists
-    OUTPUT_FOLDER = os.path.join(os.path.dirname(__file__), OUTPUT_FOLDER_NAME)
+    OUTPUT_FOLDER = os.path.join(os.path.dirname(__file__), output_folder)
     if not os.path.exists(OUTPUT_FOLDER):
         os.makedirs(OUTPUT_FOLDER) 
     
-    # Create pdf instance
-    pdf = FPDF(orientation='P', unit='mm', format=PAGE_SIZE)
-
     # Grab all necessary images
-    images_dirname_rel = CARD_FOLDER_NAME
-    images_dirname_abs = os.path.join(os.path.dirname(__file__), CARD_FOLDER_NAME)
-    image_filenames = os.listdir(images_dirname_abs)
+    images_dirname_rel = card_folder
+    images_dirname_abs = os.path.join(os.path.dirname(__file__), card_folder)
+    image_filenames = sorted(os.listdir(images_dirname_abs), key=card_sort_key)
     image_fps = [os.path.join(images_dirname_abs, fn) for fn in image_filenames]
 
     card_back_fp = os.path.join(os.path.dirname(__file__), CARD_BACK_FOLDER_NAME, CARD_BACK_FILENAME) # Get card back
 
-    # Create relevant pages in batches of 6. If the final group is less than 6, create a page of that many cards.
-    remaining = len(image_fps) # Number of cards to be placed on a page for printing
-    curr_pos = 0 # Keep track of where to start in the list of card images for each loop
-    while remaining > 0: # Keep looping while there are cards to be placed
-        image_fps_for_grid = image_fps[curr_pos:curr_pos+CARDS_PER_PAGE]
-        image_fns_for_grid = image_filenames[curr_pos:curr_pos+CARDS_PER_PAGE]
-        card_back_fps_for_grid = [card_back_fp for _ in range(len(image_fps_for_grid))]
+    # Split the cards into sheets of as many as fit on a page (6 on A4). The final sheet gets however many cards are left.
+    cards_per_page = len(page_grid(page_size))
+    sheets = {} # Key = sheet number, Value = (card image file paths, card image filenames)
+    for curr_pos in range(0, len(image_fps), cards_per_page):
+        image_fns_for_grid = image_filenames[curr_pos:curr_pos+cards_per_page]
+        if card_nos is not None and not any(card_sort_key(fn)[0] in card_nos for fn in image_fns_for_grid):
+            continue # None of the requested cards are on this sheet
+        sheets[curr_pos // cards_per_page + 1] = (image_fps[curr_pos:curr_pos+cards_per_page], image_fns_for_grid)
+
+    # Prepare every image before the pdf is assembled
+    card_fps = [fp for image_fps_for_grid, _ in sheets.values() for fp in image_fps_for_grid]
+    layouts = {}
+    if print_dpi is not None and layout_store is not None:
+        layouts = card_layouts(card_fps, layout_store, symbol_folder)
+    prepared_fps, no_prepared = prepare_images(card_fps + [card_back_fp], print_dpi, workers, prune=card_nos is None,
+                                               cache_folder=cache_folder, layouts=layouts)
+
+    # Work out which sheets go in which file
+    output_filename = OUTPUT_FILENAME if card_nos is None else OUTPUT_CHANGED_FILENAME
+    sheet_nos = list(sheets)
+    if pages_per_volume is None:
+        volumes = [(os.path.join(OUTPUT_FOLDER, output_filename), sheet_nos)]
+    else:
+        stem = os.path.splitext(output_filename)[0]
+        for fn in os.listdir(OUTPUT_FOLDER): # Remove the volumes of an earlier export, which may have had more of them
+            if re.fullmatch(rf'{re.escape(stem)}_\d+\.pdf', fn):
+                os.remove(os.path.join(OUTPUT_FOLDER, fn))
+        sheets_per_volume = pages_per_volume // 2
+        volumes = [(os.path.join(OUTPUT_FOLDER, f"{stem}_{i // sheets_per_volume + 1:03d}.pdf"), sheet_nos[i:i+sheets_per_volume])
+                   for i in range(0, len(sheet_nos), sheets_per_volume)]
+
+    for output_fp, volume_sheet_nos in volumes:
+        # Create pdf instance
+        pdf = StreamingPDF(output_fp, page_size) if stream else PrintPDF(orientation='P', unit='mm', format=page_size)
 
-        add_page_and_populate(pdf, image_fps_for_grid, image_fns_for_grid) # Generate card fronts
-        add_page_and_populate(pdf, card_back_fps_for_grid) # Generate card backs
+        for sheet_no in volume_sheet_nos:
+            image_fps_for_grid, image_fns_for_grid = sheets[sheet_no]
+            card_back_fps_for_grid = [prepared_fps[card_back_fp] for _ in range(len(image_fps_for_grid))] # The same file, so embedded once
 
-        remaining -= len(image_fps_for_grid) # Decrement remaining counter each loop
-        curr_pos += CARDS_PER_PAGE # Increment current position, so start at right place in next loop
+            add_page_and_populate(pdf, [prepared_fps[fp] for fp in image_fps_for_grid], image_fns_for_grid, page_size) # Generate card fronts
+            add_page_and_populate(pdf, card_back_fps_for_grid, page_size=page_size) # Generate card backs
 
-    # Output to file
-    pdf.output(os.path.join(OUTPUT_FOLDER, OUTPUT_FILENAME), 'F')
+        # Output to file
+        if stream:
+            pdf.close()
+        else:
+            pdf.output(output_fp, 'F')
 
-def add_page_and_populate(pdf: FPDF, image_filepaths: list, image_filenames=None):
+    output_fps = [output_fp for output_fp, _ in volumes]
+    if card_nos is not None:
+        print(f"Sheets {sheet_nos} hold cards {sorted(card_nos)}, written to {[os.path.basename(fp) for fp in output_fps]}")
+
+    return {'Sheets': sheet_nos, 'Images prepared': no_prepared, 'Cards from layouts': len(layouts), 'Paths': output_fps,
+            'Bytes': sum(os.path.getsize(output_fp) for output_fp in output_fps), 'Seconds': time.time() - start_time}
+
+def page_grid(page_size: tuple) -> list:
     """
-    TODO: doc string
+    Returns where to place the cards on a page: as many as fit, GAP_BETWEEN_CARDS apart, with the grid centred on the page.
+
+    Parameters:
+        page_size (tuple(2)): (width, height) of the page, mm
+
+    Returns:
+        positions (list(tuple(2))): (x, y) of the top left of each card, mm, left to right then top to bottom
     """
+    page_w, page_h = page_size
+    cards_per_row = int((page_w + GAP_BETWEEN_CARDS) // (CARD_D + GAP_BETWEEN_CARDS)) # Number of cards on the same row on the page
+    cards_per_col = int((page_h + GAP_BETWEEN_CARDS) // (CARD_D + GAP_BETWEEN_CARDS)) # Number of cards on the same column on the page
+    if cards_per_row == 0 or cards_per_col == 0:
+        raise Exception(f"A page of {page_w} x {page_h} mm is too small for a card {CARD_D} mm across.")
 
-    pdf.add_page() # Create new page
+    # The max size of the content area
+    content_w = cards_per_row*CARD_D + (cards_per_row - 1)*GAP_BETWEEN_CARDS
+    content_h = cards_per_col*CARD_D + (cards_per_col - 1)*GAP_BETWEEN_CARDS
 
-    i = 0 # Go through list of image file paths one-by-one
+    # Where to start placing images from, so that it all gets centred
+    x_starting = (page_w-content_w)/2
+    y_starting = (page_h-content_h)/2
+
+    return [(x_starting + col*(CARD_D + GAP_BETWEEN_CARDS), y_starting + row*(CARD_D + GAP_BETWEEN_CARDS))
+            for row in range(cards_per_col) for col in range(cards_per_row)]
 
-    for row in range(CARDS_PER_COL):
-        for col in range(CARDS_PER_ROW):
-            x_pos = X_STARTING + col*(CARD_D + GAP_BETWEEN_CARDS) 
-            y_pos = Y_STARTING + row*(CARD_D + GAP_BETWEEN_CARDS)
+def print_size(print_dpi: int) -> int:
+    """
+    Returns the width (and height) in pixels of a card printed CARD_D wide at print_dpi
+    """
+    return round(CARD_D / MM_PER_INCH * print_dpi)
 
+def card_layouts(card_fps: list, layout_store: str, symbol_folder: str) -> dict:
+    """
+    Returns the stored layout of each exported card, where it can be rendered at any resolution instead (see layout_renderer).
+    A layout is only used if it is renderable and every symbol's source image is unchanged since it was made (by content hash),
+    otherwise the exported image is what was made from it. Nothing is loaded, the images are only hashed
+
+    Parameters:
+        card_fps (list(str)): Paths of the exported card images, named by card number (e.g. card_18.png)
+        layout_store (str): Path to the layouts of the cards (see layout_store.LayoutStore), relative to this file (or absolute)
+        symbol_folder (str): Folder of the symbols' source images, relative to this file (or absolute)
+
+    Returns:
+        layouts (dict): Key = card image file path, Value = (layout, symbol file paths). See prepare_images
+    """
+    layout_store = abs_path(layout_store)
+    if not os.path.exists(layout_store):
+        return {}
+    with open(layout_store, 'r') as f:
+        stored = json.load(f)
+    symbol_index = Assets(symbol_folder) # Only used to find each symbol's image file
+    hashes = {} # Key = file path, Value = content hash, so each image is only hashed once
+
+    layouts = {}
+    for fp in card_fps:
+        layout = stored.get(str(card_sort_key(os.path.basename(fp))[0]))
+        if layout is None or not is_renderable(layout):
+            continue
+        symbol_fps = {}
+        for s in layout['Symbols']:
             try:
-                pdf.image(image_filepaths[i], w=CARD_D, h=CARD_D, x=x_pos, y=y_pos) # Place image on page
-                if image_filenames is not None:
-                    pdf.set_xy(x_pos, y_pos)
-                    pdf.set_font('Arial', 'B', 8)
-                    pdf.set_text_color(0,0,0)
-                    pdf.write(5, f"{image_filenames[i]}")
-                # print(f"{i} Card placed at row {row} col {col}, position x={x_pos}mm y={y_pos}mm.") # Print a helpful message
-                i += 1 # Iterate counter, so can get next image on next lop
-            except IndexError as e:
-                print(f"{i} No more cards, so will break loop early")
-                return
+                symbol_fp = symbol_index.get_file_path_from_name(s['Name'])
+            except Exception:
+                break # Image no longer exists
+            if symbol_fp not in hashes:
+                hashes[symbol_fp] = file_hash(symbol_fp)
+            if hashes[symbol_fp] != s['Hash']:
+                break
+            symbol_fps[s['Name']] = symbol_fp
+        else:
+            layouts[fp] = (layout, symbol_fps)
+
+    return layouts
+
+def prepare_images(image_filepaths: list, print_dpi=PRINT_DPI, workers=None, prune=False, cache_folder=PRINT_CACHE_FOLDER_NAME, layouts=None) -> tuple:
+    """
+    Downsamples images to fit a card printed at print_dpi and encodes them as jpeg, over a pool of workers if there are enough of them.
+    Prepared images are kept in the cache folder by content hash and size, so each image is only prepared once
+    (and files with the same content share the same prepared file).
+    Images with a layout are rendered from it at that size instead, and kept by a hash of the layout (which holds the hash of
+    each symbol's image).
+
+    Parameters:
+        image_filepaths (list(str)): Paths of the images to prepare
+        print_dpi (int): Resolution to prepare the images for, dots per inch. If None, the images are used as they are
+        workers (int): Number of worker processes to prepare the images with. If None, one per CPU
+        prune (bool): Delete prepared images that are not in image_filepaths (e.g. of cards that have since changed)
+        cache_folder (str): Folder to keep the prepared images in, relative to this file (or absolute)
+        layouts (dict): Key = image file path, Value = (layout, symbol file paths) to render it from (see card_layouts). If None, none are
+
+    Returns:
+        (prepared_fps, no_prepared) (tuple(dict, int)): Key = image file path, Value = path of the image to embed,
+            and the number of images that had to be prepared (the rest were already in the cache)
+    """
+    if print_dpi is None:
+        return {fp: fp for fp in image_filepaths}, 0
+
+    cache_folder = abs_path(cache_folder)
+    if not os.path.exists(cache_folder):
+        os.makedirs(cache_folder)
+
+    if layouts is None:
+        layouts = {}
+
+    size = print_size(print_dpi)
+    prepared_fps = {}
+    jobs = {} # Key = prepared file path, Value = (source, prepared path, size)
+    for fp in image_filepaths:
+        if fp in prepared_fps:
+            continue
+        if fp in layouts:
+            digest = hashlib.sha1(json.dumps(layouts[fp][0], sort_keys=True).encode()).hexdigest()
+            prepared_fp = os.path.join(cache_folder, f"layout-{digest}-{size}px-q{PRINT_JPEG_QUALITY}.jpg")
+        else:
+            prepared_fp = os.path.join(cache_folder, f"{file_hash(fp)}-{size}px-q{PRINT_JPEG_QUALITY}.jpg")
+        prepared_fps[fp] = prepared_fp
+        if not os.path.exists(prepared_fp):
+            jobs[prepared_fp] = (layouts.get(fp, fp), prepared_fp, size)
+
+    # Prepare them, over a pool of workers if there are enough of them
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers > 1 and len(jobs) >= MIN_IMAGES_FOR_POOL:
+        with multiprocessing.get_context('spawn').Pool(min(workers, len(jobs))) as pool:
+            pool.map(prepare_image, jobs.values())
+            pool.close()
+            pool.join()
+    else:
+        for job in jobs.values():
+            prepare_image(job)
+
+    if prune:
+        in_use = {os.path.basename(prepared_fp) for prepared_fp in prepared_fps.values()}
+        for fn in os.listdir(cache_folder):
+            if fn not in in_use:
+                os.remove(os.path.join(cache_folder, fn))
+
+    return prepared_fps, len(jobs)
+
+def prepare_image(job: tuple) -> None:
+    """
+    Downsamples a single image to fit within size x size pixels (keeping its aspect ratio) and saves it as a jpeg.
+    Images already small enough keep their size. Transparent areas are made white, like the paper they are printed on.
+    A card with a layout is rendered at size x size pixels from it instead (see layout_renderer.render_layout).
+    Runs in worker processes, so only takes plain values.
+
+    Parameters:
+        job (tuple(3)): (source, prepared path, size). Source is the path of the image, or a (layout, symbol file paths) tuple
+    """
+    source, prepared_path, size = job
+    if isinstance(source, tuple):
+        layout, symbol_fps = source
+        flattened = render_layout(layout, symbol_fps, size)
+    else:
+        image = Image.open(source).convert('RGBA')
+        image.thumbnail((size, size), Image.LANCZOS) # Only ever shrinks
+        flattened = Image.new('RGB', image.size, 'white')
+        flattened.paste(image, mask=image.getchannel('A'))
+    flattened.save(f"{prepared_path}.tmp", format='JPEG', quality=PRINT_JPEG_QUALITY)
+    os.replace(f"{prepared_path}.tmp", prepared_path) # Written via a temporary file, so a crash never leaves a half written image
+
+def card_sort_key(filename: str) -> tuple:
+    """
+    Returns a key to sort card image filenames by card number (e.g. card_2.png before card_10.png).
+    Files without a number are sorted after the cards, by name
+
+    Parameters:
+        filename (str): Card image filename, e.g. card_18.png
+
+    Returns:
+        key (tuple(int, str)): (card number, filename). The card number is infinite if the filename has no number
+    """
+    match = re.search(r'(\d+)', filename)
+    return (int(match.group(1)) if match else float('inf'), filename)
+
+def add_page_and_populate(pdf: FPDF, image_filepaths: list, image_filenames=None, page_size=PAGE_SIZE):
+    """
+    Adds a page and places up to a page's worth of images on it in a grid (see page_grid), each CARD_D wide.
+
+    Parameters:
+        pdf (FPDF or StreamingPDF): Document to add the page to
+        image_filepaths (list(str)): Paths of the images to place, in grid order (left to right, then top to bottom)
+        image_filenames (list(str)): Labels to write at the top left of each image (e.g. the card filename). If None, no labels
+        page_size (tuple(2)): (width, height) of the page, mm
+    """
+
+    pdf.add_page() # Create new page
+
+    i = 0 # Go through list of image file paths one-by-one
+
+    for x_pos, y_pos in page_grid(page_size):
+        try:
+            pdf.image(image_filepaths[i], w=CARD_D, h=CARD_D, x=x_pos, y=y_pos) # Place image on page
+            if image_filenames is not None:
+                pdf.set_xy(x_pos, y_pos)
+                pdf.set_font('Arial', 'B', 8)
+                pdf.set_text_color(0,0,0)
+                pdf.write(5, f"{image_filenames[i]}")
+            # print(f"{i} Card placed at position x={x_pos}mm y={y_pos}mm.") # Print a helpful message
+            i += 1 # Iterate counter, so can get next image on next lop
+        except IndexError as e:
+            print(f"{i} No more cards, so will break loop early")
+            return
     
 ###################
 # App starts here #
 ###################
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Export the card images to a printable pdf.")
+    parser.add_argument('--stream', action='store_true', help="Write each page as it is made, so no image data is held in memory (only a few numbers per page and image)")
+    parser.add_argument('--page-size', type=float, nargs=2, default=PAGE_SIZE, metavar=('WIDTH', 'HEIGHT'), help="Page size in mm (default A4)")
+    parser.add_argument('--pages-per-volume', type=int, help="Split the pdf into volumes of this many pages (even)")
+    parser.add_argument('--dpi', type=int, default=PRINT_DPI, help="Resolution to embed the images at, dots per inch")
+    parser.add_argument('--no-layouts', action='store_true', help="Downsample the exported card images, rather than rendering the cards from their stored layouts")
+    args = parser.parse_args()
+
     start = time.time()
-    gobble_to_pdf()
+    summary = gobble_to_pdf(print_dpi=args.dpi, page_size=tuple(args.page_size), stream=args.stream, pages_per_volume=args.pages_per_volume,
+                            layout_store=None if args.no_layouts else LAYOUT_STORE_PATH)
     end = time.time()
+    print(f"Wrote {summary['Paths']} ({summary['Bytes']/1e6:.1f} MB, {summary['Images prepared']} images prepared, "
+          f"{summary['Cards from layouts']} cards rendered from their layouts) in {summary['Seconds']:.2f} seconds.")
     print(f"Program took {end - start} seconds to run.")
\ No newline at end of file
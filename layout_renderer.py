@@ -0,0 +1,55 @@
+from PIL import Image, ImageDraw
+from pygame.colordict import THECOLORS as Colours
+
+
+SCALE_RESAMPLE = Image.LANCZOS # Filter symbols are resized from their source images with (the sources are rarely the size they're printed at)
+ROTATE_RESAMPLE = Image.BICUBIC # Filter symbols are rotated with
+
+
+def is_renderable(layout: dict) -> bool:
+    """
+    Checks if a layout records the rim and every symbol as fractions of the card radius (see layout_store.card_to_layout),
+    so it can be rendered at any size. Layouts stored before they were recorded can't be
+
+    Parameters:
+        layout (dict): Layout of a card
+
+    Returns:
+        is_renderable (bool): True if render_layout can render it
+    """
+    return 'Rim radius' in layout and all('Offset' in s and 'Size' in s for s in layout['Symbols'])
+
+def render_layout(layout: dict, symbol_fps: dict, size: int) -> Image.Image:
+    """
+    Renders a card from its layout at any resolution, resampling each symbol from its source image rather than from the
+    images the layout was searched with. The card is drawn the same way as engine.render_card: a white square just holding
+    the rim, the card circle, then the symbols in layout order (later ones on top), rotated anticlockwise about their centres.
+
+    Parameters:
+        layout (dict): Layout of the card, must be renderable (see is_renderable)
+        symbol_fps (dict): Key = symbol name, Value = path of its source image (cropped to its content, like the assets)
+        size (int): Width (and height) of the rendered card in pixels
+
+    Returns:
+        image (Image): Rendered card, RGB
+    """
+    centre = size / 2
+    card_radius = centre / layout['Rim radius'] # The rim just fits, as it does the window
+
+    image = Image.new('RGB', (size, size), 'white')
+    draw = ImageDraw.Draw(image)
+    draw.ellipse((0, 0, size - 1, size - 1), fill=tuple(Colours[layout['Rim colour']])[:3]) # Card rim
+    draw.ellipse((centre - card_radius, centre - card_radius, centre + card_radius - 1, centre + card_radius - 1), fill='white') # Card circle
+
+    for s in layout['Symbols']:
+        with Image.open(symbol_fps[s['Name']]) as source:
+            symbol = source.convert('RGBA').convert('RGBa') # Premultiplied, so resampling doesn't bleed the colour of transparent pixels into the edges
+        width, height = (max(1, round(length * card_radius)) for length in s['Size'])
+        symbol = symbol.resize((width, height), SCALE_RESAMPLE)
+        symbol = symbol.rotate(s['Angle'], ROTATE_RESAMPLE, expand=True).convert('RGBA')
+
+        x = centre + s['Offset'][0] * card_radius
+        y = centre + s['Offset'][1] * card_radius
+        image.paste(symbol, (round(x - symbol.width/2), round(y - symbol.height/2)), symbol)
+
+    return image
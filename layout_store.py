@@ -0,0 +1,152 @@
+import json
+import os
+
+from assets import Assets, asset_hash
+from symbol import Symbol
+from card import Card
+
+
+class LayoutStore():
+    """
+    An on-disk store of accepted card layouts, so cards can be re-rendered without searching for a layout again.
+
+    Each entry is keyed by card number, and records the name and content hash of every symbol's image.
+    An entry is only used if the card still has the same symbols, all of those images are unchanged (and the card size is the same).
+
+    Attributes:
+        path (str): Path to the JSON file holding the layouts
+        layouts (dict): Key = card number (str), Value = layout dict (see card_to_layout)
+
+    Methods:
+        get -> dict: Returns the stored layout of a card, if it is still valid
+        put -> None: Stores the layout of a card
+        save -> None: Writes the store to disk
+    """
+
+    def __init__(self, path: str) -> None:
+        """
+        Constructor for LayoutStore class. Loads the store from disk if it exists.
+
+        Parameters:
+            path (str): Path to the JSON file holding the layouts
+        """
+        self.path = path
+        self.layouts = {}
+        if os.path.exists(self.path):
+            with open(self.path, 'r') as f:
+                self.layouts = json.load(f)
+
+    def get(self, card_no: int, symbol_names: list, assets: Assets, card_radius: int, symbols_per_card: int) -> dict:
+        """
+        Returns the stored layout of a card. Returns None (and drops the entry) if the card's symbols are no longer the ones
+        the layout was made for (e.g. the template or its replacements have changed), or any of their images have changed since.
+
+        Parameters:
+            card_no (int): Card number
+            symbol_names (list(str)): Names of the symbols the card has now (after replacements), in any order
+            assets (Assets): Symbol assets, to check the image hashes against
+            card_radius (int): Radius of the card the layout must have been made for
+            symbols_per_card (int): Number of symbols per card the layout must have been made for
+
+        Returns:
+            layout (dict): Layout of the card (see card_to_layout), or None if there is no valid one
+        """
+        layout = self.layouts.get(str(card_no))
+        if layout is None:
+            return None
+
+        is_valid = (layout['Card radius'] == card_radius and layout['Symbols per card'] == symbols_per_card
+                    and sorted(s['Name'] for s in layout['Symbols']) == sorted(symbol_names))
+        for s in layout['Symbols']:
+            if not is_valid:
+                break
+            try:
+                is_valid = asset_hash(assets.get_asset_from_name(s['Name'])) == s['Hash']
+            except Exception:
+                is_valid = False # Image no longer exists
+
+        if not is_valid:
+            del self.layouts[str(card_no)]
+            return None
+
+        return layout
+
+    def put(self, card_no: int, layout: dict) -> None:
+        """
+        Stores the layout of a card, replacing any existing one.
+
+        Parameters:
+            card_no (int): Card number
+            layout (dict): Layout of the card (see card_to_layout)
+        """
+        self.layouts[str(card_no)] = layout
+
+    def save(self) -> None:
+        """
+        Writes the store to disk (via a temporary file, so a crash never leaves a half written store)
+        """
+        directory = os.path.dirname(self.path)
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, 'w') as f:
+            json.dump(self.layouts, f, separators=(',', ':'))
+        os.replace(temp_path, self.path)
+
+
+def card_to_layout(card: Card, rim_colour: str, centre: tuple, ring_radius: float) -> dict:
+    """
+    Returns the parameters needed to rebuild a card exactly.
+
+    Besides the pixel positions and scales the card was searched at, the rim and each symbol are also recorded as fractions
+    of the card radius, measured from the centre of the card. These don't depend on the resolution the layout was searched at,
+    so the card can be rendered at any size from the original images (see layout_renderer).
+
+    Parameters:
+        card (Card): An accepted card
+        rim_colour (str): Name of the colour of the card rim
+        centre (tuple(2)): Centre of the card, pixels. Format = (x, y)
+        ring_radius (float): Radius of the card rim, pixels
+
+    Returns:
+        layout (dict): Card radius, symbols per card, rim colour, rim radius (fraction of the card radius), and the name,
+            image hash, position, angle and scale of each symbol, along with its 'Offset' from the centre and 'Size' before
+            rotating (both fractions of the card radius, format = [x, y] and [width, height])
+    """
+    centre_x, centre_y = centre
+    return {
+        'Card radius': card.radius,
+        'Symbols per card': card.symbols_per_card,
+        'Rim colour': rim_colour,
+        'Rim radius': ring_radius / card.radius,
+        'Symbols': [
+            {
+                'Name': s.name,
+                'Hash': asset_hash(s.asset),
+                'Pos': list(s.rect.center),
+                'Angle': s.angle,
+                'Scale': s.scale,
+                'Offset': [(s.rect.centerx - centre_x) / card.radius, (s.rect.centery - centre_y) / card.radius],
+                'Size': [s.scale * length / card.radius for length in s.asset['Surface'].get_size()],
+            }
+            for s in card
+        ],
+    }
+
+def card_from_layout(layout: dict, assets: Assets) -> Card:
+    """
+    Rebuilds a card from a stored layout, without searching.
+
+    Parameters:
+        layout (dict): Layout of the card (see card_to_layout)
+        assets (Assets): Normalised symbol assets
+
+    Returns:
+        card (Card): The rebuilt card
+    """
+    sprites = [
+        Symbol(assets.get_asset_from_name(s['Name']), s['Pos'][0], s['Pos'][1], s['Angle'], s['Scale'])
+        for s in layout['Symbols']
+    ]
+    return Card(sprites, radius=layout['Card radius'], symbols_per_card=layout['Symbols per card'])
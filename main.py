@@ -1,15 +1,28 @@
+import argparse
 import time
 import numbers
+from contextlib import nullcontext
 
 from gobble_to_pdf import gobble_to_pdf
 from gobble import gobble
+from profiling import PROFILE_MODES, make_profile_folder, profiled
+
+def main(profile=None, order=None):
+    """
+    Asks which cards to generate, generates them, then exports all cards to a printable pdf.
+    If only the changed cards are generated, only the sheets holding them are exported (see gobble_to_pdf).
+
+    Parameters:
+        profile (str): Profile mode of gobble() ('card' or 'run', see gobble). The pdf export is profiled too. If None, nothing is profiled
+        order (int): Generate the template as the projective plane of this order, rather than reading the xlsx (see gobble)
+    """
+    profile_folder = make_profile_folder() if profile is not None else None
 
-def main():
     # Ask user if want to generate all cards, or specific ones
     generate_all = None
     while generate_all is None:
-        answer = input("Would you like generate all cards? (Y or N): ")
-        if answer in ['Y', 'N']:
+        answer = input("Would you like generate all cards? (Y, N, or C for only the cards that have changed): ")
+        if answer in ['Y', 'N', 'C']:
             generate_all = answer
     
     # Generate all cards
@@ -18,9 +31,18 @@ def main():
         print("Generating all cards")
         start_gobble = time.time()
         print(f"Runnning gobble()")
-        gobble()
+        gobble(profile=profile, profile_folder=profile_folder, order=order)
         end_gobble = time.time()
         print(f"Generated all cards, took {end_gobble - start_gobble} seconds to run")
+    # Generate only the cards whose images or template rows have changed
+    elif generate_all == 'C':
+        print("Generating changed cards")
+        print(f"Runnning gobble(only_changed=True)")
+        results = gobble(profile=profile, profile_folder=profile_folder, only_changed=True, order=order)
+        changed_card_nos = [result['Card #'] for result in results]
+        if len(changed_card_nos) == 0:
+            print("No cards have changed, so nothing to export")
+            return
     # Otherwise, ask for card numbers to regenerate
     elif generate_all == 'N':
         # Ask user which card numbers, checkin their answer is valid
@@ -36,7 +58,7 @@ def main():
         # Generate specific cards, if their input is valid
         if card_nos is not None:
             print(f"Runnning gobble({card_nos})")
-            gobble(card_nos)
+            gobble(card_nos, profile=profile, profile_folder=profile_folder, order=order)
         else:
             print("Could not understand your answer, please rerun program")
             return
@@ -47,14 +69,25 @@ def main():
     # Regenerate printable export
     print("Exports all cards to printable pdf")
     start_pdf = time.time()
-    print("Running gobble_to_pdf()")
-    gobble_to_pdf()
+    with profiled(profile_folder, 'gobble_to_pdf', {}) if profile is not None else nullcontext():
+        if generate_all == 'C':
+            print(f"Running gobble_to_pdf(card_nos={changed_card_nos})")
+            summary = gobble_to_pdf(card_nos=changed_card_nos) # Only the sheets holding changed cards
+        else:
+            print("Running gobble_to_pdf()")
+            summary = gobble_to_pdf()
     end_pdf = time.time()
     print(f"Exports all cards to printable pdf, took {end_pdf - start_pdf} seconds to run")
+    print(f"Wrote {summary['Paths']}: {len(summary['Sheets'])} sheets, {summary['Bytes']/1e6:.1f} MB, {summary['Images prepared']} images prepared")
 
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Generate gobble cards and export them to a printable pdf.")
+    parser.add_argument('--profile', choices=PROFILE_MODES, help="Write CPU profiles and memory allocation snapshots to cache/profiles, per 'card' or for the whole 'run'")
+    parser.add_argument('--order', type=int, help="Generate the template as the projective plane of this (prime power) order, rather than reading template/gobble.xlsx")
+    args = parser.parse_args()
+
     start = time.time()
-    main()
+    main(args.profile, args.order)
     end = time.time()
     print(f"Program took {end - start} seconds to run")
\ No newline at end of file
@@ -0,0 +1,64 @@
+import cProfile
+import json
+import os
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+from assets import abs_path
+
+
+PROFILE_MODES = ('card', 'run') # Profile each card separately, or the whole run at once
+PROFILES_FOLDER_NAME = os.path.join('cache', 'profiles') # Each profiled run gets its own timestamped folder in here
+TRACEMALLOC_FRAMES = 10 # Frames of traceback kept for each allocation
+
+
+def make_profile_folder() -> str:
+    """
+    Returns the path to a new, timestamped folder to write the profiles of a run to
+    """
+    folder = os.path.join(abs_path(PROFILES_FOLDER_NAME), time.strftime('%Y%m%d-%H%M%S'))
+    if not os.path.exists(folder):
+        os.makedirs(folder)
+    return folder
+
+@contextmanager
+def profiled(folder: str, name: str, tags: dict):
+    """
+    Profiles the CPU time and memory allocations of the with block. Writes three files to the folder:
+
+    - <name>.prof: cProfile stats, for pstats, snakeviz etc.
+    - <name>.tracemalloc: tracemalloc snapshot taken at the end of the block, load with tracemalloc.Snapshot.load
+    - <name>.json: The tags, seconds taken, and traced and peak traced memory in bytes
+
+    Parameters:
+        folder (str): Folder to write the files to
+        name (str): Start of each file name, e.g. card_18
+        tags (dict): JSON serialisable details of what was profiled, e.g. card number and symbols
+    """
+    if not os.path.exists(folder):
+        os.makedirs(folder)
+
+    is_already_tracing = tracemalloc.is_tracing()
+    if not is_already_tracing:
+        tracemalloc.start(TRACEMALLOC_FRAMES)
+    tracemalloc.reset_peak()
+
+    profiler = cProfile.Profile()
+    start = time.perf_counter()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        seconds = time.perf_counter() - start
+        snapshot = tracemalloc.take_snapshot()
+        traced, peak = tracemalloc.get_traced_memory()
+        if not is_already_tracing:
+            tracemalloc.stop()
+
+        path = os.path.join(folder, name)
+        profiler.dump_stats(f"{path}.prof")
+        snapshot.dump(f"{path}.tracemalloc")
+        with open(f"{path}.json", 'w') as f:
+            json.dump({**tags, 'Seconds': seconds, 'Traced bytes': traced, 'Peak traced bytes': peak}, f, indent=2)
@@ -0,0 +1,123 @@
+import itertools
+
+import numpy as np
+
+
+def prime_power(n: int) -> tuple:
+    """
+    Splits a prime power into its prime and exponent.
+
+    Parameters:
+        n (int): Order of the plane, e.g. 7 (= 7^1) or 9 (= 3^2)
+
+    Returns:
+        (p, k) (tuple(int, int)): Prime and exponent, so n = p^k.
+            Raise Exception if n is not a prime power (no projective plane can be built for it this way)
+    """
+    if n >= 2:
+        p = next(d for d in range(2, n + 1) if n % d == 0) # Smallest factor, so prime
+        k = 0
+        m = n
+        while m % p == 0:
+            m //= p
+            k += 1
+        if m == 1:
+            return p, k
+
+    raise Exception(f"{n} is not a prime power, so there is no projective plane of that order to build (try 2, 3, 4, 5, 7, 8, 9, 11...).")
+
+def galois_field(p: int, k: int) -> tuple:
+    """
+    Returns the addition and multiplication tables of the finite field GF(p^k).
+
+    Elements are numbered 0 to p^k - 1, element e being the polynomial whose coefficient of x^i is digit i of e in base p.
+    Multiplication is modulo a primitive polynomial of degree k, found by trying each monic polynomial in turn.
+
+    Parameters:
+        p (int): Prime
+        k (int): Exponent
+
+    Returns:
+        (add, mul) (tuple(ndarray, ndarray)): Shape (p^k, p^k) tables, add[a, b] = a + b and mul[a, b] = a * b
+    """
+    q = p**k
+    if k == 1:
+        elements = np.arange(q)
+        return (elements[:, None] + elements[None, :]) % p, (elements[:, None] * elements[None, :]) % p
+
+    # Addition is digit by digit (coefficient by coefficient), modulo p
+    place_values = p**np.arange(k)
+    digits = (np.arange(q)[:, None] // place_values) % p # Shape (q, k)
+    add = ((digits[:, None, :] + digits[None, :, :]) % p) @ place_values
+
+    # Multiplication, through the powers of x modulo a primitive polynomial x^k + c_(k-1) x^(k-1) + ... + c_0
+    for low_coeffs in itertools.product(range(p), repeat=k):
+        if low_coeffs[0] == 0:
+            continue # Divisible by x, so not irreducible
+        exp = powers_of_x(p, k, low_coeffs)
+        if exp is not None:
+            break
+    log = np.zeros(q, dtype=int)
+    log[exp] = np.arange(q - 1)
+
+    elements = np.arange(1, q)
+    mul = np.zeros((q, q), dtype=int) # Anything times 0 is 0
+    mul[1:, 1:] = exp[(log[elements][:, None] + log[elements][None, :]) % (q - 1)]
+    return add, mul
+
+def powers_of_x(p: int, k: int, low_coeffs: tuple):
+    """
+    Returns x^0, x^1 ... x^(p^k - 2) modulo x^k + low_coeffs (see galois_field), if x generates every non-zero element.
+
+    Parameters:
+        p (int): Prime
+        k (int): Exponent
+        low_coeffs (tuple(int)): c_0 ... c_(k-1) of the polynomial
+
+    Returns:
+        exp (ndarray): exp[i] = x^i as an element number. None if the polynomial is not primitive
+    """
+    q = p**k
+    coeffs = [1] + [0]*(k - 1) # x^0
+    exp = []
+    for _ in range(q - 1):
+        exp.append(sum(c * p**i for i, c in enumerate(coeffs)))
+        top = coeffs[-1]
+        coeffs = [0] + coeffs[:-1] # Multiply by x, then replace x^k with -(c_(k-1) x^(k-1) + ... + c_0)
+        coeffs = [(c - top*low) % p for c, low in zip(coeffs, low_coeffs)]
+        if coeffs == [1] + [0]*(k - 1) and len(exp) < q - 1:
+            return None # Back to 1 early, so x does not generate every element
+    return np.array(exp)
+
+def projective_plane(n: int) -> np.ndarray:
+    """
+    Builds the projective plane of order n over GF(n). Its lines are the cards and its points the symbols:
+    n^2 + n + 1 cards of n + 1 symbols each, with every pair of cards sharing exactly one symbol.
+
+    Points are numbered: (x, y) = x*n + y for the n^2 points of the affine plane, then n^2 + m for the point at infinity
+    of slope m, and n^2 + n for the point at infinity of the vertical lines.
+
+    Lines are, in order: y = m*x + b (for every m, b), then x = c (for every c), then the line at infinity.
+
+    Parameters:
+        n (int): Order of the plane, must be a prime power
+
+    Returns:
+        cards (ndarray): Shape (n^2 + n + 1, n + 1), the symbol numbers on each card, in increasing order
+    """
+    p, k = prime_power(n)
+    add, mul = galois_field(p, k)
+    field = np.arange(n)
+
+    # y = m*x + b, through (x, m*x + b) for every x and the point at infinity of slope m
+    m, b, x = np.meshgrid(field, field, field, indexing='ij') # Each of shape (n, n, n)
+    y = add[mul[m, x], b]
+    sloped = np.concatenate([(x*n + y).reshape(n*n, n), np.repeat(n*n + field, n)[:, None]], axis=1)
+
+    # x = c, through (c, y) for every y and the point at infinity of the vertical lines
+    vertical = np.concatenate([field[:, None]*n + field[None, :], np.full((n, 1), n*n + n)], axis=1)
+
+    # The line at infinity, through every point at infinity
+    infinity = (n*n + np.arange(n + 1))[None, :]
+
+    return np.sort(np.concatenate([sloped, vertical, infinity]), axis=1)
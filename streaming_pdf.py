@@ -0,0 +1,241 @@
+import os
+import shutil
+import zlib
+
+from PIL import Image
+
+
+PT_PER_MM = 72 / 25.4 # PDF units (points) per mm
+CELL_MARGIN = 1 # Gap left of text, mm (same as FPDF's default)
+BASE_FONTS = { # (family, style) -> built in PDF font, so no font has to be embedded
+    ('arial', ''): 'Helvetica',
+    ('arial', 'B'): 'Helvetica-Bold',
+    ('helvetica', ''): 'Helvetica',
+    ('helvetica', 'B'): 'Helvetica-Bold',
+}
+COLOUR_SPACES = {'L': 'DeviceGray', 'RGB': 'DeviceRGB', 'CMYK': 'DeviceCMYK'} # Image mode -> PDF colour space
+COPY_CHUNK_BYTES = 1 << 20 # Image files are copied into the pdf this many bytes at a time
+
+
+class StreamingPDF():
+    """
+    A minimal pdf writer that writes every page to disk as soon as the next one is started, so no image data (and only
+    one page's drawing operators) is held in memory, however many pages there are. What is kept grows with the number of
+    pages and images, but is only a few numbers for each (the position of each object, and the object number of each
+    page and image), as the cross-reference table and page tree written by close need them.
+
+    Has the same methods as the parts of FPDF that gobble_to_pdf.add_page_and_populate uses (add_page, image, set_xy,
+    set_font, set_text_color and write), with positions in mm from the top left of the page.
+    Images must be jpegs, which are copied into the pdf as they are (see gobble_to_pdf.prepare_images).
+    Each image file is written once, however many times it is placed.
+
+    Attributes:
+        path (str): Path of the pdf being written
+        page_size (tuple(2)): (width, height) of every page, mm
+        no_pages (int): Number of pages added so far
+
+    Methods:
+        add_page -> None: Finishes the current page (if any), and starts a new one
+        image -> None: Places an image on the current page
+        set_xy -> None: Sets the position of the next text
+        set_font -> None: Sets the font of the next text
+        set_text_color -> None: Sets the colour of the next text
+        write -> None: Writes text at the current position
+        close -> None: Finishes the pdf
+    """
+
+    def __init__(self, path: str, page_size: tuple) -> None:
+        """
+        Constructor for StreamingPDF class. Creates the file and writes the pdf header.
+
+        Parameters:
+            path (str): Path to write the pdf to
+            page_size (tuple(2)): (width, height) of every page, mm
+        """
+        self.path = path
+        self.page_size = page_size
+        self.no_pages = 0
+
+        self._file = open(f"{path}.tmp", 'wb') # Renamed once finished, so a crash never leaves a half written pdf
+        self._offsets = [None, None, None] # Byte offset of each object, by object number. 1 = catalog, 2 = page tree (written last)
+        self._page_objs = [] # Object number of every page, for the page tree
+        self._image_objs = {} # Key = image file path, Value = (resource name, object number)
+        self._font_objs = {} # Key = font name, Value = (resource name, object number)
+        self._page_ops = None # Drawing operators of the current page
+        self._page_images = {} # Resources used by the current page, resource name -> object number
+        self._page_fonts = {}
+        self._x = 0
+        self._y = 0
+        self._font = None # (resource name, object number, size in points)
+
+        self._file.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+
+    def add_page(self) -> None:
+        """
+        Finishes the current page (if any), and starts a new one
+        """
+        if self._page_ops is not None:
+            self._end_page()
+        self._page_ops = []
+        self._page_images = {}
+        self._page_fonts = {}
+        self.no_pages += 1
+
+    def image(self, name: str, x=None, y=None, w=0, h=0) -> None:
+        """
+        Places an image on the current page. The image is written to the pdf the first time it is placed.
+
+        Parameters:
+            name (str): Path to a jpeg
+            x (float): Distance from the left of the page to the left of the image, mm. If None, the current position
+            y (float): Distance from the top of the page to the top of the image, mm. If None, the current position
+            w (float): Width of the image, mm
+            h (float): Height of the image, mm
+        """
+        x = self._x if x is None else x
+        y = self._y if y is None else y
+        if name not in self._image_objs:
+            self._image_objs[name] = (f"I{len(self._image_objs) + 1}", self._write_image(name))
+        resource, obj = self._image_objs[name]
+        self._page_images[resource] = obj
+
+        page_h = self.page_size[1]
+        self._page_ops.append(f"q {w*PT_PER_MM:.2f} 0 0 {h*PT_PER_MM:.2f} {x*PT_PER_MM:.2f} {(page_h - y - h)*PT_PER_MM:.2f} cm /{resource} Do Q")
+
+    def set_xy(self, x: float, y: float) -> None:
+        """
+        Sets the position of the next text, mm from the top left of the page
+        """
+        self._x = x
+        self._y = y
+
+    def set_font(self, family: str, style: str = '', size: float = 12) -> None:
+        """
+        Sets the font of the next text.
+
+        Parameters:
+            family (str): 'Arial' or 'Helvetica' (both are drawn with the built in Helvetica)
+            style (str): '' = regular, 'B' = bold
+            size (float): Font size, points
+        """
+        base_font = BASE_FONTS.get((family.lower(), style.upper()))
+        if base_font is None:
+            raise Exception(f"Font {family} {style} is not supported. Use one of {list(BASE_FONTS)}.")
+        if base_font not in self._font_objs:
+            obj = self._write_obj(f"<< /Type /Font /Subtype /Type1 /BaseFont /{base_font} /Encoding /WinAnsiEncoding >>".encode('latin1'))
+            self._font_objs[base_font] = (f"F{len(self._font_objs) + 1}", obj)
+        resource, obj = self._font_objs[base_font]
+        self._font = (resource, obj, size)
+
+    def set_text_color(self, r: int, g: int, b: int) -> None:
+        """
+        Sets the colour of the next text, 0-255 for each of red, green and blue
+        """
+        self._page_ops.append(f"{r/255:.3f} {g/255:.3f} {b/255:.3f} rg")
+
+    def write(self, h: float, txt: str) -> None:
+        """
+        Writes a single line of text at the current position, vertically centred in a line h mm high (as FPDF does).
+        Moves the current position to the end of the text
+
+        Parameters:
+            h (float): Line height, mm
+            txt (str): Text to write
+        """
+        if self._font is None:
+            raise Exception("No font set, call set_font before write.")
+        resource, obj, size = self._font
+        self._page_fonts[resource] = obj
+
+        font_size = size / PT_PER_MM # mm
+        x = self._x + CELL_MARGIN
+        baseline = self._y + 0.5*h + 0.3*font_size
+        escaped = txt.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+        self._page_ops.append(f"BT /{resource} {size:.2f} Tf {x*PT_PER_MM:.2f} {(self.page_size[1] - baseline)*PT_PER_MM:.2f} Td ({escaped}) Tj ET")
+        self._x += 2*CELL_MARGIN + 0.5*font_size*len(txt) # Approximate, only used if more text follows on the same line
+
+    def close(self) -> None:
+        """
+        Finishes the current page, writes the page tree, catalog and cross-reference table, and moves the pdf into place
+        """
+        if self._page_ops is not None:
+            self._end_page()
+            self._page_ops = None
+
+        kids = ' '.join(f"{obj} 0 R" for obj in self._page_objs)
+        self._write_obj(f"<< /Type /Pages /Kids [{kids}] /Count {len(self._page_objs)} >>".encode('latin1'), obj=2)
+        self._write_obj(b"<< /Type /Catalog /Pages 2 0 R >>", obj=1)
+
+        xref_offset = self._file.tell()
+        lines = [f"xref\n0 {len(self._offsets)}\n", "0000000000 65535 f \n"]
+        lines += [f"{offset:010d} 00000 n \n" for offset in self._offsets[1:]]
+        lines.append(f"trailer\n<< /Size {len(self._offsets)} /Root 1 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n")
+        self._file.write(''.join(lines).encode('latin1'))
+        self._file.close()
+        os.replace(f"{self.path}.tmp", self.path)
+
+    def _end_page(self) -> None:
+        """
+        Writes the current page's content stream and page object
+        """
+        content = zlib.compress('\n'.join(self._page_ops).encode('latin1'))
+        content_obj = self._write_obj(f"<< /Filter /FlateDecode /Length {len(content)} >>\nstream\n".encode('latin1') + content + b"\nendstream")
+
+        images = ' '.join(f"/{resource} {obj} 0 R" for resource, obj in self._page_images.items())
+        fonts = ' '.join(f"/{resource} {obj} 0 R" for resource, obj in self._page_fonts.items())
+        w, h = self.page_size
+        page = (f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {w*PT_PER_MM:.2f} {h*PT_PER_MM:.2f}] "
+                f"/Resources << /ProcSet [/PDF /Text /ImageC] /XObject << {images} >> /Font << {fonts} >> >> /Contents {content_obj} 0 R >>")
+        self._page_objs.append(self._write_obj(page.encode('latin1')))
+
+    def _write_image(self, path: str) -> int:
+        """
+        Copies a jpeg into the pdf as an image object, a chunk at a time
+
+        Returns:
+            obj (int): Object number of the image
+        """
+        with Image.open(path) as image: # Only the header is read
+            if image.format != 'JPEG':
+                raise Exception(f"{path} is not a jpeg, only jpegs can be streamed into the pdf.")
+            if image.mode not in COLOUR_SPACES:
+                raise Exception(f"{path} has colour mode {image.mode}, use one of {list(COLOUR_SPACES)}.")
+            (w, h), colour_space = image.size, COLOUR_SPACES[image.mode]
+        decode = ' /Decode [1 0 1 0 1 0 1 0]' if colour_space == 'DeviceCMYK' else '' # Adobe jpegs store CMYK inverted
+
+        obj = self._start_obj()
+        self._file.write((f"<< /Type /XObject /Subtype /Image /Width {w} /Height {h} /ColorSpace /{colour_space}{decode} "
+                          f"/BitsPerComponent 8 /Filter /DCTDecode /Length {os.path.getsize(path)} >>\nstream\n").encode('latin1'))
+        with open(path, 'rb') as f:
+            shutil.copyfileobj(f, self._file, COPY_CHUNK_BYTES)
+        self._file.write(b"\nendstream\nendobj\n")
+        return obj
+
+    def _start_obj(self, obj=None) -> int:
+        """
+        Records the position of a new object (or a reserved one, if obj is given) and writes its header
+
+        Returns:
+            obj (int): Object number
+        """
+        if obj is None:
+            obj = len(self._offsets)
+            self._offsets.append(None)
+        self._offsets[obj] = self._file.tell()
+        self._file.write(f"{obj} 0 obj\n".encode('latin1'))
+        return obj
+
+    def _write_obj(self, body: bytes, obj=None) -> int:
+        """
+        Writes a whole object
+
+        Parameters:
+            body (bytes): Object contents
+            obj (int): Reserved object number to write. If None, a new object number is used
+
+        Returns:
+            obj (int): Object number
+        """
+        obj = self._start_obj(obj)
+        self._file.write(body + b"\nendobj\n")
+        return obj
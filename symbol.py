@@ -1,7 +1,17 @@
+import math
+from contextlib import nullcontext
 from typing import Dict
 import pygame
 from pygame.sprite import Sprite
 
+from assets import RADIAL_BIN_ANGLES, RADIAL_BINS
+from transform_cache import PYRAMID_FACTOR, TransformCache, quantise_angle, quantise_scale, transformed_size
+
+
+TRANSFORM_CACHE = TransformCache() # Shared by all symbols. Use TRANSFORM_CACHE.stats() for hit/miss/eviction counters
+BOUNDARY_MARGIN = 3 # Pixels of slack in the geometric boundary test, for rounding in scaling, rotating and positioning
+MASK_PYRAMID = True # Only transform symbols at full resolution when their coarse masks can't rule out an overlap. False = transform every symbol up front
+
 
 class Symbol(Sprite):
     """
@@ -20,31 +30,149 @@ class Symbol(Sprite):
 
         Parameters:
             asset (Dict): A single asset (image) from the Assets instance
-            TODO
+            pos_x (float): X coordinate of the centre of the symbol
+            pos_y (float): Y coordinate of the centre of the symbol
+            angle (float): Angle to rotate by in degrees. Rounded to transform_cache.ANGLE_STEP
+            scale (float): Scale factor of the asset. Rounded to transform_cache.SCALE_STEP
         """
         super().__init__()
         
         self.asset = asset # Related asset dict for this symbol, acquired from an Assets instance
         self.name = asset['Name'] # Name of the symbol
-        self.angle = angle # Angle to rotate image by relative to how image was loaded, in degrees
-        self.scale = scale # Scale the image, on top of the "original" width/height specified
-
-        self.image = self.asset['Surface']
-
-        # Apply scale factor
-        self.image = pygame.transform.scale(self.image, 
-            (self.scale*self.image.get_width(), self.scale*self.image.get_height())
-        )
+        self.angle = quantise_angle(angle) # Angle to rotate image by relative to how image was loaded, in degrees
+        self.scale = quantise_scale(scale) # Scale the image, on top of the "original" width/height specified
 
-        self.image = pygame.transform.rotate(self.image, self.angle) # Rotate image
+        # Scaled and rotated image and its mask come from the cache, and are only looked up once needed (see MASK_PYRAMID).
+        # Most candidate layouts are rejected on geometry or coarse masks alone, without them
+        self._transformed = None
+        self._coarse_mask = None
+        self.timer = None # Times the transforms, as they can happen in any stage of the search. Set by the card the symbol is on (see Card._timer)
+        self.radius = self.scale * math.hypot(*self.asset['Surface'].get_size()) / 2 + 1 # Radius of a circle around the centre that contains the whole symbol at any angle (+1 pixel for rounding)
 
-        self.rect = self.image.get_rect() # Rect attribute of the symbol
+        self.rect = pygame.Rect((0, 0), transformed_size(self.asset['Surface'].get_size(), self.scale, self.angle)) # Rect attribute of the symbol, the same as the transformed image's
         self.rect.centerx = pos_x # X coordinate of position of symbol on screen
         self.rect.centery = pos_y # Y coordinate of position of symbol on screen
 
-        self.mask = pygame.mask.from_surface(self.image) # Create a mask of the Surface object of this symbol
+        if not MASK_PYRAMID:
+            self._get_transformed()
+
+    @property
+    def image(self) -> pygame.Surface:
+        """
+        Scaled and rotated image of the symbol
+        """
+        return self._get_transformed()['Surface']
+
+    @property
+    def mask(self) -> pygame.mask.Mask:
+        """
+        Mask of the Surface object of this symbol
+        """
+        return self._get_transformed()['Mask']
+
+    @property
+    def area(self) -> float:
+        """
+        Number of opaque pixels of this symbol. Worked out from the asset's area if it has one, so without transforming
+        """
+        if 'Area' in self.asset:
+            return self.asset['Area'] * self.scale**2 # Same as TransformCache._transform
+        return self._get_transformed()['Area']
+
+    @property
+    def coarse_mask(self) -> pygame.mask.Mask:
+        """
+        Coarse mask of this symbol, one cell for every PYRAMID_FACTOR x PYRAMID_FACTOR pixels (see TransformCache.get_coarse)
+        """
+        if self._coarse_mask is None:
+            with self._timer('Symbol construction'):
+                self._coarse_mask = TRANSFORM_CACHE.get_coarse(self.asset, self.scale, self.angle)['Mask']
+        return self._coarse_mask
+
+    def might_overlap(self, other) -> bool:
+        """
+        Tests the coarse masks of two symbols. Every cell the full resolution masks touch is set in the coarse masks,
+        so if the coarse masks don't overlap, neither do the full resolution ones.
+
+        Parameters:
+            other (Symbol): Symbol to test against
+
+        Returns:
+            might_overlap (bool): False if the symbols definitely don't overlap. True if they might, so the full
+                resolution masks need checking (always True if MASK_PYRAMID is off, or both are already transformed
+                at full resolution, as checking their masks is then quicker than making coarse ones)
+        """
+        if not MASK_PYRAMID or (self._transformed is not None and other._transformed is not None):
+            return True
+        x, y = self._coarse_topleft()
+        other_x, other_y = other._coarse_topleft()
+        return self.coarse_mask.overlap(other.coarse_mask, (other_x - x, other_y - y)) is not None
+
+    def _coarse_topleft(self) -> tuple:
+        """
+        Returns the position of the top left of the coarse mask, in cells, centred on the symbol
+        """
+        width, height = self.coarse_mask.get_size()
+        return (round(self.rect.centerx/PYRAMID_FACTOR - width/2), round(self.rect.centery/PYRAMID_FACTOR - height/2))
+
+    def _get_transformed(self) -> dict:
+        """
+        Returns the transformed image, mask and area of this symbol, from the cache (only transformed on a miss)
+        """
+        if self._transformed is None:
+            with self._timer('Symbol construction'):
+                self._transformed = TRANSFORM_CACHE.get(self.asset, self.scale, self.angle)
+        return self._transformed
+
+    def _timer(self, stage: str):
+        """
+        Returns a context manager that adds the time spent in its block to a stage of the card's telemetry (does nothing if not on a card)
+        """
+        if self.timer is None:
+            return nullcontext()
+        return self.timer(stage)
     
     
+    def boundary_status(self, centre: tuple, radius: float):
+        """
+        Uses the asset's radial profile to work out if the symbol is inside a circle, without touching any pixels.
+
+        Parameters:
+            centre (tuple(2)): Centre of the circle, (x, y)
+            radius (float): Radius of the circle in pixels
+
+        Returns:
+            is_outside (bool): False if the symbol is definitely inside the circle, True if it definitely pokes outside it.
+                None if it is too close to call (or the asset has no radial profile), so the masks need checking
+        """
+        profile = self.asset.get('Radial profile')
+        if profile is None:
+            return None
+
+        dx = self.rect.centerx - centre[0]
+        dy = self.rect.centery - centre[1]
+        d = math.hypot(dx, dy) # Distance from centre of circle to centre of symbol
+
+        # Obviously inside, if even the farthest pixel in any direction can't reach the edge
+        if d + self.scale*self.asset['Radial extent'] + BOUNDARY_MARGIN <= radius:
+            return False
+
+        # Obviously outside, if the farthest pixel in the direction pointing away from the centre of the circle
+        # is past the edge, wherever it is within that direction.
+        # pygame rotates anticlockwise on screen, which takes away from screen angles (y points down)
+        psi = math.atan2(dy, dx) # Direction pointing away from the centre, on screen
+        bin_width = 2*math.pi / RADIAL_BINS
+        idx = int((psi + math.radians(self.angle) + math.pi) // bin_width) % RADIAL_BINS # Same direction, in the asset
+        rho = self.scale*profile[idx] - BOUNDARY_MARGIN
+        if rho > 0:
+            phi = RADIAL_BIN_ANGLES[idx] - math.radians(self.angle)
+            delta = abs((phi - psi + math.pi) % (2*math.pi) - math.pi) + bin_width/2 # Largest angle between pixel and psi
+            dist_sq = d*d + rho*rho + 2*d*rho*math.cos(min(delta, math.pi)) # Smallest (squared) distance of the pixel from the centre
+            if dist_sq > (radius + BOUNDARY_MARGIN)**2:
+                return True
+
+        return None
+
     def get_pos(self) -> tuple:
         """
         Return tuple of the x and y position of the symbol.
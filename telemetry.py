@@ -0,0 +1,112 @@
+import json
+import os
+import time
+from contextlib import contextmanager
+
+
+STAGES = ('Symbol construction', 'Collision', 'Outside', 'Cover') # Stages of the search that are always timed. Symbol construction includes transforming symbols (and making their coarse masks), whichever stage needs them first
+REJECTION_ORDER = ('Outside', 'Collision', 'Cover') # A rejected layout is counted under the first of these that applies to it only, the order they are checked in
+
+
+class CardTelemetry():
+    """
+    Metrics of the search for a single card's layout, to help tune thresholds and find cards that are slow
+    because of specific symbols.
+
+    Attributes:
+        attempts (int): Number of attempts (see engine.iter_card_attempts)
+        rejections (dict): Key = reason (e.g. 'Collision', 'Outside' or 'Cover'), Value = number of rejections for that reason.
+            Every strategy counts a rejected layout under one reason, the first in REJECTION_ORDER that applies (see reject_first):
+            symbols outside the card are 'Outside' whether or not they also collide, as most strategies stop checking there
+        seconds (dict): Key = stage (see STAGES), Value = seconds spent in that stage. Time in a timer nested in another is only
+            counted under the inner stage, so the stages add up to the time timed (see timer)
+        cover (float): Cover ratio of the accepted card, None until a card is accepted
+
+    Methods:
+        timer -> context manager: Adds the time spent in a block to a stage
+        reject -> None: Counts a rejection
+        reject_first -> None: Counts a rejected layout under the first of its reasons, in REJECTION_ORDER
+        to_dict -> dict: Returns the metrics as a JSON serialisable dict
+    """
+
+    def __init__(self) -> None:
+        """
+        Constructor for CardTelemetry class.
+        """
+        self.attempts = 0
+        self.rejections = {}
+        self.seconds = dict.fromkeys(STAGES, 0.0)
+        self.cover = None
+        self._nested_seconds = [] # One per timer running, innermost last
+
+    @contextmanager
+    def timer(self, stage: str):
+        """
+        Adds the time spent in the with block to a stage. Timers can be nested: the time spent in an inner one is only added
+        to its own stage, not the outer one's too (e.g. a symbol transformed during a collision check is Symbol construction)
+
+        Parameters:
+            stage (str): Name of the stage
+        """
+        start = time.perf_counter()
+        self._nested_seconds.append(0.0) # Time spent in timers nested in this one
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.seconds[stage] = self.seconds.get(stage, 0.0) + elapsed - self._nested_seconds.pop()
+            if len(self._nested_seconds) > 0:
+                self._nested_seconds[-1] += elapsed
+
+    def reject(self, reason: str, count: int = 1) -> None:
+        """
+        Counts a rejection.
+
+        Parameters:
+            reason (str): Why the attempt was rejected
+            count (int): Number of rejections to count
+        """
+        self.rejections[reason] = self.rejections.get(reason, 0) + count
+
+    def reject_first(self, reasons: list) -> None:
+        """
+        Counts a rejected layout under the first of its reasons in REJECTION_ORDER, so strategies that check every reason
+        count the same as ones that stop at the first.
+
+        Parameters:
+            reasons (list(str)): Every reason in REJECTION_ORDER that applies to the layout. Nothing is counted if empty
+        """
+        for reason in REJECTION_ORDER:
+            if reason in reasons:
+                self.reject(reason)
+                return
+
+    def to_dict(self) -> dict:
+        """
+        Returns the metrics as a JSON serialisable dict.
+
+        Returns:
+            metrics (dict): 'Attempts', 'Rejections', 'Seconds' (by stage, not counting nested stages twice) and 'Cover'
+        """
+        return {
+            'Attempts': self.attempts,
+            'Rejections': dict(self.rejections),
+            'Seconds': dict(self.seconds),
+            'Cover': self.cover,
+        }
+
+
+def append_jsonl(path: str, record: dict) -> None:
+    """
+    Appends a record to a JSON Lines file (one JSON object per line), creating the file and its folder if needed.
+
+    Parameters:
+        path (str): Path to the file
+        record (dict): JSON serialisable record
+    """
+    directory = os.path.dirname(path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+
+    with open(path, 'a') as f:
+        f.write(json.dumps(record, separators=(',', ':')) + '\n')
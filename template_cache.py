@@ -0,0 +1,62 @@
+import os
+import pickle
+
+from assets import file_hash
+
+
+CACHE_VERSION = 1 # Bump when the cached format (or the way the template is parsed) changes, so old caches are ignored
+
+
+def load_template_cache(cache_path: str, source_path: str):
+    """
+    Loads a parsed template from the cache, if it was parsed from the source file as it is now.
+    The source is unchanged if its size and modification time match, or failing that its content hash does.
+
+    Parameters:
+        cache_path (str): Path to the cache file
+        source_path (str): Path to the template the cache was parsed from (e.g. the xlsx)
+
+    Returns:
+        (template, replacement_dict) (tuple(dict, dict)): See gobble.read_template. None if not cached, or the source has changed
+    """
+    if not os.path.exists(cache_path):
+        return None
+
+    with open(cache_path, 'rb') as f:
+        cached = pickle.load(f)
+    if cached.get('Version') != CACHE_VERSION:
+        return None
+
+    stat = os.stat(source_path)
+    if (cached['Size'], cached['Modified']) != (stat.st_size, stat.st_mtime_ns) and cached['Hash'] != file_hash(source_path):
+        return None
+
+    return cached['Template'], cached['Replacements']
+
+def save_template_cache(cache_path: str, source_path: str, template: dict, replacement_dict: dict) -> None:
+    """
+    Stores a parsed template in the cache, with the size, modification time and content hash of the file it was parsed from.
+    Written via a temporary file, so a crash never leaves a half written cache.
+
+    Parameters:
+        cache_path (str): Path to the cache file
+        source_path (str): Path to the template it was parsed from
+        template (dict): Key = card number, Value = list of template symbol names
+        replacement_dict (dict): Key = template symbol name, Value = our symbol name
+    """
+    directory = os.path.dirname(cache_path)
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+
+    stat = os.stat(source_path)
+    cached = {
+        'Version': CACHE_VERSION,
+        'Size': stat.st_size,
+        'Modified': stat.st_mtime_ns,
+        'Hash': file_hash(source_path),
+        'Template': template,
+        'Replacements': replacement_dict,
+    }
+    with open(f"{cache_path}.tmp", 'wb') as f:
+        pickle.dump(cached, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(f"{cache_path}.tmp", cache_path)
@@ -0,0 +1,91 @@
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import card_writer
+import gobble
+
+
+SEED = 5
+CARD_NO = 1 # Has LIPS (replaced with AMAR) in the xlsx template
+REPLACEMENTS = {'LIPS': 'ADAM'} # A change to card CARD_NO's template replacements
+
+
+@pytest.fixture
+def run_folder(tmp_path, monkeypatch):
+    """
+    Exports cards, and keeps their layouts and build manifest, in a temporary folder rather than the repo's
+    """
+    monkeypatch.setattr(gobble, 'OUTPUT_FOLDER', str(tmp_path / 'export'))
+    monkeypatch.setattr(gobble, 'LAYOUT_STORE', str(tmp_path / 'layouts.json'))
+    monkeypatch.setattr(gobble, 'BUILD_MANIFEST', str(tmp_path / 'build_manifest.json'))
+    return tmp_path
+
+def stored_names(run_folder, card_no: int) -> list:
+    """
+    Returns the names of the symbols in a card's stored layout, sorted
+    """
+    with open(run_folder / 'layouts.json', 'r') as f:
+        return sorted(s['Name'] for s in json.load(f)[str(card_no)]['Symbols'])
+
+def run(**kwargs) -> list:
+    """
+    Builds card CARD_NO, returning gobble's results
+    """
+    return gobble.gobble([CARD_NO], seed=SEED, telemetry_path=None, **kwargs)
+
+
+@pytest.mark.parametrize('mode', [{'render_only': True}, {'only_changed': True}, {'render_only': True, 'only_changed': True}])
+def test_template_change_regenerates(run_folder, mode):
+    (built,) = run()
+    assert 'AMAR' in built['Symbols']
+
+    (rebuilt,) = run(replacements=REPLACEMENTS, **mode)
+    assert rebuilt['Attempts'] > 0 # Searched for, not re-rendered from the old layout
+    assert 'ADAM' in rebuilt['Symbols'] and 'AMAR' not in rebuilt['Symbols']
+    assert stored_names(run_folder, CARD_NO) == sorted(rebuilt['Symbols'])
+
+    assert run(replacements=REPLACEMENTS, only_changed=True) == [] # Now up to date
+    (reverted,) = run(only_changed=True) # Changing it back is a change too
+    assert 'AMAR' in reverted['Symbols']
+
+def test_render_only_reuses_matching_layout(run_folder):
+    run()
+    (rendered,) = run(render_only=True)
+    assert rendered['Attempts'] == 0
+
+def test_smaller_deck_removes_stale_exports(run_folder):
+    run() # Card 1 of the 57 card xlsx deck
+    stale_path = run_folder / 'export' / 'card_20.png'
+    stale_path.write_bytes(b'') # A card beyond the end of the 13 card deck of order 3
+
+    run(order=3)
+    assert sorted(os.listdir(run_folder / 'export')) == ['card_1.png']
+
+def test_manifest_only_records_written_cards(run_folder, monkeypatch):
+    run()
+    replacements_at_write = [] # What LIPS is replaced with on card CARD_NO in the manifest on disk, as each png is written
+    is_disk_full = False
+    save = card_writer.pygame.image.save
+
+    def save_and_check(surface, f, namehint):
+        with open(gobble.BUILD_MANIFEST, 'r') as manifest:
+            entry = json.load(manifest)['Cards'].get(str(CARD_NO))
+        replacements_at_write.append(None if entry is None else dict(entry['Replacements'])['LIPS'])
+        if is_disk_full:
+            raise OSError("Disk full")
+        save(surface, f, namehint)
+
+    monkeypatch.setattr(card_writer.pygame.image, 'save', save_and_check)
+    run(replacements=REPLACEMENTS)
+    assert replacements_at_write == ['AMAR'] # The new entry (LIPS replaced with ADAM) is only recorded once its png is written
+
+    is_disk_full = True # The png of the last build is left in place
+    with pytest.raises(Exception, match="could not be exported"):
+        run()
+    is_disk_full = False
+    (rebuilt,) = run(only_changed=True) # Not up to date, as its png was never written
+    assert 'AMAR' in rebuilt['Symbols']
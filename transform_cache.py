@@ -0,0 +1,235 @@
+import math
+from collections import OrderedDict
+
+import numpy as np
+import pygame
+
+from assets import opaque_pixels
+
+
+SCALE_STEP = 0.01 # Scales are rounded to a multiple of this before transforming
+ANGLE_STEP = 1 # Angles are rounded to a multiple of this (in degrees) before transforming. 1 keeps every whole degree the layouts pick; coarser steps share more cache entries, but symbols can only face 360 / ANGLE_STEP ways
+MAX_BYTES = 256 * 1024**2 # Default memory budget of a cache, in bytes
+PYRAMID_FACTOR = 4 # Coarse masks have one cell for every PYRAMID_FACTOR x PYRAMID_FACTOR pixels of the full resolution mask
+PYRAMID_MARGIN = 1 # Cells a coarse mask is grown by, so it still covers the full resolution mask after resampling and rounding
+
+
+def quantise_scale(scale: float) -> float:
+    """
+    Returns the scale rounded to the nearest SCALE_STEP. Never rounds down to 0.
+
+    Parameters:
+        scale (float): Scale factor of a symbol
+    """
+    return max(1, round(scale / SCALE_STEP)) * SCALE_STEP
+
+def quantise_angle(angle: float) -> int:
+    """
+    Returns the angle rounded to the nearest ANGLE_STEP, in the range [0, 360)
+
+    Parameters:
+        angle (float): Angle of a symbol in degrees
+    """
+    return int(round(angle / ANGLE_STEP) * ANGLE_STEP) % 360
+
+def transformed_size(size: tuple, scale: float, angle: int) -> tuple:
+    """
+    Returns the size of a surface after it is scaled and rotated (see TransformCache._transform), without transforming it.
+    Works it out the same way pygame.transform.rotate does.
+
+    Parameters:
+        size (tuple(2)): (width, height) of the untransformed surface
+        scale (float): Scale factor, see quantise_scale
+        angle (int): Angle in degrees, see quantise_angle
+
+    Returns:
+        size (tuple(2)): (width, height) of the transformed surface
+    """
+    width, height = int(scale*size[0]), int(scale*size[1])
+    if angle % 90 == 0: # Rotated by swapping pixels, so the size is exact
+        return (height, width) if (angle // 90) % 2 == 1 else (width, height)
+
+    radians = angle * .01745329251994329 # Same constant as pygame, so the sizes round the same way
+    sin, cos = math.sin(radians), math.cos(radians)
+    cx, cy, sx, sy = cos*width, cos*height, sin*width, sin*height
+    return (int(max(abs(cx + sy), abs(cx - sy), abs(-cx + sy), abs(-cx - sy))),
+            int(max(abs(sx + cy), abs(sx - cy), abs(-sx + cy), abs(-sx - cy))))
+
+
+class TransformCache():
+    """
+    A least recently used cache of transformed (scaled and rotated) asset surfaces, with their masks and opaque areas.
+    Also caches coarse masks (see get_coarse), which are far cheaper to make, so symbols can be told apart without
+    transforming them at full resolution.
+
+    Attributes:
+        max_bytes (int): Memory budget of the cache. Least recently used entries are evicted once exceeded
+        size_bytes (int): Approximate memory currently used by the cached surfaces and masks
+        hits (int): Number of lookups that were already cached
+        misses (int): Number of lookups that had to be transformed
+        evictions (int): Number of entries evicted to stay within max_bytes
+
+    Methods:
+        get -> dict: Returns the transformed surface, mask and area of an asset at a scale and angle
+        get_coarse -> dict: Returns a coarse mask of an asset at a scale and angle, that covers its full resolution mask
+        stats -> dict: Returns the hit/miss/eviction counters
+        clear -> None: Empties the cache (counters are kept)
+    """
+
+    def __init__(self, max_bytes: int = MAX_BYTES) -> None:
+        """
+        Constructor for TransformCache class.
+
+        Parameters:
+            max_bytes (int): Memory budget of the cache in bytes
+        """
+        self.max_bytes = max_bytes
+        self.size_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict() # Key = (file path, surface size, scale, angle, is coarse), Value = entry dict
+        self._coarse_bases = {} # Key = (file path, surface size), Value = surface of the asset's opaque cells, see _coarse_base
+
+    def get(self, asset: dict, scale: float, angle: float) -> dict:
+        """
+        Returns the asset transformed by the (already quantised) scale and angle.
+
+        Parameters:
+            asset (dict): A single asset (image) from an Assets instance
+            scale (float): Scale factor, see quantise_scale
+            angle (int): Angle in degrees, see quantise_angle
+
+        Returns:
+            entry (dict): 'Surface', 'Mask' and 'Area' (number of opaque pixels in the mask) of the transformed asset
+        """
+        return self._get(asset, scale, angle, is_coarse=False)
+
+    def get_coarse(self, asset: dict, scale: float, angle: float) -> dict:
+        """
+        Returns a coarse mask of the asset transformed by the (already quantised) scale and angle, with one cell for
+        every PYRAMID_FACTOR x PYRAMID_FACTOR pixels. It is grown by PYRAMID_MARGIN cells all round, so every cell that
+        the full resolution mask touches is set (wherever the symbol is placed, see symbol.Symbol.might_overlap).
+        So if two coarse masks don't overlap, neither do the full resolution ones.
+
+        Parameters:
+            asset (dict): A single asset (image) from an Assets instance
+            scale (float): Scale factor, see quantise_scale
+            angle (int): Angle in degrees, see quantise_angle
+
+        Returns:
+            entry (dict): 'Mask' of the coarse cells
+        """
+        return self._get(asset, scale, angle, is_coarse=True)
+
+    def _get(self, asset: dict, scale: float, angle: int, is_coarse: bool) -> dict:
+        """
+        Returns a cached entry, transforming the asset on a miss. See get and get_coarse
+        """
+        surf = asset['Surface']
+        key = (asset['File path'], surf.get_size(), scale, angle, is_coarse) # Size included, so re-normalised assets are not mixed up
+
+        entry = self._entries.get(key)
+        if entry is not None:
+            self.hits += 1
+            self._entries.move_to_end(key) # Mark as most recently used
+            return entry
+
+        self.misses += 1
+        entry = self._transform_coarse(asset, scale, angle) if is_coarse else self._transform(asset, scale, angle)
+        self._entries[key] = entry
+        self.size_bytes += entry['Bytes']
+
+        # Evict least recently used entries until back within budget (always keep the newest one)
+        while self.size_bytes > self.max_bytes and len(self._entries) > 1:
+            _, evicted = self._entries.popitem(last=False)
+            self.size_bytes -= evicted['Bytes']
+            self.evictions += 1
+
+        return entry
+
+    def stats(self) -> dict:
+        """
+        Returns the cache counters.
+
+        Returns:
+            stats (dict): Hits, misses, evictions, number of entries and bytes used
+        """
+        return {
+            'Hits': self.hits,
+            'Misses': self.misses,
+            'Evictions': self.evictions,
+            'Entries': len(self._entries),
+            'Bytes': self.size_bytes,
+        }
+
+    def clear(self) -> None:
+        """
+        Empties the cache. Counters are kept.
+        """
+        self._entries.clear()
+        self._coarse_bases.clear()
+        self.size_bytes = 0
+
+    @staticmethod
+    def _transform(asset: dict, scale: float, angle: int) -> dict:
+        """
+        Scales and rotates an asset's surface, then builds its mask and opaque area.
+        Rotation keeps the area, so a normalised asset's precomputed 'Area' is just scaled rather than recounted.
+        """
+        surf = asset['Surface']
+        image = pygame.transform.scale(surf, (scale*surf.get_width(), scale*surf.get_height())) # Apply scale factor
+        image = pygame.transform.rotate(image, angle) # Rotate image
+        mask = pygame.mask.from_surface(image) # Create a mask of the transformed surface
+
+        if 'Area' in asset:
+            area = asset['Area'] * scale**2 # Opaque area scales with the square of the scale factor
+        else:
+            area = mask.count() # Number of opaque pixels
+
+        width, height = image.get_size()
+        n_bytes = width * height * image.get_bytesize() + width * height // 8 # Surface pixels + mask bits
+
+        return {'Surface': image, 'Mask': mask, 'Area': area, 'Bytes': n_bytes}
+
+    def _transform_coarse(self, asset: dict, scale: float, angle: int) -> dict:
+        """
+        Scales and rotates the asset's coarse cells (see _coarse_base), then grows the mask of every cell touched by
+        PYRAMID_MARGIN cells, to cover what resampling the cells rather than the pixels moves about.
+
+        Smooth scaling keeps any cell that is even partly opaque. The cells are then grown by one before rotating, as
+        rotating samples the nearest cell and could skip a lone one (e.g. the tip of a thin line), but never a 3 x 3 block.
+        """
+        base = self._coarse_base(asset)
+        size = (max(1, round(scale*base.get_width())), max(1, round(scale*base.get_height()))) # So a cell stays PYRAMID_FACTOR pixels across
+        scaled = pygame.mask.from_surface(pygame.transform.smoothscale(base, size), 0) # Any alpha at all
+        grown = scaled.convolve(pygame.mask.Mask((3, 3), fill=True)).to_surface(unsetcolor=(0, 0, 0, 0))
+        rotated = pygame.mask.from_surface(pygame.transform.rotate(grown, angle), 0)
+
+        margin = pygame.mask.Mask((2*PYRAMID_MARGIN + 1, 2*PYRAMID_MARGIN + 1), fill=True)
+        mask = rotated.convolve(margin) # Grown by the margin on every side
+
+        width, height = mask.get_size()
+        return {'Mask': mask, 'Bytes': width * height // 8}
+
+    def _coarse_base(self, asset: dict) -> pygame.Surface:
+        """
+        Returns a surface with one pixel for every PYRAMID_FACTOR x PYRAMID_FACTOR pixels of the asset, opaque if any of
+        them are. Made once per asset
+        """
+        surf = asset['Surface']
+        key = (asset['File path'], surf.get_size())
+        if key not in self._coarse_bases:
+            opaque = opaque_pixels(surf) # Indexed [x, y]
+            width, height = -(-opaque.shape[0] // PYRAMID_FACTOR), -(-opaque.shape[1] // PYRAMID_FACTOR) # Rounded up
+            left = (width*PYRAMID_FACTOR - opaque.shape[0]) // 2 # Padded evenly on both sides, so the cells stay centred on the asset
+            top = (height*PYRAMID_FACTOR - opaque.shape[1]) // 2
+            padded = np.zeros((width*PYRAMID_FACTOR, height*PYRAMID_FACTOR), dtype=bool)
+            padded[left:left + opaque.shape[0], top:top + opaque.shape[1]] = opaque
+            cells = padded.reshape(width, PYRAMID_FACTOR, height, PYRAMID_FACTOR).any(axis=(1, 3))
+
+            base = pygame.Surface((width, height), pygame.SRCALPHA)
+            base.fill((255, 255, 255, 0))
+            pygame.surfarray.pixels_alpha(base)[:] = cells * 255
+            self._coarse_bases[key] = base
+        return self._coarse_bases[key]